@@ -5,6 +5,11 @@ It exposes the ASGI callable as a module-level variable named ``application``.
 
 For more information on this file, see
 https://docs.djangoproject.com/en/5.1/howto/deployment/asgi/
+
+异步视图（/async/chat/、/async/process-file/）在 ASGI 服务器下运行时不占用
+工作线程，例如：
+
+    uvicorn aiweb.asgi:application --workers 2
 """
 
 import os
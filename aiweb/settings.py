@@ -126,6 +126,9 @@ DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
         'NAME': BASE_DIR / 'db.sqlite3',
+        'OPTIONS': {
+            'timeout': 20,  # run_workers 与 Web 进程并发写入时等待锁
+        },
     }
 }
 
@@ -193,12 +196,181 @@ DEEPSEEK_API_BASE = "https://api.deepseek.com/v1"  # Deepseek 官方 API
 # ZHIPU_API_BASE = "https://your-zhipu-proxy.com/v4"
 # DEEPSEEK_API_BASE = "https://your-deepseek-proxy.com/v1"
 
+# AI 服务 HTTP 连接池：服务实例在进程内复用，连接保持 keep-alive
+AI_HTTP_POOL = {
+    'MAX_CONNECTIONS': 32,
+    'MAX_KEEPALIVE_CONNECTIONS': 16,
+    'KEEPALIVE_EXPIRY': 120,  # 空闲连接保留时间（秒）
+    'CONNECT_TIMEOUT': 10,
+}
+
+# AI 服务并发配置：每种服务同时处理的文本块数量
+AI_SERVICE_CONCURRENCY = {
+    'openai': 4,
+    'zhipu': 4,
+    'deepseek': 4,
+}
+
+# AI 服务限流：按服务和 API 密钥统计每分钟请求数（rpm）和 token 数（tpm），
+# 多个进程共享同一个状态文件。请按账号的实际额度调整
+AI_RATE_LIMITS = {
+    'ENABLED': True,
+    'PATH': BASE_DIR / 'cache' / 'rate_limits.sqlite3',
+    'LIMITS': {
+        'openai': {'rpm': 500, 'tpm': 200000},
+        'zhipu': {'rpm': 60, 'tpm': 200000},
+        'deepseek': {'rpm': 60, 'tpm': 200000},
+    },
+    'BLOCK_SECONDS': 10,  # 收到 429 且没有 Retry-After 时的暂停时间
+}
+
+# 多服务路由：存在多个启用的 API 配置时，按权重分配请求，并根据最近请求的 p50/p95 延迟、
+# 错误率和 429 比例实时调整；请求失败时切换到其他服务。统计保存在进程内
+PROVIDER_ROUTING = {
+    'ENABLED': True,
+    'WINDOW_SIZE': 200,  # 每个服务保留的最近请求数
+    'WINDOW_SECONDS': 300,  # 超过该时间的样本不再参与统计
+    'MIN_SAMPLES': 10,  # 样本不足时只按配置权重分配
+    'EJECT_ERROR_RATE': 0.5,  # 错误率（含 429）达到该值时暂时摘除
+    'EJECT_SECONDS': 30,
+    'MIN_WEIGHT_RATIO': 0.05,  # 表现差的服务至少保留配置权重的该比例，便于恢复
+    'MAX_FAILOVER': 2,  # 单次请求失败后最多切换的服务数
+}
+
+# 请求对冲：请求超过首选服务最近成功请求延迟的 PERCENTILE 百分位仍未返回时，向下一个服务
+# （只有一个服务时为同一服务）再发一次相同的请求，采用先返回的有效结果，用于降低长尾延迟。
+# 只作用于路由发出的非流式请求；流式回复、批处理提交和 API 密钥验证不会对冲
+REQUEST_HEDGING = {
+    'ENABLED': False,
+    'TASK_TYPES': ('chat', 'cleaning', 'labeling'),
+    'PERCENTILE': 95,
+    'MIN_SAMPLES': 20,  # 该服务的成功请求样本不足时不对冲
+    'MIN_DELAY': 2,  # 对冲前至少等待的秒数
+    'MAX_EXTRA_RATIO': 0.05,  # 对冲请求数不超过请求总数的该比例（额外开销上限）
+    'BURST': 5,  # 短时间内最多连续发出的对冲请求数
+}
+
+# 文本分块配置（按 token 计算）
+TEXT_CHUNKING = {
+    'CONTEXT_WINDOWS': {
+        'openai': 128000,
+        'zhipu': 128000,
+        'deepseek': 64000,
+    },
+    'DEFAULT_CONTEXT_WINDOW': 32000,
+    # 输入块上限 = max_tokens × 比例，保证模型输出（清洗后的全文/标注结果）不超过 max_tokens
+    'OUTPUT_RATIO': {
+        'cleaning': 0.6,
+        'labeling': 0.8,
+    },
+    'SAFETY_MARGIN': 256,
+}
+
+# 多记录打包：输入为 JSON 数组或 JSONL 时，把多条短记录按 token 预算打包进同一个请求，
+# 每条记录带 id，返回结果按 id 拆分，模型遗漏的记录单独重试
+REQUEST_PACKING = {
+    'ENABLED': True,
+    'MAX_RECORDS': 50,  # 单个请求最多包含的记录数
+    'MAX_RETRIES': 2,  # 遗漏记录的重试次数
+}
+
+# 重复检测：发送前找出重复的文本块/记录，每组只请求代表文本，结果复制给组内其他成员
+# 默认只合并规范化（去掉空白和标点、转小写）后完全相同的文本；
+# MAX_DISTANCE 大于 0 时改用 SimHash 指纹 + LSH 分桶合并近似文本，措辞相近但含义不同的对话也可能被合并，需按数据确认后再开启
+NEAR_DUPLICATE_DETECTION = {
+    'ENABLED': True,
+    'MAX_DISTANCE': 0,  # 64 位指纹的汉明距离阈值，0 表示只合并规范化后完全相同的文本
+    'NGRAM': 3,  # 字符 n-gram 长度
+}
+
+# 本地规则清洗：确定性的清洗维度用转换表和正则在本地完成，不再发送给模型
+# local 表示完全在本地处理；partial 表示本地先按词表处理，剩余部分仍由模型处理
+LOCAL_CLEANING = {
+    'ENABLED': True,
+    'DIMENSIONS': {
+        '格式统一': 'local',
+        '标点符号规范': 'local',
+        '错别字纠正': 'partial',
+    },
+    # 错别字纠正的本地词表（只收录没有歧义的常见错误）
+    'TYPO_CORRECTIONS': {
+        '因该': '应该',
+        '即然': '既然',
+        '必竟': '毕竟',
+        '做为': '作为',
+        '部份': '部分',
+        '在坐': '在座',
+        '按装': '安装',
+        '迫不急待': '迫不及待',
+        '再接再励': '再接再厉',
+        '一愁莫展': '一筹莫展',
+        '谈笑风声': '谈笑风生',
+        '走头无路': '走投无路',
+        '心心相映': '心心相印',
+        '默守成规': '墨守成规',
+        '穿流不息': '川流不息',
+        '焕然一心': '焕然一新',
+        '情不自尽': '情不自禁',
+        '莫明其妙': '莫名其妙',
+        '无精打彩': '无精打采',
+        '挺而走险': '铤而走险',
+    },
+}
+
+# 数据集：记录持久化保存，重复运行只处理新增或失败的记录
+DATASETS = {
+    'TEXT_RECORD_TOKENS': 1000,  # 非 JSON/JSONL 文本导入时按对话分块，每条记录的 token 上限
+    'RECORDS_PER_ROUND': 200,  # 每轮处理的记录数，每轮结束后保存状态并更新心跳
+    'MAX_FAILED_ROUNDS': 3,  # 连续失败的轮数达到该值时停止任务，剩余记录留待下次处理
+}
+
+# 处理任务队列配置（manage.py run_workers）
+PROCESSING_WORKERS = 2  # 每个 run_workers 进程同时执行的任务数
+PROCESSING_JOB_STALE_SECONDS = 600  # 运行中任务超过该时间无心跳则重新排队
+PROCESSING_JOB_HEARTBEAT_SECONDS = 30  # 任务执行期间写入心跳的间隔（秒），需远小于 PROCESSING_JOB_STALE_SECONDS
+PROCESSING_EVENTS_POLL_INTERVAL = 1  # 进度事件流（SSE）检查任务状态的间隔（秒）
+PROCESSING_EVENTS_MAX_SECONDS = 300  # 单个事件流的最长时间，超过后客户端改为轮询
+# 文本块失败重试：主流程结束后按指数退避重试失败的块
+CHUNK_RETRIES = {
+    'MAX_ATTEMPTS': 3,  # 每个块最多尝试的次数（含第一次）
+    'BACKOFF_BASE': 2,  # 第 n 轮重试前等待 BACKOFF_BASE * 2^(n-1) 秒
+    'BACKOFF_MAX': 60,
+}
+
+# 批处理接口（process_file 的 execution_mode='batch'）：文本块写成 JSONL 提交到 OpenAI 兼容的 /batches 接口，
+# run_workers 定期查询并合并结果；Deepseek 没有批处理接口
+BATCH_PROCESSING = {
+    'ENDPOINTS': {
+        'openai': '/v1/chat/completions',
+        'zhipu': '/v4/chat/completions',
+    },
+    'BASE_URLS': {},  # 按服务类型覆盖接口地址，例如指向本地模拟服务 {'openai': 'http://127.0.0.1:8001/v1'}
+    'COMPLETION_WINDOW': '24h',
+    'POLL_INTERVAL': 60,  # 查询批处理状态的间隔（秒）
+}
+
+# LLM 响应缓存：相同的服务、模型、temperature、提示词和文本块直接复用结果
+LLM_RESPONSE_CACHE = {
+    'ENABLED': True,
+    'PATH': BASE_DIR / 'cache' / 'llm_responses.sqlite3',
+    'MAX_ENTRIES': 200000,
+    'MAX_BYTES': 1024 * 1024 * 1024,  # 1GB
+    'TTL': 30 * 86400,  # 30天
+    'TASK_TYPES': ('cleaning', 'labeling'),  # 聊天回复不缓存
+}
+
+# 配置缓存（API 配置、系统提示词、维度）：保存在进程内，配置变更时更新版本文件，
+# 其他进程（Web 与 run_workers）发现版本变化后重新加载
+CONFIG_CACHE_VERSION_FILE = BASE_DIR / 'cache' / 'config.version'
+
 # 文件上传配置
 FILE_UPLOAD_MAX_MEMORY_SIZE = 5242880  # 5MB
 FILE_UPLOAD_HANDLERS = [
     'django.core.files.uploadhandler.MemoryFileUploadHandler',
     'django.core.files.uploadhandler.TemporaryFileUploadHandler',
 ]
+UPLOAD_PREVIEW_CHARS = 2000  # 上传后返回给前端的预览字符数
+UPLOAD_RETENTION_DAYS = 7  # 上传文件的保留天数，过期文件由 cleanup_uploads 命令删除
 
 # 添加 favicon 配置
 STATICFILES_DIRS = [
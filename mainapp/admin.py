@@ -1,15 +1,16 @@
 from django.contrib import admin
 from django import forms
-from .models import APIConfig, SystemPrompt, ChatMessage, CleaningDimension, LabelingDimension
+from .models import APIConfig, SystemPrompt, ChatMessage, CleaningDimension, LabelingDimension, ProcessingJob, BatchJob, ChatSession, Dataset, Record, RecordResult
 import json
 
 # Register your models here.
 
 @admin.register(APIConfig)
 class APIConfigAdmin(admin.ModelAdmin):
-    list_display = ('service_type', 'base_url', 'created_at', 'updated_at')
+    list_display = ('service_type', 'base_url', 'weight', 'is_active', 'created_at', 'updated_at')
+    list_editable = ('weight', 'is_active')
     search_fields = ('service_type', 'base_url')
-    list_filter = ('service_type', 'created_at')
+    list_filter = ('service_type', 'is_active', 'created_at')
     readonly_fields = ('created_at', 'updated_at')
 
     def get_form(self, request, obj=None, **kwargs):
@@ -107,6 +108,47 @@ class LabelingDimensionAdmin(admin.ModelAdmin):
     def has_delete_permission(self, request, obj=None):
         return True
 
+@admin.register(ProcessingJob)
+class ProcessingJobAdmin(admin.ModelAdmin):
+    list_display = ('key', 'process_type', 'status', 'progress', 'total_chunks', 'worker_id', 'created_at', 'finished_at')
+    list_filter = ('status', 'process_type', 'created_at')
+    search_fields = ('key', 'worker_id')
+    readonly_fields = ('created_at', 'updated_at', 'started_at', 'finished_at')
+    exclude = ('content', 'result')
+
+@admin.register(BatchJob)
+class BatchJobAdmin(admin.ModelAdmin):
+    list_display = ('batch_id', 'job', 'service_type', 'status', 'created_at', 'polled_at', 'completed_at')
+    list_filter = ('status', 'service_type')
+    search_fields = ('batch_id', 'job__key')
+    readonly_fields = ('created_at', 'updated_at', 'polled_at', 'completed_at')
+
+@admin.register(ChatSession)
+class ChatSessionAdmin(admin.ModelAdmin):
+    list_display = ('session_id', 'message_count', 'created_at', 'last_activity')
+    search_fields = ('session_id',)
+    readonly_fields = ('message_count', 'created_at', 'last_activity')
+    ordering = ('-last_activity',)
+
+@admin.register(Dataset)
+class DatasetAdmin(admin.ModelAdmin):
+    list_display = ('name', 'record_count', 'upload', 'created_at', 'updated_at')
+    search_fields = ('name',)
+    readonly_fields = ('record_count', 'created_at', 'updated_at')
+
+@admin.register(Record)
+class RecordAdmin(admin.ModelAdmin):
+    list_display = ('dataset', 'position', 'content_hash', 'created_at')
+    list_filter = ('dataset',)
+    search_fields = ('content_hash',)
+    raw_id_fields = ('dataset',)
+
+@admin.register(RecordResult)
+class RecordResultAdmin(admin.ModelAdmin):
+    list_display = ('record', 'process_type', 'dimensions_key', 'status', 'job', 'updated_at')
+    list_filter = ('process_type', 'status')
+    raw_id_fields = ('record', 'job')
+
 # 自定义 Admin 站点标题
 admin.site.site_header = 'AI数据处理系统管理后台'
 admin.site.site_title = 'AI数据处理系统'
@@ -1,58 +1,173 @@
 from abc import ABC, abstractmethod
+import asyncio
+import contextvars
 import json
 import logging
-from openai import OpenAI
-from typing import List, Dict, Optional
 import time
-import requests
-from requests.adapters import HTTPAdapter
-from urllib3.util import Retry
+from openai import OpenAI, AsyncOpenAI
+from typing import Callable, List, Dict, Optional, Iterator, AsyncIterator, Tuple
+import threading
+import weakref
+import httpx
 from zhipuai import ZhipuAI
 from django.conf import settings
+from .response_cache import ResponseCache, get_response_cache
+from .rate_limit import RateLimiter, get_rate_limiter
+from .provider_stats import record_call
+from .tokens import count_text_tokens_batch, get_token_counter
 
 logger = logging.getLogger(__name__)
 
-class AIServiceBase(ABC):
+# 为不同任务设置不同的 temperature
+TASK_TEMPERATURES = {
+    'cleaning': 0.2,  # 清洗任务需要更确定的输出
+    'labeling': 0.2,  # 标注任务需要高度一致性
+    'chat': 0.9      # 聊天需要更有创意的回复
+}
+
+# 本次请求失败时的 HTTP 状态码（由 _handle_rate_limit 写入），用于区分 429 和其他错误
+_last_error_status = contextvars.ContextVar('ai_last_error_status', default=None)
+
+class RateLimitMixin:
+    """同步和异步服务共用的限流逻辑，需要 service_type、api_key、max_tokens 属性"""
+
+    def _rate_limit_key(self) -> str:
+        return RateLimiter.make_key(self.service_type, self.api_key)
+
+    def _estimate_request_tokens(self, messages: List[Dict]) -> int:
+        """预估本次请求消耗的 token：提示词 + 预留的 max_tokens"""
+        return get_token_counter().count_messages(messages) + self.max_tokens
+
+    def _acquire_rate_limit(self, messages: List[Dict]) -> None:
+        """按 RPM/TPM 额度排队，额度不足时阻塞等待"""
+        limiter = get_rate_limiter()
+        limits = settings.AI_RATE_LIMITS['LIMITS'].get(self.service_type)
+        if limiter and limits:
+            limiter.acquire(self._rate_limit_key(), limits['rpm'], limits['tpm'],
+                            self._estimate_request_tokens(messages))
+
+    async def _aacquire_rate_limit(self, messages: List[Dict]) -> None:
+        """_acquire_rate_limit 的异步版本"""
+        limiter = get_rate_limiter()
+        limits = settings.AI_RATE_LIMITS['LIMITS'].get(self.service_type)
+        if limiter and limits:
+            await limiter.aacquire(self._rate_limit_key(), limits['rpm'], limits['tpm'],
+                                   self._estimate_request_tokens(messages))
+
+    def _refund_rate_limit(self, result: Optional[str]) -> None:
+        """按实际输出长度退还预留但未使用的 token"""
+        limiter = get_rate_limiter()
+        limits = settings.AI_RATE_LIMITS['LIMITS'].get(self.service_type)
+        if limiter and limits:
+            used = count_text_tokens_batch([result])[0] if result else 0
+            limiter.refund(self._rate_limit_key(), limits['tpm'], self.max_tokens - used)
+
+    def _record_call(self, started: float, result: Optional[str]) -> None:
+        """记录本次接口调用的延迟和结果，供多服务路由参考（不含限流排队和缓存命中）"""
+        record_call(self._rate_limit_key(), time.monotonic() - started, result is not None, _last_error_status.get())
+
+    def _handle_rate_limit(self, error: Exception) -> None:
+        """处理速率限制：收到 429 时按 Retry-After 暂停该密钥的所有请求"""
+        _last_error_status.set(getattr(error, 'status_code', None) or 0)
+        limiter = get_rate_limiter()
+        if not limiter or getattr(error, 'status_code', None) != 429:
+            return
+        response = getattr(error, 'response', None)
+        retry_after = response.headers.get('Retry-After') if response is not None else None
+        try:
+            seconds = float(retry_after)
+        except (TypeError, ValueError):
+            seconds = settings.AI_RATE_LIMITS['BLOCK_SECONDS']
+        limiter.block(self._rate_limit_key(), seconds)
+
+class AIServiceBase(RateLimitMixin, ABC):
     """AI服务基类"""
     
+    service_type = ''
+    model = ''
+    
     def __init__(self, api_key: str):
         self.api_key = api_key
         self.max_tokens = 3072
         self.timeout = 180  # 3分钟超时
         logger.info(f"初始化AI服务: max_tokens={self.max_tokens}, timeout={self.timeout}")
-        self.session = self._create_session()
-        # 为不同任务设置不同的 temperature
-        self.task_temperatures = {
-            'cleaning': 0.2,  # 清洗任务需要更确定的输出
-            'labeling': 0.2,  # 标注任务需要高度一致性
-            'chat': 0.9      # 聊天需要更有创意的回复
-        }
-
-    def _create_session(self):
-        """创建带有重试机制的会话"""
-        session = requests.Session()
-        retry_strategy = Retry(
-            total=3,  # 最多重试3次
-            backoff_factor=2,  # 增加重试间隔
-            status_forcelist=[429, 500, 502, 503, 504],
-            allowed_methods=["GET", "POST"]  # 明确允许的方法
+        self.http_client = self._create_http_client()
+        self.task_temperatures = dict(TASK_TEMPERATURES)
+
+    def _create_http_client(self) -> httpx.Client:
+        """创建带连接池的 HTTP 客户端，实例在注册表中长期复用，连接保持 keep-alive"""
+        pool = settings.AI_HTTP_POOL
+        return httpx.Client(
+            limits=httpx.Limits(
+                max_connections=pool['MAX_CONNECTIONS'],
+                max_keepalive_connections=pool['MAX_KEEPALIVE_CONNECTIONS'],
+                keepalive_expiry=pool['KEEPALIVE_EXPIRY']
+            ),
+            timeout=httpx.Timeout(self.timeout, connect=pool['CONNECT_TIMEOUT'])
         )
-        adapter = HTTPAdapter(max_retries=retry_strategy)
-        session.mount("https://", adapter)
-        session.mount("http://", adapter)
-        return session
 
-    def _handle_rate_limit(self, response: requests.Response) -> None:
-        """处理速率限制"""
-        if response.status_code == 429:
-            retry_after = int(response.headers.get('Retry-After', 5))
-            time.sleep(retry_after)
+    def chat_completion(self, messages: List[Dict], task_type: str = 'chat', use_cache: bool = True,
+                        cacheable: Optional[Callable[[str], bool]] = None) -> Optional[str]:
+        """
+        发送聊天请求，清洗/标注任务先查询响应缓存
+        :param use_cache: 为 False 时跳过缓存（按任务关闭，重试时也不读取缓存）
+        :param cacheable: 判断响应能否写入缓存，无法解析的响应不缓存，避免重试和之后的任务反复拿到同一个坏结果
+        """
+        cache_key = None
+        response_cache = get_response_cache() if use_cache else None
+        if response_cache and task_type in settings.LLM_RESPONSE_CACHE['TASK_TYPES']:
+            cache_key = ResponseCache.make_key(
+                self.service_type, self.model, self.task_temperatures.get(task_type, 0.8), messages
+            )
+            cached = response_cache.get(cache_key)
+            if cached is not None:
+                logger.info(f"命中响应缓存: {cache_key[:12]}")
+                return cached
+
+        self._acquire_rate_limit(messages)
+        started = time.monotonic()
+        _last_error_status.set(None)
+        result = self._chat_completion(messages, task_type)
+        self._record_call(started, result)
+        self._refund_rate_limit(result)
+        if cache_key and result and (cacheable is None or cacheable(result)):
+            response_cache.set(cache_key, result)
+        return result
 
     @abstractmethod
-    def chat_completion(self, messages: List[Dict], task_type: str = 'chat') -> Optional[str]:
-        """发送聊天请求"""
+    def _chat_completion(self, messages: List[Dict], task_type: str) -> Optional[str]:
+        """调用服务接口发送聊天请求"""
         pass
 
+    def stream_chat_completion(self, messages: List[Dict], task_type: str = 'chat') -> Iterator[str]:
+        """
+        流式发送聊天请求，逐段返回生成的文本
+        三种服务的 SDK 客户端接口一致，出错时直接抛出异常由调用方处理
+        """
+        logger.info(f"流式调用{self.service_type} API: model={self.model}, task_type={task_type}")
+        self._acquire_rate_limit(messages)
+        parts = []
+        try:
+            response = self.client.chat.completions.create(
+                model=self.model,
+                messages=messages,
+                temperature=self.task_temperatures.get(task_type, 0.8),
+                max_tokens=self.max_tokens,
+                stream=True
+            )
+            for chunk in response:
+                if not chunk.choices:
+                    continue
+                delta = chunk.choices[0].delta.content
+                if delta:
+                    parts.append(delta)
+                    yield delta
+        except Exception as e:
+            self._handle_rate_limit(e)
+            raise
+        finally:
+            self._refund_rate_limit(''.join(parts))
+
     @abstractmethod
     def validate_api_key(self) -> bool:
         """验证API密钥是否有效"""
@@ -61,15 +176,18 @@ class AIServiceBase(ABC):
 class DeepseekService(AIServiceBase):
     """Deepseek API服务"""
     
+    service_type = 'deepseek'
+    
     def __init__(self, api_key: str):
         super().__init__(api_key)
         self.client = OpenAI(
             api_key=api_key,
             base_url=settings.DEEPSEEK_API_BASE,
+            http_client=self.http_client
         )
         self.model = "deepseek-chat"
 
-    def chat_completion(self, messages: List[Dict], task_type: str = 'chat') -> Optional[str]:
+    def _chat_completion(self, messages: List[Dict], task_type: str) -> Optional[str]:
         try:
             logger.info(f"调用Deepseek API: task_type={task_type}")
             logger.info(f"请求消息:\n{json.dumps(messages, ensure_ascii=False, indent=2)}")
@@ -87,6 +205,7 @@ class DeepseekService(AIServiceBase):
             
         except Exception as e:
             logger.error(f"Deepseek API调用失败: {str(e)}")
+            self._handle_rate_limit(e)
             return None
 
     def validate_api_key(self) -> bool:
@@ -99,14 +218,16 @@ class DeepseekService(AIServiceBase):
 class ZhipuService(AIServiceBase):
     """智谱 AI 服务"""
     
+    service_type = 'zhipu'
+    
     def __init__(self, api_key: str):
         super().__init__(api_key)
-        self.client = ZhipuAI(api_key=api_key)
+        self.client = ZhipuAI(api_key=api_key, http_client=self.http_client)
         self.model = "glm-4-plus"
         self.max_retries = 2
         logger.info(f"初始化智谱AI服务: model={self.model}")
 
-    def chat_completion(self, messages: List[Dict], task_type: str = 'chat') -> Optional[str]:
+    def _chat_completion(self, messages: List[Dict], task_type: str) -> Optional[str]:
         """发送聊天请求"""
         try:
             logger.info(f"调用智谱API: model={self.model}, task_type={task_type}")
@@ -125,6 +246,7 @@ class ZhipuService(AIServiceBase):
             
         except Exception as e:
             logger.error(f"智谱API调用失败: {str(e)}")
+            self._handle_rate_limit(e)
             return None
 
     def validate_api_key(self) -> bool:
@@ -142,15 +264,18 @@ class ZhipuService(AIServiceBase):
 class OpenAIService(AIServiceBase):
     """OpenAI API服务"""
     
+    service_type = 'openai'
+    
     def __init__(self, api_key: str, base_url: str = None):
         super().__init__(api_key)
         self.client = OpenAI(
             api_key=api_key,
-            base_url=base_url or settings.OPENAI_API_BASE
+            base_url=base_url or settings.OPENAI_API_BASE,
+            http_client=self.http_client
         )
         self.model = "chatgpt-4o-latest"
 
-    def chat_completion(self, messages: List[Dict], task_type: str = 'chat') -> Optional[str]:
+    def _chat_completion(self, messages: List[Dict], task_type: str) -> Optional[str]:
         try:
             logger.info(f"调用OpenAI API: model={self.model}, task_type={task_type}")
             logger.info(f"请求消息:\n{json.dumps(messages, ensure_ascii=False, indent=2)}")
@@ -168,6 +293,7 @@ class OpenAIService(AIServiceBase):
             
         except Exception as e:
             logger.error(f"OpenAI API调用失败: {str(e)}")
+            self._handle_rate_limit(e)
             return None
 
     def validate_api_key(self) -> bool:
@@ -177,8 +303,8 @@ class OpenAIService(AIServiceBase):
         except:
             return False
 
-def create_ai_service(service_type, api_key, base_url=None):
-    """创建 AI 服务实例"""
+def _build_ai_service(service_type, api_key, base_url=None):
+    """创建新的 AI 服务实例"""
     if service_type == 'openai':
         return OpenAIService(api_key, base_url)
     elif service_type == 'zhipu':
@@ -188,13 +314,48 @@ def create_ai_service(service_type, api_key, base_url=None):
     else:
         raise ValueError(f'不支持的服务类型: {service_type}')
 
+# 进程内的服务实例注册表：(service_type, api_key, base_url) -> 服务实例
+_service_registry: Dict[Tuple, AIServiceBase] = {}
+_async_service_registry = weakref.WeakKeyDictionary()  # 事件循环 -> {key: 异步服务实例}
+_registry_lock = threading.Lock()
+
+
+def _registry_key(service_type, api_key, base_url=None) -> Tuple:
+    # base_url 只对 OpenAI 服务生效
+    return (service_type, api_key, (base_url or None) if service_type == 'openai' else None)
+
+
+def create_ai_service(service_type, api_key, base_url=None):
+    """获取 AI 服务实例，相同配置复用同一个实例及其连接池"""
+    key = _registry_key(service_type, api_key, base_url)
+    service = _service_registry.get(key)
+    if service is None:
+        with _registry_lock:
+            service = _service_registry.get(key)
+            if service is None:
+                service = _build_ai_service(*key)
+                _service_registry[key] = service
+                logger.info(f"注册AI服务实例: {service_type}")
+    return service
+
+
+def clear_service_registry():
+    """
+    清空服务实例注册表（APIConfig 保存或删除时调用）
+    旧实例可能仍在其他线程中使用，因此不主动关闭，由垃圾回收释放连接
+    """
+    with _registry_lock:
+        _service_registry.clear()
+        _async_service_registry.clear()
+    logger.info("已清空AI服务实例注册表")
+
 class AIServiceFactory:
     """AI服务工厂类"""
     
     @staticmethod
     def create_service(service_type: str, api_key: str, base_url: str = None) -> Optional[AIServiceBase]:
         """
-        创建AI服务实例
+        获取AI服务实例（来自进程内注册表）
         :param service_type: 服务类型 ('deepseek', 'zhipu', 'openai')
         :param api_key: API密钥
         :param base_url: OpenAI Base URL（仅用于 'openai' 服务）
@@ -205,15 +366,177 @@ class AIServiceFactory:
                 logger.error("服务类型或API密钥为空")
                 return None
 
-            if service_type == 'openai':
-                return OpenAIService(api_key, base_url)
-            elif service_type == 'zhipu':
-                return ZhipuService(api_key)
-            elif service_type == 'deepseek':
-                return DeepseekService(api_key)
-            else:
-                logger.error(f"不支持的服务类型: {service_type}")
-                return None
+            return create_ai_service(service_type, api_key, base_url)
+        except ValueError as e:
+            logger.error(str(e))
+            return None
         except Exception as e:
             logger.error(f"创建AI服务失败: {str(e)}")
             return None
+
+
+class AsyncAIServiceBase(RateLimitMixin, ABC):
+    """异步AI服务基类，基于 OpenAI 兼容的异步客户端，用于 ASGI 部署"""
+    
+    service_type = ''
+    model = ''
+    
+    def __init__(self, api_key: str, base_url: str = None):
+        self.api_key = api_key
+        self.max_tokens = 3072
+        self.timeout = 180  # 3分钟超时
+        self.task_temperatures = dict(TASK_TEMPERATURES)
+        pool = settings.AI_HTTP_POOL
+        self.client = AsyncOpenAI(
+            api_key=api_key,
+            base_url=base_url or self.get_default_base_url(),
+            http_client=httpx.AsyncClient(
+                limits=httpx.Limits(
+                    max_connections=pool['MAX_CONNECTIONS'],
+                    max_keepalive_connections=pool['MAX_KEEPALIVE_CONNECTIONS'],
+                    keepalive_expiry=pool['KEEPALIVE_EXPIRY']
+                ),
+                timeout=httpx.Timeout(self.timeout, connect=pool['CONNECT_TIMEOUT'])
+            )
+        )
+        logger.info(f"初始化异步AI服务: service_type={self.service_type}, model={self.model}")
+
+    @abstractmethod
+    def get_default_base_url(self) -> str:
+        """默认的 API 地址"""
+        pass
+
+    async def chat_completion(self, messages: List[Dict], task_type: str = 'chat', use_cache: bool = True,
+                              cacheable: Optional[Callable[[str], bool]] = None) -> Optional[str]:
+        """发送聊天请求，与同步服务共用响应缓存，参数同 AIServiceBase.chat_completion"""
+        cache_key = None
+        response_cache = get_response_cache() if use_cache else None
+        if response_cache and task_type in settings.LLM_RESPONSE_CACHE['TASK_TYPES']:
+            cache_key = ResponseCache.make_key(
+                self.service_type, self.model, self.task_temperatures.get(task_type, 0.8), messages
+            )
+            cached = await asyncio.to_thread(response_cache.get, cache_key)
+            if cached is not None:
+                logger.info(f"命中响应缓存: {cache_key[:12]}")
+                return cached
+
+        await self._aacquire_rate_limit(messages)
+        started = time.monotonic()
+        _last_error_status.set(None)
+        result = await self._chat_completion(messages, task_type)
+        self._record_call(started, result)
+        await asyncio.to_thread(self._refund_rate_limit, result)
+        if cache_key and result and (cacheable is None or cacheable(result)):
+            await asyncio.to_thread(response_cache.set, cache_key, result)
+        return result
+
+    async def _chat_completion(self, messages: List[Dict], task_type: str) -> Optional[str]:
+        """调用服务接口发送聊天请求"""
+        try:
+            logger.info(f"异步调用{self.service_type} API: model={self.model}, task_type={task_type}")
+            logger.info(f"请求消息:\n{json.dumps(messages, ensure_ascii=False, indent=2)}")
+            
+            response = await self.client.chat.completions.create(
+                model=self.model,
+                messages=messages,
+                temperature=self.task_temperatures.get(task_type, 0.8),
+                max_tokens=self.max_tokens
+            )
+            
+            result = response.choices[0].message.content
+            logger.info(f"{self.service_type}异步响应:\n{result}")
+            return result
+            
+        except Exception as e:
+            logger.error(f"{self.service_type} API异步调用失败: {str(e)}")
+            self._handle_rate_limit(e)
+            return None
+
+    async def stream_chat_completion(self, messages: List[Dict], task_type: str = 'chat') -> AsyncIterator[str]:
+        """流式发送聊天请求，逐段返回生成的文本"""
+        logger.info(f"异步流式调用{self.service_type} API: model={self.model}, task_type={task_type}")
+        await self._aacquire_rate_limit(messages)
+        parts = []
+        try:
+            response = await self.client.chat.completions.create(
+                model=self.model,
+                messages=messages,
+                temperature=self.task_temperatures.get(task_type, 0.8),
+                max_tokens=self.max_tokens,
+                stream=True
+            )
+            async for chunk in response:
+                if not chunk.choices:
+                    continue
+                delta = chunk.choices[0].delta.content
+                if delta:
+                    parts.append(delta)
+                    yield delta
+        except Exception as e:
+            self._handle_rate_limit(e)
+            raise
+        finally:
+            await asyncio.to_thread(self._refund_rate_limit, ''.join(parts))
+
+    async def validate_api_key(self) -> bool:
+        """验证API密钥是否有效"""
+        response = await self.chat_completion([{"role": "user", "content": "test"}])
+        return response is not None
+
+class AsyncDeepseekService(AsyncAIServiceBase):
+    """Deepseek 异步服务"""
+    
+    service_type = 'deepseek'
+    model = "deepseek-chat"
+
+    def get_default_base_url(self) -> str:
+        return settings.DEEPSEEK_API_BASE
+
+class AsyncZhipuService(AsyncAIServiceBase):
+    """智谱 AI 异步服务（使用 OpenAI 兼容接口）"""
+    
+    service_type = 'zhipu'
+    model = "glm-4-plus"
+
+    def get_default_base_url(self) -> str:
+        return settings.ZHIPU_API_BASE
+
+class AsyncOpenAIService(AsyncAIServiceBase):
+    """OpenAI 异步服务"""
+    
+    service_type = 'openai'
+    model = "chatgpt-4o-latest"
+
+    def get_default_base_url(self) -> str:
+        return settings.OPENAI_API_BASE
+
+def _build_async_ai_service(service_type, api_key, base_url=None):
+    """创建新的异步 AI 服务实例"""
+    if service_type == 'openai':
+        return AsyncOpenAIService(api_key, base_url)
+    elif service_type == 'zhipu':
+        return AsyncZhipuService(api_key)
+    elif service_type == 'deepseek':
+        return AsyncDeepseekService(api_key)
+    else:
+        raise ValueError(f'不支持的服务类型: {service_type}')
+
+
+def create_async_ai_service(service_type, api_key, base_url=None):
+    """
+    获取异步 AI 服务实例
+    异步连接池绑定在事件循环上，因此按当前事件循环分别缓存
+    """
+    key = _registry_key(service_type, api_key, base_url)
+    try:
+        loop = asyncio.get_running_loop()
+    except RuntimeError:
+        return _build_async_ai_service(*key)
+
+    with _registry_lock:
+        services = _async_service_registry.setdefault(loop, {})
+        service = services.get(key)
+        if service is None:
+            service = _build_async_ai_service(*key)
+            services[key] = service
+    return service
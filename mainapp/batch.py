@@ -0,0 +1,250 @@
+import json
+import logging
+from datetime import timedelta
+from typing import Dict, List, Optional, Tuple
+from django.conf import settings
+from django.db.models import Q
+from django.utils import timezone
+from openai import OpenAI
+from .models import APIConfig, BatchJob, ProcessingChunk, ProcessingJob, ProcessingResult
+from .ai_services import AIServiceBase, create_ai_service
+from .data_services import TextProcessor
+from .packing import demux_results, parse_pack, request_text
+
+logger = logging.getLogger(__name__)
+
+DEFERRED_RECORDS_ERROR = '批处理响应遗漏了部分记录，等待实时补充请求'
+
+
+def supports_batch(service_type: str) -> bool:
+    """服务是否提供批处理接口"""
+    return service_type in settings.BATCH_PROCESSING['ENDPOINTS']
+
+
+def get_batch_client(service: AIServiceBase) -> OpenAI:
+    """
+    创建批处理接口客户端，复用服务实例的连接池
+    智谱的 /files 和 /batches 与 OpenAI 兼容，因此统一使用 OpenAI SDK
+    """
+    config = settings.BATCH_PROCESSING
+    if not supports_batch(service.service_type):
+        raise ValueError(f"{service.service_type} 不支持批处理接口")
+    base_url = config['BASE_URLS'].get(service.service_type) or str(service.client.base_url)
+    return OpenAI(api_key=service.api_key, base_url=base_url, http_client=service.http_client)
+
+
+def build_batch_file(service: AIServiceBase, chunks: Dict[int, str], system_prompt: str, process_type: str) -> bytes:
+    """把文本块写成批处理 JSONL，custom_id 对应块序号"""
+    endpoint = settings.BATCH_PROCESSING['ENDPOINTS'][service.service_type]
+    lines = []
+    for i, chunk in chunks.items():
+        lines.append(json.dumps({
+            'custom_id': f"chunk-{i}",
+            'method': 'POST',
+            'url': endpoint,
+            'body': {
+                'model': service.model,
+                'messages': [
+                    {'role': 'system', 'content': system_prompt},
+                    {'role': 'user', 'content': request_text(chunk)}
+                ],
+                'temperature': service.task_temperatures.get(process_type, 0.8),
+                'max_tokens': service.max_tokens
+            }
+        }, ensure_ascii=False))
+    return '\n'.join(lines).encode('utf-8')
+
+
+def submit_batch_job(job: ProcessingJob, service: AIServiceBase, content: str) -> BatchJob:
+    """分块后上传 JSONL 并创建批处理，任务进入等待状态；近似重复块不提交"""
+    client = get_batch_client(service)
+    processor = TextProcessor(service)
+
+    local_dimensions, dimensions = processor._plan_dimensions(job.process_type, job.dimensions)
+    system_prompt = processor._get_system_prompt(job.process_type, dimensions)
+    if not system_prompt:
+        raise Exception("获取系统提示词失败")
+    plan = processor._split_content(content, system_prompt, job.process_type, local_dimensions)
+    if not plan.chunks:
+        raise Exception("没有可处理的文本")
+    processor._init_job_chunks(job, plan.chunks, plan.duplicates, plan.report, plan.packed)
+
+    requests = {i: chunk for i, chunk in enumerate(plan.chunks, 1) if i not in plan.duplicates}
+    data = build_batch_file(service, requests, plan.system_prompt, job.process_type)
+    input_file = client.files.create(file=(f"{job.key}.jsonl", data, 'application/jsonl'), purpose='batch')
+    remote = client.batches.create(
+        input_file_id=input_file.id,
+        endpoint=settings.BATCH_PROCESSING['ENDPOINTS'][service.service_type],
+        completion_window=settings.BATCH_PROCESSING['COMPLETION_WINDOW']
+    )
+
+    batch = BatchJob.objects.create(
+        job=job,
+        service_type=service.service_type,
+        batch_id=remote.id,
+        input_file_id=input_file.id,
+        status=remote.status
+    )
+    job.status = 'waiting'
+    job.save_owned(['status'])
+    logger.info(f"任务 {job.key} 已提交批处理: {remote.id}，共 {len(requests)} 个文本块")
+    return batch
+
+
+def _read_batch_file(client: OpenAI, file_id: Optional[str]) -> List[Dict]:
+    if not file_id:
+        return []
+    text = client.files.content(file_id).text
+    return [json.loads(line) for line in text.splitlines() if line.strip()]
+
+
+def _parse_batch_records(records: List[Dict]) -> Tuple[Dict[int, str], Dict[int, str]]:
+    """按 custom_id 拆分成功的响应文本和错误"""
+    results, errors = {}, {}
+    for record in records:
+        try:
+            index = int(str(record.get('custom_id', '')).rsplit('-', 1)[-1])
+        except ValueError:
+            logger.warning(f"无法识别的 custom_id: {record.get('custom_id')}")
+            continue
+
+        response = record.get('response') or {}
+        body = response.get('body') or {}
+        choices = body.get('choices') or []
+        if response.get('status_code') == 200 and choices:
+            results[index] = choices[0]['message']['content']
+        else:
+            error = record.get('error') or body.get('error') or f"状态码 {response.get('status_code')}"
+            errors[index] = error if isinstance(error, str) else json.dumps(error, ensure_ascii=False)
+    return results, errors
+
+
+def collect_batch_results(batch: BatchJob, client: OpenAI, service: AIServiceBase) -> None:
+    """
+    批处理结束后下载输出，写回文本块并合并为任务结果
+    多记录请求中模型遗漏了记录的块不在查询线程中补充请求：这些块保持待处理，任务重新排队，
+    由 worker 从检查点按实时方式继续（遵循任务的 use_cache 设置，遗漏的记录按 id 重试）
+    """
+    job = batch.job
+    processor = TextProcessor(service)
+    records = _read_batch_file(client, batch.output_file_id) + _read_batch_file(client, batch.error_file_id)
+    responses, errors = _parse_batch_records(records)
+
+    chunks = list(job.chunks.all())
+    results, deferred = {}, set()
+    for chunk in chunks:
+        if chunk.duplicate_of is not None or chunk.index not in responses:
+            continue
+        data = processor._parse_json_response(responses[chunk.index])
+        pack = parse_pack(chunk.content) if job.packed else None
+        if pack is None:
+            results[chunk.index] = data
+            continue
+        found = demux_results(data, [r['id'] for r in pack])
+        if len(found) == len(pack):
+            results[chunk.index] = processor._pack_result(chunk.index, pack, found)
+        else:
+            deferred.add(chunk.index)
+    for chunk in chunks:
+        # 近似重复块复用代表块的结果
+        if chunk.duplicate_of is not None:
+            if chunk.duplicate_of in results:
+                results[chunk.index] = results[chunk.duplicate_of]
+            elif chunk.duplicate_of in deferred:
+                deferred.add(chunk.index)
+            elif chunk.duplicate_of in errors:
+                errors[chunk.index] = errors[chunk.duplicate_of]
+
+    now = timezone.now()
+    for chunk in chunks:
+        if chunk.index in results:
+            chunk.status, chunk.error = 'completed', None
+        elif chunk.index in deferred:
+            chunk.status, chunk.error = 'pending', DEFERRED_RECORDS_ERROR
+        else:
+            chunk.status = 'failed'
+            chunk.error = errors.get(chunk.index, f"批处理{batch.status}，未返回结果")
+        chunk.updated_at = now
+    ProcessingChunk.objects.bulk_update(chunks, ['status', 'error', 'updated_at'], batch_size=500)
+    ProcessingResult.objects.bulk_create([
+        ProcessingResult(job=job, index=chunk.index, result=results[chunk.index])
+        for chunk in chunks if chunk.index in results
+    ], batch_size=500)
+    batch.completed_at = now
+    batch.save(update_fields=['completed_at', 'updated_at'])
+
+    if deferred:
+        job.status = 'queued'
+        job.worker_id = None
+        job.completed_chunks = len(results)
+        job.progress = len(results) / len(chunks) * 100
+        job.save(update_fields=['status', 'worker_id', 'progress', 'completed_chunks', 'updated_at'])
+        logger.warning(f"批处理 {batch.batch_id} 中 {len(deferred)} 个文本块遗漏记录，任务重新排队按实时方式补充")
+        return
+
+    job.completed_chunks = len(chunks)
+    job.progress = 100
+    job.finished_at = now
+    if results:
+        job.status = 'completed'
+        job.result = processor._merge_results(results, job.packed)
+        job.save(update_fields=['status', 'result', 'progress', 'completed_chunks', 'finished_at', 'updated_at'])
+        logger.info(f"批处理 {batch.batch_id} 完成: 成功 {len(results)} 块，失败 {len(chunks) - len(results)} 块")
+    else:
+        job.status = 'failed'
+        job.error = f"批处理{batch.status}，没有成功处理任何文本块"
+        job.save(update_fields=['status', 'error', 'progress', 'completed_chunks', 'finished_at', 'updated_at'])
+        logger.error(f"批处理 {batch.batch_id} 失败: {batch.status}")
+
+
+def sync_batch(batch: BatchJob) -> None:
+    """查询一次批处理状态，结束时收集结果"""
+    api_config = APIConfig.objects.filter(service_type=batch.service_type).order_by('-updated_at').first()
+    if not api_config:
+        raise ValueError(f"未找到 {batch.service_type} 的API配置")
+    service = create_ai_service(api_config.service_type, api_config.api_key, api_config.base_url)
+    client = get_batch_client(service)
+
+    remote = client.batches.retrieve(batch.batch_id)
+    batch.status = remote.status
+    batch.output_file_id = remote.output_file_id
+    batch.error_file_id = remote.error_file_id
+    if remote.request_counts:
+        batch.request_counts = remote.request_counts.model_dump()
+    batch.save(update_fields=['status', 'output_file_id', 'error_file_id', 'request_counts', 'updated_at'])
+
+    if remote.status in BatchJob.ACTIVE_STATUSES:
+        counts = batch.request_counts
+        if counts.get('total'):
+            done = counts.get('completed', 0) + counts.get('failed', 0)
+            ProcessingJob.objects.filter(pk=batch.job_id).update(
+                progress=done / counts['total'] * 100,
+                updated_at=timezone.now()
+            )
+        return
+    collect_batch_results(batch, client, service)
+
+
+def poll_batch_jobs(poll_interval: Optional[float] = None) -> int:
+    """
+    查询到期的未结束批处理
+    先用带 polled_at 条件的 UPDATE 占用，多个 run_workers 进程不会重复收集同一批结果
+    :return: 本次查询的批处理数量
+    """
+    poll_interval = poll_interval if poll_interval is not None else settings.BATCH_PROCESSING['POLL_INTERVAL']
+    now = timezone.now()
+    due = BatchJob.objects.filter(
+        Q(polled_at__isnull=True) | Q(polled_at__lte=now - timedelta(seconds=poll_interval)),
+        status__in=BatchJob.ACTIVE_STATUSES
+    ).select_related('job')
+
+    polled = 0
+    for batch in due:
+        if not BatchJob.objects.filter(pk=batch.pk, polled_at=batch.polled_at).update(polled_at=now):
+            continue
+        polled += 1
+        try:
+            sync_batch(batch)
+        except Exception as e:
+            logger.error(f"查询批处理 {batch.batch_id} 失败: {str(e)}", exc_info=True)
+    return polled
@@ -0,0 +1,148 @@
+import logging
+import re
+from typing import List
+from .tokens import get_encoding, estimate_tokens, count_text_tokens_batch
+
+logger = logging.getLogger(__name__)
+
+# 行首的说话人标记，例如 "咨询师：" "来访者:" "Client:"
+SPEAKER_PATTERN = re.compile(
+    r'^[ \t]*(咨询师|心理咨询师|来访者|求助者|咨询者|医生|患者|用户|助手|'
+    r'counselor|therapist|client|patient|user|assistant|[A-Za-z\u4e00-\u9fff]{1,8})[ \t]*[:：]',
+    re.IGNORECASE | re.MULTILINE
+)
+SENTENCE_PATTERN = re.compile(r'[^。！？.!?\n]*(?:[。！？.!?]+|\n+)|[^。！？.!?\n]+')
+
+
+class DialogueChunker:
+    """
+    按 token 数分块，尽量保持对话轮次完整
+    分块顺序：问答回合 > 单个轮次 > 句子 > 按 token 硬切分
+    """
+
+    def __init__(self, max_tokens: int, model: str = "gpt-4"):
+        self.max_tokens = max(1, max_tokens)
+        self.model = model
+
+    def split(self, content: str) -> List[str]:
+        """将文本切分为不超过 max_tokens 的块"""
+        units = self._split_turns(content)
+        if not units:
+            return []
+
+        # 只编码一次，后续全部基于计数打包
+        counts = count_text_tokens_batch(units, self.model)
+        chunks = []
+        parts = []
+        used = 0
+
+        def flush():
+            nonlocal parts, used
+            chunk = ''.join(parts)
+            if chunk.strip():
+                chunks.append(chunk)
+            parts = []
+            used = 0
+
+        for group in self._group_exchanges(units):
+            group_tokens = sum(counts[i] for i in group)
+            if group_tokens <= self.max_tokens:
+                # 整个回合放入同一块
+                if used + group_tokens > self.max_tokens:
+                    flush()
+                pieces = [(units[i], counts[i]) for i in group]
+            else:
+                # 回合过长，退化为按轮次/句子打包
+                pieces = []
+                for i in group:
+                    pieces.extend(self._fit_unit(units[i], counts[i]))
+
+            for text, tokens in pieces:
+                if parts and used + tokens > self.max_tokens:
+                    flush()
+                parts.append(text)
+                used += tokens
+
+        flush()
+        return chunks
+
+    def _split_turns(self, content: str) -> List[str]:
+        """按说话人切分轮次；没有说话人标记时按行切分"""
+        starts = [m.start() for m in SPEAKER_PATTERN.finditer(content)]
+        if not starts:
+            return content.splitlines(keepends=True)
+        if starts[0] != 0:
+            starts.insert(0, 0)
+        starts.append(len(content))
+        return [content[starts[i]:starts[i + 1]] for i in range(len(starts) - 1)]
+
+    def _group_exchanges(self, units: List[str]) -> List[List[int]]:
+        """以首个说话人的发言为起点，把一问一答归为一个回合"""
+        first_speaker = None
+        groups, current = [], []
+        for i, unit in enumerate(units):
+            match = SPEAKER_PATTERN.match(unit)
+            speaker = match.group(1).lower() if match else None
+            if first_speaker is None and speaker:
+                first_speaker = speaker
+            if current and speaker is not None and speaker == first_speaker:
+                groups.append(current)
+                current = []
+            current.append(i)
+        if current:
+            groups.append(current)
+        return groups
+
+    def _fit_unit(self, unit: str, tokens: int) -> List[tuple]:
+        """把单个轮次拆成不超过 max_tokens 的片段"""
+        if tokens <= self.max_tokens:
+            return [(unit, tokens)]
+
+        sentences = SENTENCE_PATTERN.findall(unit)
+        pieces = []
+        for sentence, count in zip(sentences, count_text_tokens_batch(sentences, self.model)):
+            if count <= self.max_tokens:
+                pieces.append((sentence, count))
+            else:
+                pieces.extend(self._hard_split(sentence))
+        return pieces
+
+    def _hard_split(self, text: str) -> List[tuple]:
+        """没有句子边界的超长文本按 token 切分"""
+        encoding = get_encoding(self.model)
+        if encoding is None:
+            # 估算模式：按中文字符 1 token 保守切分
+            step = self.max_tokens
+            return [(text[i:i + step], estimate_tokens(text[i:i + step])) for i in range(0, len(text), step)]
+
+        # 按 token 字节累积，只在能完整解码的位置切分，避免截断多字节字符
+        pieces = []
+        buffer, count = b'', 0
+        for token_bytes in encoding.decode_tokens_bytes(encoding.encode_ordinary(text)):
+            if count >= self.max_tokens:
+                try:
+                    pieces.append((buffer.decode('utf-8'), count))
+                    buffer, count = b'', 0
+                except UnicodeDecodeError:
+                    pass
+            buffer += token_bytes
+            count += 1
+        if buffer:
+            pieces.append((buffer.decode('utf-8', errors='replace'), count))
+        return pieces
+
+
+def chunk_token_budget(context_window: int, max_output_tokens: int, prompt_tokens: int,
+                       output_ratio: float, safety_margin: int = 256) -> int:
+    """
+    计算单个文本块的 token 上限
+    - 上下文窗口需容纳系统提示词、文本块和预留的输出
+    - 输出（清洗后的全文或标注结果）与输入同量级，按 output_ratio 限制输入，避免输出被截断
+    """
+    by_context = context_window - prompt_tokens - max_output_tokens - safety_margin
+    by_output = int(max_output_tokens * output_ratio)
+    budget = min(by_context, by_output)
+    if budget <= 0:
+        logger.warning(f"系统提示词过长，分块预算不足: prompt_tokens={prompt_tokens}")
+        budget = max(256, by_output // 4)
+    return budget
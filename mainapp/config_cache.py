@@ -0,0 +1,149 @@
+import logging
+import os
+import threading
+import time
+from typing import Any, Callable, Dict, List, Optional
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+
+class ConfigCache:
+    """
+    带版本号的进程内配置缓存
+    版本号取自版本文件的 inode 和修改时间：配置变更时原子替换该文件，
+    每次读取只需一次 stat，不查询数据库，同时能感知其他进程中的修改
+    """
+
+    def __init__(self, version_path: str):
+        self.version_path = str(version_path)
+        self._data: Dict[Any, Any] = {}
+        self._version = None
+        self._lock = threading.Lock()
+        os.makedirs(os.path.dirname(self.version_path) or '.', exist_ok=True)
+
+    def _current_version(self) -> tuple:
+        try:
+            stat = os.stat(self.version_path)
+        except FileNotFoundError:
+            return (0, 0)
+        return (stat.st_ino, stat.st_mtime_ns)
+
+    def get(self, key: Any, loader: Callable[[], Any]) -> Any:
+        """读取缓存，未命中或版本变化时调用 loader 加载"""
+        version = self._current_version()
+        with self._lock:
+            if version != self._version:
+                self._data = {}
+                self._version = version
+            if key in self._data:
+                return self._data[key]
+
+        value = loader()
+        with self._lock:
+            # 加载期间配置又发生变化时不写入，避免缓存旧值
+            if self._version == version == self._current_version():
+                self._data[key] = value
+        return value
+
+    def invalidate(self) -> None:
+        """清空本进程缓存并更新版本文件，通知其他进程"""
+        tmp_path = f"{self.version_path}.{os.getpid()}.{threading.get_ident()}"
+        try:
+            with open(tmp_path, 'w') as f:
+                f.write(str(time.time_ns()))
+            os.replace(tmp_path, self.version_path)
+        except OSError as e:
+            logger.error(f"更新配置版本失败: {str(e)}")
+        with self._lock:
+            self._data = {}
+            self._version = None
+
+
+_config_cache = None
+_config_cache_lock = threading.Lock()
+
+
+def get_config_cache() -> ConfigCache:
+    """获取进程内共享的配置缓存"""
+    global _config_cache
+    if _config_cache is None:
+        with _config_cache_lock:
+            if _config_cache is None:
+                _config_cache = ConfigCache(settings.CONFIG_CACHE_VERSION_FILE)
+    return _config_cache
+
+
+def invalidate_config_cache() -> None:
+    get_config_cache().invalidate()
+    logger.info("配置已变更，清空配置缓存")
+
+
+def get_api_config():
+    """最新的启用的 API 配置，不存在时返回 None"""
+    from .models import APIConfig
+    return get_config_cache().get(
+        'api_config',
+        lambda: APIConfig.objects.filter(is_active=True).order_by('-updated_at').first()
+    )
+
+
+def get_api_configs() -> List:
+    """所有启用的 API 配置，按更新时间从新到旧排列"""
+    from .models import APIConfig
+    return get_config_cache().get(
+        'api_configs',
+        lambda: list(APIConfig.objects.filter(is_active=True).order_by('-updated_at'))
+    )
+
+
+def get_default_prompt(prompt_type: str):
+    """指定类型的默认系统提示词，不存在时返回 None"""
+    from .models import SystemPrompt
+    return get_config_cache().get(
+        ('prompt', prompt_type),
+        lambda: SystemPrompt.objects.filter(type=prompt_type, is_default=True).first()
+    )
+
+
+def get_dimension_catalog() -> Dict[str, List[Dict]]:
+    """清洗和标注维度列表，按 order 排序"""
+    from .models import CleaningDimension, LabelingDimension
+
+    def load():
+        fields = ('id', 'name', 'description', 'is_default', 'order')
+        return {
+            'cleaning': list(CleaningDimension.objects.all().order_by('order').values(*fields)),
+            'labeling': list(LabelingDimension.objects.all().order_by('order').values(*fields))
+        }
+
+    return get_config_cache().get('dimensions', load)
+
+
+def get_system_prompt(process_type: str, dimensions: List) -> Optional[str]:
+    """
+    组合后的系统提示词：默认提示词 + 维度说明 + JSON 示例
+    :param dimensions: 维度 ID 列表
+    """
+    selected = {str(d) for d in dimensions}
+
+    def build():
+        prompt = get_default_prompt(process_type)
+        if not prompt:
+            raise ValueError(f"未找到默认的{process_type}提示词")
+
+        catalog = get_dimension_catalog()['cleaning' if process_type == 'cleaning' else 'labeling']
+        dimension_names = [d['name'] for d in sorted(catalog, key=lambda d: d['id']) if str(d['id']) in selected]
+        logger.info(f"使用维度: {', '.join(dimension_names)}")
+
+        # 组合提示词：原始提示词 + 维度说明
+        system_prompt = f"{prompt.content}\n提供的维度: {', '.join(dimension_names)}"
+
+        # 如果有 JSON schema，添加到提示词中
+        if prompt.json_schema:
+            system_prompt = f"{system_prompt}\n使用示例:{prompt.json_schema}"
+
+        logger.info(f"系统提示词:\n{system_prompt}")
+        return system_prompt
+
+    return get_config_cache().get(('system_prompt', process_type, frozenset(selected)), build)
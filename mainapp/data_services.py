@@ -1,184 +1,627 @@
-from typing import List, Dict, Optional, Tuple
+from typing import Callable, Generator, Iterable, List, Dict, NamedTuple, Optional, Tuple, Union
 import json
 import logging
-from .models import SystemPrompt, CleaningDimension, LabelingDimension
-from .ai_services import AIServiceBase
-import re 
+from .models import ProcessingJob, ProcessingChunk, ProcessingResult
+from .config_cache import get_system_prompt, get_dimension_catalog
+from .json_parser import parse_json_response
+from .ai_services import AIServiceBase, AsyncAIServiceBase
+from .chunking import DialogueChunker, chunk_token_budget
+from .packing import (split_records, pack_records, build_pack, store_pack, parse_pack, request_text, record_text,
+                      with_pack_instruction, demux_results, failure_result)
+from .dedup import find_exact_duplicates, find_near_duplicates, dedup_report
+from .local_cleaning import get_local_cleaner, split_dimensions
+from .tokens import count_text_tokens_batch
+from .exceptions import JobLeaseLost
 from datetime import datetime
 import time
+import asyncio
+from asgiref.sync import sync_to_async
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from django.conf import settings
 from django.core.cache import cache
+from django.db import transaction
+from django.utils import timezone
 logger = logging.getLogger(__name__)
 
+MISSING_RECORD_ERROR = '模型未返回该记录'
+
+
+class ContentPlan(NamedTuple):
+    """分块结果"""
+    system_prompt: str  # 实际使用的系统提示词
+    chunks: List[str]
+    packed: bool  # 是否为多记录请求
+    duplicates: Dict[int, int]  # 近似重复块序号 -> 代表块序号（从 1 开始），这些块不单独请求
+    report: Dict  # 去重统计
+
+
 class TextProcessor:
     """文本处理服务"""
     
-    def __init__(self, service: AIServiceBase):
+    def __init__(self, service: Union[AIServiceBase, AsyncAIServiceBase], max_workers: Optional[int] = None,
+                 use_cache: bool = True):
         self.service = service
-        self.max_chunk_size = 3072
+        self.use_cache = use_cache  # 为 False 时本任务跳过响应缓存
         self.request_timeout = 180  # 3分钟超时
         self.cache = {}  # 用于临时存储处理结果
-        logger.info(f"初始化TextProcessor: max_chunk_size={self.max_chunk_size}, timeout={self.request_timeout}")
+        # 并发数：优先使用传入值，其次是多服务路由的总并发数，否则按服务类型读取配置
+        self.max_workers = max(1, max_workers or getattr(service, 'concurrency', None)
+                               or settings.AI_SERVICE_CONCURRENCY.get(getattr(service, 'service_type', ''), 1))
+        logger.info(f"初始化TextProcessor: timeout={self.request_timeout}, max_workers={self.max_workers}")
  
 
-    def _split_text(self, content: str) -> List[str]:
-        """文本分块"""
-        chunks = []
-        sentences = re.split('([。！？.!?])', content)
-        current_chunk = ''
-        
-        for i in range(0, len(sentences), 2):
-            sentence = sentences[i] + (sentences[i + 1] if i + 1 < len(sentences) else '')
-            if len(current_chunk) + len(sentence) <= self.max_chunk_size:
-                current_chunk += sentence
-            else:
-                if current_chunk:
-                    chunks.append(current_chunk)
-                current_chunk = sentence
-                
-        if current_chunk:
-            chunks.append(current_chunk)
-            
-        return chunks
+    def _split_text(self, content: str, system_prompt: str = '', process_type: str = 'cleaning') -> List[str]:
+        """按 token 预算分块，预留系统提示词和输出所需的 token"""
+        chunker = DialogueChunker(self._chunk_token_budget(system_prompt, process_type))
+        return chunker.split(content)
+
+    def _plan_dimensions(self, process_type: str, dimensions: List) -> Tuple[List[str], List]:
+        """
+        清洗任务中可以用本地规则完成的维度名称，以及仍需发送给模型的维度 ID
+        标注任务全部交给模型
+        """
+        if process_type != 'cleaning':
+            return [], dimensions
+        names = {str(d['id']): d['name'] for d in get_dimension_catalog()['cleaning']}
+        split = split_dimensions(names[str(d)] for d in dimensions if str(d) in names)
+        model_names = set(split['model'])
+        model_dimensions = [d for d in dimensions if str(d) not in names or names[str(d)] in model_names]
+        if split['local']:
+            logger.info(f"本地规则处理的维度: {', '.join(split['local'])}")
+        return split['local'], model_dimensions
+
+    def _split_content(self, content: str, system_prompt: str, process_type: str,
+                       local_dimensions: Iterable[str] = (), find_duplicates: bool = True,
+                       records: Optional[List[Dict]] = None) -> ContentPlan:
+        """
+        选择分块方式：JSON 数组/JSONL 的记录打包成多记录请求，其余文本按对话分块
+        分块前先执行本地规则清洗，再做近似重复检测，重复的记录/文本块不单独请求
+        :param records: 已拆分好的记录 [{'id', 'content'}]，传入时忽略 content
+        """
+        config = settings.REQUEST_PACKING
+        cleaner = get_local_cleaner()
+        if records is None and config['ENABLED']:
+            records = split_records(content)
+        if not records:
+            if local_dimensions:
+                content = cleaner.clean(content, local_dimensions)
+            chunks = self._split_text(content, system_prompt, process_type)
+            duplicates = {i + 1: j + 1 for i, j in self._find_duplicates(chunks, process_type).items()} if find_duplicates else {}
+            report = dedup_report(len(chunks), len(duplicates), len(chunks) - len(duplicates), len(duplicates))
+            return ContentPlan(system_prompt, chunks, False, duplicates, report)
+
+        if local_dimensions:
+            contents = cleaner.clean_values([r['content'] for r in records], local_dimensions)
+            records = [dict(r, content=c) for r, c in zip(records, contents)]
+        system_prompt = with_pack_instruction(system_prompt)
+        budget = self._chunk_token_budget(system_prompt, process_type)
+        duplicates = self._find_duplicates([record_text(r) for r in records], process_type) if find_duplicates else {}
+        representatives = [dict(r) for i, r in enumerate(records) if i not in duplicates]
+        packs = pack_records(representatives, budget, config['MAX_RECORDS'])
+        saved_calls = 0
+        if duplicates:
+            # 重复记录挂在代表记录上，结果拆分后复制
+            by_id = {r['id']: r for r in representatives}
+            for i, j in sorted(duplicates.items()):
+                by_id[records[j]['id']].setdefault('duplicates', []).append(records[i]['id'])
+            saved_calls = len(pack_records(records, budget, config['MAX_RECORDS'])) - len(packs)
+        logger.info(f"{len(records)} 条记录打包为 {len(packs)} 个请求")
+        report = dedup_report(len(records), len(duplicates), len(packs), saved_calls)
+        return ContentPlan(system_prompt, [store_pack(pack) for pack in packs], True, {}, report)
 
-    def process_content(self, content: str, process_type: str, dimensions: List[str], processing_key: str) -> Optional[str]:
-        """处理完整内容，支持分块处理"""
+    def _find_duplicates(self, texts: List[str], process_type: str = 'labeling') -> Dict[int, int]:
+        """
+        重复检测（默认只合并规范化后相同的文本），返回 {重复位置: 代表位置}（从 0 开始）
+        清洗结果取决于标点和空白，清洗任务只合并原文完全相同的文本
+        """
+        config = settings.NEAR_DUPLICATE_DETECTION
+        if not config['ENABLED'] or len(texts) < 2:
+            return {}
+        if process_type == 'cleaning':
+            return find_exact_duplicates(texts, normalize=str)
+        return find_near_duplicates(texts, config['MAX_DISTANCE'], config['NGRAM'])
+
+    @staticmethod
+    def _duplicate_members(duplicates: Dict[int, int]) -> Dict[int, List[int]]:
+        """代表块序号 -> 复用其结果的重复块序号"""
+        members = {}
+        for index, representative in sorted(duplicates.items()):
+            members.setdefault(representative, []).append(index)
+        return members
+
+    def _chunk_token_budget(self, system_prompt: str, process_type: str) -> int:
+        """单个文本块的 token 上限"""
+        config = settings.TEXT_CHUNKING
+        service_type = getattr(self.service, 'service_type', '')
+        prompt_tokens = count_text_tokens_batch([system_prompt])[0] if system_prompt else 0
+        budget = chunk_token_budget(
+            context_window=config['CONTEXT_WINDOWS'].get(service_type, config['DEFAULT_CONTEXT_WINDOW']),
+            max_output_tokens=getattr(self.service, 'max_tokens', 3072),
+            prompt_tokens=prompt_tokens,
+            output_ratio=config['OUTPUT_RATIO'].get(process_type, 0.6),
+            safety_margin=config['SAFETY_MARGIN']
+        )
+        logger.info(f"分块预算: {budget} tokens（系统提示词 {prompt_tokens} tokens）")
+        return budget
+
+    def process_content(self, content: str, process_type: str, dimensions: List[str], processing_key: str,
+                        job: Optional[ProcessingJob] = None, records: Optional[List[Dict]] = None,
+                        resume: bool = False) -> Optional[str]:
+        """
+        处理完整内容，支持分块并发处理
+        :param job: 对应的 ProcessingJob，传入时块状态和进度同步写入数据库
+        :param records: 已拆分好的记录 [{'id', 'content'}]，传入时按多记录请求处理，忽略 content
+        :param resume: 任务已有文本块时从检查点继续，只处理未完成的块
+        """
         try:
-            # 获取系统提示词和JSON schema
+            local_dimensions, dimensions = self._plan_dimensions(process_type, dimensions)
+            if local_dimensions and not dimensions:
+                return self._process_locally(content, process_type, local_dimensions, processing_key, job, records)
+            
+            # 获取系统提示词和JSON schema（本地处理的维度不再写入提示词）
             system_prompt = self._get_system_prompt(process_type, dimensions)
             if not system_prompt:
                 raise Exception("获取系统提示词失败")
                 
             logger.info(f"使用系统提示词:\n{system_prompt}")
             
-            # 分割文本
-            chunks = self._split_text(content)
-            total_chunks = len(chunks)
-            logger.info(f"文本已分割为 {total_chunks} 个块")
+            if resume and job and job.chunks.exists():
+                plan, results = self._load_checkpoint(job, system_prompt)
+            else:
+                # 分割文本
+                plan = self._split_content(content, system_prompt, process_type, local_dimensions, records=records)
+                results = {}
+                if job:
+                    self._init_job_chunks(job, plan.chunks, plan.duplicates, plan.report, plan.packed)
+            logger.info(f"文本已分割为 {len(plan.chunks)} 个块，并发数: {self.max_workers}")
             
-            all_results = []
-            for i, chunk in enumerate(chunks, 1):
-                try:
-                    logger.info(f"\n{'='*40} 处理第 {i}/{total_chunks} 个文本块 {'='*40}")
-                    logger.info(f"块大小: {len(chunk)} 字符")
-                    logger.info(f"块内容预览:\n{chunk[:200]}...")
-                    
-                    # 构建消息
-                    messages = [
-                        {"role": "system", "content": system_prompt},
-                        {"role": "user", "content": chunk}
-                    ]
-                    
-                    # 调用AI服务
-                    response = self.service.chat_completion(
-                        messages=messages,
-                        task_type=process_type
-                    )
-                    
-                    if response:
-                        logger.info(f"AI响应预览:\n{response[:200]}...")
-                        result = self._parse_json_response(response)
-                        all_results.append(result)
-                        
-                        # 更新缓存中的进度
-                        progress = (i / total_chunks) * 100
-                        cache.set(processing_key, {
-                            'status': 'processing',
-                            'progress': progress,
-                            'partial_results': all_results,
-                            'timestamp': datetime.now().isoformat()
-                        }, timeout=3600)
-                        
-                        logger.info(f"当前处理进度: {progress:.1f}%")
-                    
-                except Exception as e:
-                    logger.error(f"处理块 {i} 失败: {str(e)}")
-                    continue
-                    
-            if not all_results:
+            # 按块序号保存结果，保证输出顺序与原文一致
+            errors = self._run_chunks(plan, process_type, processing_key, results, job)
+            if not results:
                 raise Exception("没有成功处理任何文本块")
+            if errors:
+                logger.error(f"{len(errors)} 个文本块重试后仍失败: {sorted(errors)}")
                 
-            # 合并所有结果
-            final_result = json.dumps(all_results, ensure_ascii=False, indent=2)
-            logger.info(f"处理完成，最终结果预览:\n{final_result[:200]}...")
+            # 按原文顺序合并所有结果，失败的块在对应位置标注错误
+            final_result = self._merge_results(self._with_failures(plan, results, errors), plan.packed)
             
             # 更新缓存为完成状态
-            cache.set(processing_key, {
-                'status': 'completed',
-                'result': final_result,
-                'timestamp': datetime.now().isoformat()
-            }, timeout=3600)
+            cache.set(processing_key, self._completed_state(final_result), timeout=3600)
             
             return final_result
             
+        except JobLeaseLost:
+            # 任务已由其他 worker 接管，交给 run_job 放弃本次执行
+            raise
         except Exception as e:
             logger.error(f"处理内容失败: {str(e)}")
             return None
 
-    def _get_system_prompt(self, process_type: str, dimensions: List[str]) -> Optional[str]:
-        """获取系统提示词"""
+    def _load_checkpoint(self, job: ProcessingJob, system_prompt: str) -> Tuple[ContentPlan, Dict[int, object]]:
+        """
+        从数据库中的文本块和结果记录恢复任务，已完成的块不再请求
+        文本块内容沿用上次的分块（已包含本地清洗和打包），失败的块重新获得完整的重试次数
+        """
+        chunks = list(job.chunks.order_by('index').values_list('index', 'content', 'duplicate_of'))
+        packed = job.packed
+        if packed:
+            system_prompt = with_pack_instruction(system_prompt)
+        duplicates = {index: duplicate_of for index, _, duplicate_of in chunks if duplicate_of is not None}
+        completed = set(job.chunks.filter(status='completed').values_list('index', flat=True))
+        results = {
+            index: result for index, result in job.results.order_by('id').values_list('index', 'result')
+            if index in completed
+        }
+        job.chunks.exclude(status='completed').update(status='pending', attempts=0, error=None)
+        logger.info(f"从检查点恢复任务 {job.key}: 已完成 {len(results)}/{len(chunks)} 个文本块")
+        plan = ContentPlan(system_prompt, [content for _, content, _ in chunks], packed, duplicates, job.dedup_report)
+        return plan, results
+
+    def _run_chunks(self, plan: ContentPlan, process_type: str, processing_key: str, results: Dict[int, object],
+                    job: Optional[ProcessingJob] = None) -> Dict[int, str]:
+        """
+        并发处理尚未完成的块，结果写入 results
+        主流程结束后，失败的块进入重试队列，按指数退避重试，直到成功或达到最大尝试次数
+        :return: 最终仍失败的块及错误信息
+        """
+        config = settings.CHUNK_RETRIES
+        chunks, total = plan.chunks, len(plan.chunks)
+        members = self._duplicate_members(plan.duplicates)
+        pending = [i for i in range(1, total + 1) if i not in plan.duplicates and i not in results]
+        completed = len(results)
+        errors = {}
+        
+        for attempt in range(1, config['MAX_ATTEMPTS'] + 1):
+            if not pending:
+                break
+            if attempt > 1:
+                delay = min(config['BACKOFF_BASE'] * 2 ** (attempt - 2), config['BACKOFF_MAX'])
+                logger.warning(f"{len(pending)} 个文本块失败，{delay:.0f}s 后进行第 {attempt} 次尝试")
+                time.sleep(delay)
+            final_attempt = attempt == config['MAX_ATTEMPTS']
+            failed = []
+            with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+                # 重试时不读取响应缓存，直接请求服务
+                futures = {
+                    executor.submit(self._process_chunk, i, total, chunks[i - 1], plan.system_prompt, process_type,
+                                    plan.packed, attempt == 1): i
+                    for i in pending
+                }
+                for future in as_completed(futures):
+                    i = futures[future]
+                    try:
+                        result = future.result()
+                        error = None if result is not None else '未获得AI响应'
+                    except Exception as e:
+                        logger.error(f"处理块 {i} 失败（第 {attempt} 次）: {str(e)}")
+                        result, error = None, str(e)
+                    if result is None:
+                        failed.append(i)
+                        errors[i] = error
+                    else:
+                        errors.pop(i, None)
+                    # 近似重复块直接复用代表块的结果；等待重试的块不计入进度
+                    for index in [i] + members.get(i, []):
+                        if result is not None or final_attempt:
+                            completed += 1
+                        if job:
+                            try:
+                                self._record_job_chunk(job, index, result, error, completed, total, attempt,
+                                                       retrying=result is None and not final_attempt)
+                            except JobLeaseLost:
+                                executor.shutdown(wait=False, cancel_futures=True)
+                                raise
+                        if result is not None:
+                            results[index] = result
+                    if result is None:
+                        continue
+                    
+                    # 更新缓存中的进度（只记录计数，结果由任务的结果记录提供）
+                    cache.set(processing_key, self._progress_state(completed, total), timeout=3600)
+            pending = failed
+        
+        for i in list(errors):
+            for index in members.get(i, []):
+                errors[index] = errors[i]
+        return errors
+
+    def _with_failures(self, plan: ContentPlan, results: Dict[int, object], errors: Dict[int, str]) -> Dict[int, object]:
+        """在失败块的位置补上错误标记，避免最终结果中出现无提示的缺口"""
+        if not errors:
+            return results
+        merged = dict(results)
+        for index, error in errors.items():
+            merged[index] = failure_result(index, plan.chunks[index - 1], plan.packed, error)
+        return merged
+
+    async def aprocess_content(self, content: str, process_type: str, dimensions: List[str], processing_key: str) -> Optional[str]:
+        """异步处理完整内容，service 需为 AsyncAIServiceBase 实例"""
         try:
-            # 获取默认提示词
-            prompt = SystemPrompt.objects.get(type=process_type, is_default=True)
+            local_dimensions, dimensions = await sync_to_async(self._plan_dimensions)(process_type, dimensions)
+            if local_dimensions and not dimensions:
+                return await sync_to_async(self._process_locally)(content, process_type, local_dimensions, processing_key)
             
-            # 获取维度名称
-            if process_type == 'cleaning':
-                dimension_objects = CleaningDimension.objects.filter(id__in=dimensions)
-            else:
-                dimension_objects = LabelingDimension.objects.filter(id__in=dimensions)
-                
-            dimension_names = [d.name for d in dimension_objects]
-            logger.info(f"使用维度: {', '.join(dimension_names)}")
+            system_prompt = await sync_to_async(self._get_system_prompt)(process_type, dimensions)
+            if not system_prompt:
+                raise Exception("获取系统提示词失败")
             
-            # 组合提示词：原始提示词 + 维度说明
-            system_prompt = f"{prompt.content}\n提供的维度: {', '.join(dimension_names)}"
+            plan = self._split_content(content, system_prompt, process_type, local_dimensions)
+            system_prompt, chunks = plan.system_prompt, plan.chunks
+            total_chunks = len(chunks)
+            logger.info(f"文本已分割为 {total_chunks} 个块，异步并发数: {self.max_workers}")
+            members = self._duplicate_members(plan.duplicates)
+            config = settings.CHUNK_RETRIES
             
-            # 如果有 JSON schema，添加到提示词中
-            if prompt.json_schema:
-                system_prompt = f"{system_prompt}\n使用示例:{prompt.json_schema}"
-                
-            logger.info(f"系统提示词:\n{system_prompt}")
-            return system_prompt
+            semaphore = asyncio.Semaphore(self.max_workers)
+            
+            async def run_chunk(i: int, chunk: str, use_cache: bool):
+                async with semaphore:
+                    messages = [
+                        {"role": "system", "content": system_prompt},
+                        {"role": "user", "content": request_text(chunk)}
+                    ]
+                    response = await self.service.chat_completion(
+                        messages=messages,
+                        task_type=process_type,
+                        use_cache=self.use_cache and use_cache,
+                        cacheable=self._cacheable(chunk, plan.packed)
+                    )
+                    if not response:
+                        return None
+                    records = parse_pack(chunk) if plan.packed else None
+                    if records is None:
+                        return self._parse_json_response(response)
+                    return await self._ademux_pack(i, records, response, system_prompt, process_type)
+            
+            results = {}
+            errors = {}
+            completed = 0
+            pending = [i for i in range(1, total_chunks + 1) if i not in plan.duplicates]
+            for attempt in range(1, config['MAX_ATTEMPTS'] + 1):
+                if not pending:
+                    break
+                if attempt > 1:
+                    delay = min(config['BACKOFF_BASE'] * 2 ** (attempt - 2), config['BACKOFF_MAX'])
+                    logger.warning(f"{len(pending)} 个文本块失败，{delay:.0f}s 后进行第 {attempt} 次尝试")
+                    await asyncio.sleep(delay)
+                tasks = {asyncio.create_task(run_chunk(i, chunks[i - 1], attempt == 1)): i for i in pending}
+                failed = []
+                await asyncio.gather(*tasks, return_exceptions=True)
+                for task, i in tasks.items():
+                    error = task.exception()
+                    result = None if error else task.result()
+                    if result is None:
+                        failed.append(i)
+                        errors[i] = str(error) if error else '未获得AI响应'
+                        logger.error(f"块 {i} 处理失败（第 {attempt} 次）: {errors[i]}")
+                        continue
+                    errors.pop(i, None)
+                    for index in [i] + members.get(i, []):
+                        results[index] = result
+                    completed += 1 + len(members.get(i, []))
+                await cache.aset(processing_key, self._progress_state(completed, total_chunks), timeout=3600)
+                pending = failed
+            
+            if not results:
+                raise Exception("没有成功处理任何文本块")
+            for i in list(errors):
+                for index in members.get(i, []):
+                    errors[index] = errors[i]
+            
+            final_result = self._merge_results(self._with_failures(plan, results, errors), plan.packed)
+            await cache.aset(processing_key, self._completed_state(final_result), timeout=3600)
+            return final_result
             
         except Exception as e:
-            logger.error(f"获取系统提示词失败: {str(e)}")
+            logger.error(f"异步处理内容失败: {str(e)}")
             return None
 
-    def _parse_json_response(self, response: str) -> Dict:
-        """解析 AI 返回的响应"""
+    def _process_locally(self, content: str, process_type: str, local_dimensions: List[str], processing_key: str,
+                         job: Optional[ProcessingJob] = None, records: Optional[List[Dict]] = None) -> Optional[str]:
+        """所选维度都能用本地规则完成时直接清洗，不调用模型；输出格式与模型的清洗结果一致"""
+        plan = self._split_content(content, '', process_type, find_duplicates=False, records=records)
+        cleaner = get_local_cleaner()
+        if plan.packed:
+            results = {}
+            for i, chunk in enumerate(plan.chunks, 1):
+                records = parse_pack(chunk)
+                outputs = cleaner.clean_values([r['content'] for r in records], local_dimensions)
+                results[i] = [
+                    {'id': r['id'], 'input': r['content'], 'output': output} for r, output in zip(records, outputs)
+                ]
+        else:
+            outputs = cleaner.clean_texts(plan.chunks, local_dimensions)
+            results = {
+                i: {'input': chunk, 'output': output}
+                for i, (chunk, output) in enumerate(zip(plan.chunks, outputs), 1)
+            }
+        if not results:
+            raise Exception("没有可处理的文本")
+        logger.info(f"本地规则完成清洗: {len(plan.chunks)} 个文本块")
+
+        if job:
+            self._init_job_chunks(job, plan.chunks, report=plan.report, packed=plan.packed)
+            with transaction.atomic():
+                job.chunks.update(status='completed', updated_at=timezone.now())
+                ProcessingResult.objects.bulk_create([
+                    ProcessingResult(job=job, index=i, result=result) for i, result in results.items()
+                ], batch_size=500)
+                job.completed_chunks = len(plan.chunks)
+                job.progress = 100
+                job.save_owned(['completed_chunks', 'progress'])
+
+        final_result = self._merge_results(results, plan.packed)
+        cache.set(processing_key, self._completed_state(final_result), timeout=3600)
+        return final_result
+
+    def _init_job_chunks(self, job: ProcessingJob, chunks: List[str], duplicates: Optional[Dict[int, int]] = None,
+                         report: Optional[Dict] = None, packed: bool = False) -> None:
+        """为任务重建文本块记录，同时保存是否为多记录请求，恢复和收集批处理结果时不再从块内容推断"""
+        duplicates = duplicates or {}
+        with transaction.atomic():
+            job.chunks.all().delete()
+            job.results.all().delete()
+            ProcessingChunk.objects.bulk_create([
+                ProcessingChunk(job=job, index=i, content=chunk, duplicate_of=duplicates.get(i))
+                for i, chunk in enumerate(chunks, 1)
+            ], batch_size=500)
+            job.total_chunks = len(chunks)
+            job.completed_chunks = 0
+            job.progress = 0
+            job.dedup_report = report or {}
+            job.packed = packed
+            job.save_owned(['total_chunks', 'completed_chunks', 'progress', 'dedup_report', 'packed'])
+
+    def _record_job_chunk(self, job: ProcessingJob, index: int, result, error: Optional[str],
+                          completed: int, total: int, attempts: int = 1, retrying: bool = False) -> None:
+        """
+        保存单个块的状态并追加结果记录，同时更新任务进度
+        先以 worker_id 为条件更新任务，任务已被其他 worker 接管时抛出 JobLeaseLost，块状态和结果都不写入
+        """
+        if result is not None:
+            status = 'completed'
+        else:
+            status = 'retrying' if retrying else 'failed'
+        with transaction.atomic():
+            job.completed_chunks = completed
+            job.progress = (completed / total) * 100
+            job.save_owned(['completed_chunks', 'progress'])
+            ProcessingChunk.objects.filter(job=job, index=index).update(
+                status=status,
+                error=error,
+                attempts=attempts,
+                updated_at=job.updated_at
+            )
+            if result is not None:
+                ProcessingResult.objects.create(job=job, index=index, result=result)
+
+    def _progress_state(self, completed: int, total: int) -> Dict:
+        """构建处理中的缓存状态，只包含进度计数"""
+        progress = (completed / total) * 100
+        logger.info(f"当前处理进度: {progress:.1f}%")
+        return {
+            'status': 'processing',
+            'progress': progress,
+            'completed_chunks': completed,
+            'total_chunks': total,
+            'timestamp': datetime.now().isoformat()
+        }
+
+    def _completed_state(self, final_result: str) -> Dict:
+        """构建完成状态"""
+        return {
+            'status': 'completed',
+            'result': final_result,
+            'timestamp': datetime.now().isoformat()
+        }
+
+    def _merge_results(self, results: Dict[int, object], packed: bool = False) -> str:
+        """按块序号合并结果；多记录请求的结果展开为按记录排列的列表"""
+        if packed:
+            merged = [item for k in sorted(results) for item in results[k]]
+        else:
+            merged = [results[k] for k in sorted(results)]
+        final_result = json.dumps(merged, ensure_ascii=False, indent=2)
+        logger.info(f"处理完成，最终结果预览:\n{final_result[:200]}...")
+        return final_result
+
+    def _process_chunk(self, index: int, total: int, chunk: str, system_prompt: str, process_type: str,
+                       packed: bool = False, use_cache: bool = True) -> Optional[object]:
+        """
+        处理单个文本块（在线程池中执行）
+        :param use_cache: 为 False 时不读取响应缓存（重试时使用，避免再次拿到缓存中的同一个响应）
+        """
+        logger.info(f"\n{'='*40} 处理第 {index}/{total} 个文本块 {'='*40}")
+        logger.info(f"块大小: {len(chunk)} 字符")
+        logger.info(f"块内容预览:\n{chunk[:200]}...")
+        
+        # 构建消息
+        messages = [
+            {"role": "system", "content": system_prompt},
+            {"role": "user", "content": request_text(chunk)}
+        ]
+        
+        # 调用AI服务
+        response = self.service.chat_completion(
+            messages=messages,
+            task_type=process_type,
+            use_cache=self.use_cache and use_cache,
+            cacheable=self._cacheable(chunk, packed)
+        )
+        
+        if not response:
+            logger.error(f"块 {index} 未获得AI响应")
+            return None
+            
+        logger.info(f"块 {index} AI响应预览:\n{response[:200]}...")
+        return self._chunk_result(index, chunk, response, system_prompt, process_type, packed)
+
+    def _chunk_result(self, index: int, chunk: str, response: str, system_prompt: str, process_type: str,
+                      packed: bool = False) -> Optional[object]:
+        """解析文本块的响应，多记录请求按 id 拆分并重试遗漏的记录"""
+        records = parse_pack(chunk) if packed else None
+        if records is None:
+            return self._parse_json_response(response)
+        return self._demux_pack(index, records, response, system_prompt, process_type)
+
+    @staticmethod
+    def _cacheable(chunk: str, packed: bool) -> Callable[[str], bool]:
+        """响应能否写入缓存：普通文本块需能解析出 JSON，多记录请求需至少拆分出一条记录"""
+        records = parse_pack(chunk) if packed else None
+        if records is None:
+            return lambda response: parse_json_response(response).data is not None
+        ids = [r['id'] for r in records]
+        return lambda response: bool(demux_results(parse_json_response(response).data, ids))
+
+    def _pack_messages(self, records: List[Dict], system_prompt: str) -> List[Dict]:
+        return [
+            {"role": "system", "content": system_prompt},
+            {"role": "user", "content": build_pack(records)}
+        ]
+
+    def _demux_steps(self, index: int, records: List[Dict], response: str,
+                     system_prompt: str) -> Generator[List[Dict], Optional[str], Optional[List[Dict]]]:
+        """
+        按 id 拆分多记录响应的公共流程，同步和异步版本共用
+        每次 yield 只包含遗漏记录的请求消息，由调用方发送（不读写响应缓存）后把响应 send 回来；结束时返回记录结果
+        """
+        found = demux_results(self._parse_json_response(response), [r['id'] for r in records])
+        missing = [r for r in records if r['id'] not in found]
+        for attempt in range(1, settings.REQUEST_PACKING['MAX_RETRIES'] + 1):
+            if not missing:
+                break
+            logger.warning(f"块 {index} 遗漏 {len(missing)} 条记录，第 {attempt} 次重试: {[r['id'] for r in missing]}")
+            response = yield self._pack_messages(missing, system_prompt)
+            if response:
+                found.update(demux_results(self._parse_json_response(response), [r['id'] for r in missing]))
+            missing = [r for r in missing if r['id'] not in found]
+        return self._pack_result(index, records, found)
+
+    def _demux_pack(self, index: int, records: List[Dict], response: str, system_prompt: str,
+                    process_type: str) -> Optional[List[Dict]]:
+        """按 id 拆分多记录响应，只把遗漏的记录重新打包请求"""
+        steps = self._demux_steps(index, records, response, system_prompt)
         try:
-            # 首先尝试直接解析完整 JSON
-            return json.loads(response)
-        except json.JSONDecodeError:
-            try:
-                # 如果失败，尝试清理响应中的 markdown 标记
-                cleaned_response = response.strip()
-                if cleaned_response.startswith('```json'):
-                    cleaned_response = cleaned_response[7:]
-                if cleaned_response.endswith('```'):
-                    cleaned_response = cleaned_response[:-3]
-                cleaned_response = cleaned_response.strip()
-                
-                # 尝试解析清理后的响应
-                return json.loads(cleaned_response)
-            except json.JSONDecodeError:
-                try:
-                    # 如果还是失败，尝试将多个 JSON 对象合并为数组
-                    results = []
-                    for line in cleaned_response.split('\n'):
-                        line = line.strip()
-                        if line and not line.startswith('{'):
-                            continue
-                        try:
-                            results.append(json.loads(line))
-                        except:
-                            continue
-                    if results:
-                        return results
-                    raise ValueError("无法解析任何 JSON 对象")
-                except Exception as e:
-                    logger.error(f"JSON 解析失败直接返回结果: {str(e)}")
-                    return response
-                    raise
+            messages = next(steps)
+            while True:
+                messages = steps.send(self.service.chat_completion(
+                    messages=messages,
+                    task_type=process_type,
+                    use_cache=False
+                ))
+        except StopIteration as done:
+            return done.value
+
+    async def _ademux_pack(self, index: int, records: List[Dict], response: str, system_prompt: str,
+                           process_type: str) -> Optional[List[Dict]]:
+        """_demux_pack 的异步版本"""
+        steps = self._demux_steps(index, records, response, system_prompt)
+        try:
+            messages = next(steps)
+            while True:
+                messages = steps.send(await self.service.chat_completion(
+                    messages=messages,
+                    task_type=process_type,
+                    use_cache=False
+                ))
+        except StopIteration as done:
+            return done.value
+
+    def _pack_result(self, index: int, records: List[Dict], found: Dict[str, Dict]) -> Optional[List[Dict]]:
+        """
+        按输入顺序排列记录结果，重试后仍遗漏的记录标记错误；全部遗漏时视为块失败
+        近似重复的记录紧跟在代表记录之后，复制代表记录的结果并标注 duplicate_of
+        """
+        if not found:
+            return None
+        missing = [r['id'] for r in records if r['id'] not in found]
+        if missing:
+            logger.error(f"块 {index} 重试后仍有 {len(missing)} 条记录没有结果: {missing}")
+        results = []
+        for record in records:
+            result = found.get(record['id'], {'id': record['id'], 'error': MISSING_RECORD_ERROR})
+            results.append(result)
+            for duplicate_id in record.get('duplicates', []):
+                results.append(dict(result, id=duplicate_id, duplicate_of=record['id']))
+        return results
+
+    def _get_system_prompt(self, process_type: str, dimensions: List[str]) -> Optional[str]:
+        """获取系统提示词（来自配置缓存）"""
+        try:
+            return get_system_prompt(process_type, dimensions)
+        except Exception as e:
+            logger.error(f"获取系统提示词失败: {str(e)}")
+            return None
+
+    def _parse_json_response(self, response: str) -> Union[Dict, List, str]:
+        """解析 AI 返回的响应，无法解析时直接返回原始文本"""
+        result = parse_json_response(response)
+        for diagnostic in result.diagnostics:
+            logger.warning(f"JSON 解析: {diagnostic}")
+        if result.data is None:
+            logger.error("JSON 解析失败直接返回结果")
+            return response
+        return result.data
 
     def get_cached_result(self, processing_key: str) -> Optional[Dict]:
         """获取缓存的处理结果"""
@@ -0,0 +1,178 @@
+import hashlib
+import json
+import logging
+from typing import Any, Dict, List, Optional, Tuple
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Count, Exists, Max, OuterRef, QuerySet
+from django.utils import timezone
+from .models import Dataset, Record, RecordResult, ProcessingJob, ProcessingResult, UploadedFile
+from .chunking import DialogueChunker
+from .packing import split_records
+from .data_services import TextProcessor
+
+logger = logging.getLogger(__name__)
+
+
+def dimensions_key(dimensions: List) -> str:
+    """维度组合的规范表示：排序后的 ID，以逗号分隔"""
+    ids = {str(d) for d in dimensions}
+    return ','.join(sorted(ids, key=lambda d: (not d.isdigit(), int(d) if d.isdigit() else 0, d)))
+
+
+def record_hash(content: Any) -> str:
+    text = content if isinstance(content, str) else json.dumps(content, ensure_ascii=False, sort_keys=True)
+    return hashlib.sha256(text.encode('utf-8')).hexdigest()
+
+
+def parse_dataset_content(content: str) -> List[Any]:
+    """JSON 数组/JSONL 的每个元素为一条记录；其他文本按对话分块，每块一条记录"""
+    records = split_records(content)
+    if records is not None:
+        return [r['content'] for r in records]
+    return DialogueChunker(settings.DATASETS['TEXT_RECORD_TOKENS']).split(content)
+
+
+def import_records(dataset: Dataset, content: str) -> int:
+    """
+    追加记录，内容相同的记录只保存一次
+    :return: 新增的记录数
+    """
+    items = parse_dataset_content(content)
+    start = (dataset.records.aggregate(last=Max('position'))['last'] or 0) + 1
+    before = dataset.record_count
+    Record.objects.bulk_create([
+        Record(dataset=dataset, position=start + i, content_hash=record_hash(item), content=item)
+        for i, item in enumerate(items)
+    ], batch_size=1000, ignore_conflicts=True)
+    dataset.record_count = dataset.records.count()
+    dataset.save(update_fields=['record_count', 'updated_at'])
+    added = dataset.record_count - before
+    logger.info(f"数据集 {dataset.id} 导入 {len(items)} 条记录，新增 {added} 条")
+    return added
+
+
+def create_dataset(name: str, content: str, upload: Optional[UploadedFile] = None) -> Tuple[Dataset, int]:
+    dataset = Dataset.objects.create(name=name, upload=upload)
+    return dataset, import_records(dataset, content)
+
+
+def pending_records(dataset: Dataset, process_type: str, key: str) -> QuerySet:
+    """该处理类型和维度组合下尚未完成的记录（没有结果、待处理或失败）"""
+    done = RecordResult.objects.filter(
+        record=OuterRef('pk'), process_type=process_type, dimensions_key=key, status='done'
+    )
+    return dataset.records.filter(~Exists(done))
+
+
+def dataset_status(dataset: Dataset) -> Dict:
+    """数据集记录数以及各处理类型/维度组合的完成情况"""
+    rows = RecordResult.objects.filter(record__dataset=dataset).values(
+        'process_type', 'dimensions_key', 'status'
+    ).annotate(count=Count('id')).order_by('process_type', 'dimensions_key')
+    runs = {}
+    for row in rows:
+        run = runs.setdefault((row['process_type'], row['dimensions_key']), {
+            'process_type': row['process_type'],
+            'dimensions': row['dimensions_key'].split(',') if row['dimensions_key'] else [],
+            'done': 0,
+            'failed': 0,
+            'pending': 0,
+        })
+        run[row['status']] = row['count']
+    for run in runs.values():
+        run['remaining'] = dataset.record_count - run['done']
+    return {
+        'dataset_id': dataset.id,
+        'name': dataset.name,
+        'record_count': dataset.record_count,
+        'runs': list(runs.values()),
+    }
+
+
+def _save_round(job: ProcessingJob, key: str, batch: List[Record], result: Optional[str]) -> Tuple[List[Dict], int]:
+    """把一轮的结果写入记录状态，返回 (结果列表, 成功数)"""
+    items = json.loads(result) if result else []
+    by_id = {str(item['id']): item for item in items if isinstance(item, dict) and 'id' in item}
+    now = timezone.now()
+    rows, done = [], 0
+    for record in batch:
+        item = by_id.get(str(record.id))
+        # 带 error 的条目是失败标记（遗漏的记录或整个请求失败），不能当作结果保存
+        if item is not None and 'error' not in item:
+            rows.append(RecordResult(record=record, process_type=job.process_type, dimensions_key=key,
+                                     status='done', result=item, error=None, job=job, updated_at=now))
+            done += 1
+        else:
+            error = item.get('error') if item else '处理失败'
+            rows.append(RecordResult(record=record, process_type=job.process_type, dimensions_key=key,
+                                     status='failed', result=None, error=error, job=job, updated_at=now))
+    RecordResult.objects.bulk_create(
+        rows, batch_size=500, update_conflicts=True,
+        unique_fields=['record', 'process_type', 'dimensions_key'],
+        update_fields=['status', 'result', 'error', 'job', 'updated_at']
+    )
+    return items, done
+
+
+def process_dataset_job(job: ProcessingJob, processor: TextProcessor) -> str:
+    """
+    按轮处理数据集中尚未完成的记录
+    每轮结束后保存记录状态、追加任务结果并更新进度，任务中断后重新运行会跳过已完成的记录
+    :return: 处理摘要（JSON）
+    """
+    config = settings.DATASETS
+    dataset = job.dataset
+    key = dimensions_key(job.dimensions)
+    pending = pending_records(dataset, job.process_type, key)
+    total = pending.count()
+    logger.info(f"数据集 {dataset.id} 待处理 {total}/{dataset.record_count} 条记录: {job.process_type}[{key}]")
+
+    job.results.all().delete()
+    job.total_chunks = total
+    job.completed_chunks = 0
+    job.progress = 0 if total else 100
+    job.save_owned(['total_chunks', 'completed_chunks', 'progress'])
+
+    last_id, rounds, completed, succeeded, failed_rounds = 0, 0, 0, 0, 0
+    while True:
+        batch = list(pending.filter(id__gt=last_id).order_by('id')[:config['RECORDS_PER_ROUND']])
+        if not batch:
+            break
+        last_id = batch[-1].id
+        rounds += 1
+
+        result = processor.process_content(
+            content='',
+            process_type=job.process_type,
+            dimensions=job.dimensions,
+            processing_key=job.key,
+            records=[{'id': str(r.id), 'content': r.content} for r in batch]
+        )
+        completed += len(batch)
+        # 先以 worker_id 为条件更新进度，任务已被其他 worker 接管时本轮结果不写入
+        with transaction.atomic():
+            job.completed_chunks = completed
+            job.progress = completed / total * 100
+            job.save_owned(['completed_chunks', 'progress'])
+            items, done = _save_round(job, key, batch, result)
+            if items:
+                ProcessingResult.objects.create(job=job, index=rounds, result=items)
+        succeeded += done
+
+        failed_rounds = failed_rounds + 1 if not done else 0
+        if failed_rounds >= config['MAX_FAILED_ROUNDS']:
+            raise Exception(f"连续 {failed_rounds} 轮处理失败，已停止；已完成 {succeeded} 条，剩余记录可重新运行")
+
+    summary = {
+        'dataset_id': dataset.id,
+        'process_type': job.process_type,
+        'dimensions': key,
+        'record_count': dataset.record_count,
+        'skipped': dataset.record_count - total,
+        'processed': completed,
+        'done': succeeded,
+        'failed': completed - succeeded,
+    }
+    logger.info(f"数据集 {dataset.id} 处理完成: {summary}")
+    return json.dumps(summary, ensure_ascii=False)
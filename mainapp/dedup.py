@@ -0,0 +1,140 @@
+import hashlib
+import logging
+import re
+from collections import Counter, defaultdict
+from typing import Callable, Dict, List
+
+logger = logging.getLogger(__name__)
+
+# 计算指纹前去掉空白和标点，只保留文字和数字
+_NOISE_PATTERN = re.compile(r'[\W_]+', re.UNICODE)
+FINGERPRINT_BITS = 64
+
+
+def normalize_text(text: str) -> str:
+    return _NOISE_PATTERN.sub('', text).lower()
+
+
+# 累加时每一位占 32 位的整数分段，一次大整数加法同时完成 64 位的计数
+_LANE_BITS = 32
+_LANE_MASK = (1 << _LANE_BITS) - 1
+_BYTE_LANES = [sum((byte >> bit & 1) << (bit * _LANE_BITS) for bit in range(8)) for byte in range(256)]
+
+
+def simhash(text: str, ngram: int = 3) -> int:
+    """
+    64 位 SimHash 指纹，特征为规范化文本的字符 n-gram，按出现次数加权
+    每个特征的哈希按位展开后与权重相乘累加，最后某一位的计数超过总权重一半即置 1
+    """
+    normalized = normalize_text(text)
+    if not normalized:
+        return 0
+    features = Counter(
+        normalized[i:i + ngram] for i in range(max(1, len(normalized) - ngram + 1))
+    )
+
+    total, counts = 0, 0
+    for feature, weight in features.items():
+        digest = hashlib.blake2b(feature.encode('utf-8'), digest_size=FINGERPRINT_BITS // 8).digest()
+        expanded = 0
+        for position, byte in enumerate(digest):
+            expanded |= _BYTE_LANES[byte] << (position * 8 * _LANE_BITS)
+        counts += expanded * weight
+        total += weight
+
+    fingerprint = 0
+    for bit in range(FINGERPRINT_BITS):
+        if 2 * (counts >> (bit * _LANE_BITS) & _LANE_MASK) > total:
+            fingerprint |= 1 << bit
+    return fingerprint
+
+
+def hamming_distance(a: int, b: int) -> int:
+    return (a ^ b).bit_count()
+
+
+class SimHashIndex:
+    """
+    SimHash 的 LSH 索引
+    指纹分成 max_distance + 1 段，汉明距离不超过 max_distance 的两个指纹至少有一段完全相同，
+    因此只需比较同段桶中的候选
+    """
+
+    def __init__(self, max_distance: int = 3):
+        self.max_distance = max_distance
+        self.bands = max_distance + 1
+        self.band_bits = -(-FINGERPRINT_BITS // self.bands)
+        self._buckets = defaultdict(list)
+        self._fingerprints: Dict[int, int] = {}
+
+    def _band_keys(self, fingerprint: int) -> List[tuple]:
+        mask = (1 << self.band_bits) - 1
+        return [(band, fingerprint >> (band * self.band_bits) & mask) for band in range(self.bands)]
+
+    def find(self, fingerprint: int):
+        """返回距离最近的已索引条目，没有足够相近的条目时返回 None"""
+        best, best_distance = None, self.max_distance
+        seen = set()
+        for key in self._band_keys(fingerprint):
+            for item in self._buckets.get(key, ()):
+                if item in seen:
+                    continue
+                seen.add(item)
+                distance = hamming_distance(fingerprint, self._fingerprints[item])
+                if distance <= best_distance and (best is None or (distance, item) < (best_distance, best)):
+                    best, best_distance = item, distance
+        return best
+
+    def add(self, item, fingerprint: int) -> None:
+        self._fingerprints[item] = fingerprint
+        for key in self._band_keys(fingerprint):
+            self._buckets[key].append(item)
+
+
+def find_exact_duplicates(texts: List[str], normalize: Callable[[str], str] = normalize_text) -> Dict[int, int]:
+    """
+    找出规范化后完全相同的文本，第一次出现的文本作为代表
+    :param normalize: 比较前的规范化方式，传入 str 时按原文比较
+    :return: {重复文本的位置: 代表文本的位置}，位置从 0 开始
+    """
+    first_seen: Dict[str, int] = {}
+    duplicates = {}
+    for position, text in enumerate(texts):
+        representative = first_seen.setdefault(normalize(text), position)
+        if representative != position:
+            duplicates[position] = representative
+    return duplicates
+
+
+def find_near_duplicates(texts: List[str], max_distance: int = 0, ngram: int = 3) -> Dict[int, int]:
+    """
+    找出近似重复的文本
+    max_distance 为 0 时比较规范化后的文本本身（指纹相同不代表文本相同），否则按 SimHash 汉明距离判断
+    按顺序处理，每条文本与已有的代表文本比较，第一次出现的文本作为代表
+    :return: {重复文本的位置: 代表文本的位置}，位置从 0 开始
+    """
+    if max_distance <= 0:
+        return find_exact_duplicates(texts)
+    index = SimHashIndex(max_distance)
+    duplicates = {}
+    for position, text in enumerate(texts):
+        fingerprint = simhash(text, ngram)
+        representative = index.find(fingerprint)
+        if representative is not None:
+            duplicates[position] = representative
+        else:
+            index.add(position, fingerprint)
+    return duplicates
+
+
+def dedup_report(units: int, duplicates: int, requests: int, saved_calls: int) -> Dict:
+    """去重统计：输入条数、重复条数、实际请求数和节省的请求数"""
+    report = {
+        'units': units,
+        'duplicates': duplicates,
+        'requests': requests,
+        'saved_calls': saved_calls,
+    }
+    if duplicates:
+        logger.info(f"近似重复检测: {units} 条中 {duplicates} 条重复，实际请求 {requests} 次，节省 {saved_calls} 次")
+    return report
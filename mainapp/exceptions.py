@@ -13,3 +13,7 @@ class AIServiceError(AIWebException):
 class SecurityError(AIWebException):
     """安全相关错误"""
     pass
+
+class JobLeaseLost(AIWebException):
+    """任务已超时重新排队或被其他 worker 接管，当前 worker 不能再写入"""
+    pass
@@ -0,0 +1,156 @@
+import csv
+import heapq
+import json
+import zlib
+from datetime import datetime
+from operator import itemgetter
+from typing import Iterable, Iterator, List, Optional
+from django.db.models import QuerySet
+from .models import ChatMessage, Dataset, ProcessingJob, RecordResult
+from .packing import failure_result
+
+EXPORT_FORMATS = {
+    'ndjson': ('application/x-ndjson', 'jsonl'),
+    'csv': ('text/csv', 'csv'),
+    'json': ('application/json', 'json'),
+}
+
+
+class _Echo:
+    """csv.writer 的写入目标，直接返回写入的行，便于流式输出"""
+
+    def write(self, value: str) -> str:
+        return value
+
+
+def _iter_job_records(job: ProcessingJob) -> Iterator[tuple]:
+    """
+    按块序号逐条读取结果记录，一个块的结果可能包含多条记录
+    失败块没有结果，在其位置输出与最终结果相同的错误标记，避免导出中出现无提示的缺口
+    """
+    results = job.results.order_by('index').values_list('index', 'result').iterator(chunk_size=500)
+    failures = (
+        (index, failure_result(index, content, job.packed, error))
+        for index, content, error in job.chunks.filter(status='failed').order_by('index').values_list(
+            'index', 'content', 'error').iterator(chunk_size=500)
+    )
+    for index, result in heapq.merge(results, failures, key=itemgetter(0)):
+        for record in (result if isinstance(result, list) else [result]):
+            yield index, record
+
+
+def iter_results_ndjson(job: ProcessingJob) -> Iterator[str]:
+    """每行一条记录"""
+    for _, record in _iter_job_records(job):
+        yield json.dumps(record, ensure_ascii=False) + '\n'
+
+
+def _csv_value(value) -> str:
+    if value is None:
+        return ''
+    if isinstance(value, (dict, list)):
+        return json.dumps(value, ensure_ascii=False)
+    return str(value)
+
+
+def iter_results_csv(job: ProcessingJob) -> Iterator[str]:
+    """
+    CSV 导出，列名取第一条对象记录的字段
+    后续记录中多出的字段放入 extra 列，非对象记录放入 output 列
+    """
+    writer = csv.writer(_Echo())
+    columns: Optional[List[str]] = None
+    yield '\ufeff'  # 便于 Excel 识别 UTF-8
+    for index, record in _iter_job_records(job):
+        if not isinstance(record, dict):
+            record = {'output': record}
+        if columns is None:
+            columns = list(record.keys())
+            yield writer.writerow(['chunk'] + columns + ['extra'])
+        extra = {k: v for k, v in record.items() if k not in columns}
+        yield writer.writerow(
+            [index] + [_csv_value(record.get(c)) for c in columns] + [_csv_value(extra) if extra else '']
+        )
+
+
+def iter_results_json(job: ProcessingJob) -> Iterator[str]:
+    """格式化的 JSON 文档：任务信息 + records 数组，逐条写出"""
+    header = json.dumps({
+        'timestamp': job.updated_at.isoformat(),
+        'processing_key': job.key,
+        'process_type': job.process_type,
+        'dimensions': job.dimensions,
+    }, ensure_ascii=False, indent=2)
+    yield header[:-2] + ',\n  "records": ['
+    first = True
+    for _, record in _iter_job_records(job):
+        item = json.dumps(record, ensure_ascii=False, indent=2).replace('\n', '\n    ')
+        yield ('\n    ' if first else ',\n    ') + item
+        first = False
+    yield ']\n}\n' if first else '\n  ]\n}\n'
+
+
+def iter_job_export(job: ProcessingJob, export_format: str) -> Iterator[str]:
+    """按格式返回导出内容的迭代器"""
+    if export_format == 'ndjson':
+        return iter_results_ndjson(job)
+    if export_format == 'csv':
+        return iter_results_csv(job)
+    if export_format == 'json':
+        return iter_results_json(job)
+    raise ValueError(f"不支持的导出格式: {export_format}")
+
+
+def chat_export_queryset(session_ids: Optional[List[str]] = None, role: Optional[str] = None,
+                         status: Optional[str] = None, start: Optional[datetime] = None,
+                         end: Optional[datetime] = None) -> QuerySet:
+    """按会话、角色、状态和时间范围筛选聊天消息，不传条件时导出全部会话"""
+    messages = ChatMessage.objects.all()
+    if session_ids:
+        messages = messages.filter(session_id__in=session_ids)
+    if role:
+        messages = messages.filter(role=role)
+    if status:
+        messages = messages.filter(status=status)
+    if start:
+        messages = messages.filter(timestamp__gte=start)
+    if end:
+        messages = messages.filter(timestamp__lt=end)
+    return messages.order_by('session_id', 'timestamp', 'id')
+
+
+def iter_chat_ndjson(messages: QuerySet) -> Iterator[str]:
+    """每行一条消息，分批从数据库读取"""
+    fields = ('id', 'session_id', 'role', 'content', 'status', 'timestamp')
+    for row in messages.values_list(*fields).iterator(chunk_size=2000):
+        record = dict(zip(fields, row))
+        record['timestamp'] = record['timestamp'].isoformat()
+        yield json.dumps(record, ensure_ascii=False) + '\n'
+
+
+def gzip_stream(chunks: Iterable[str], buffer_size: int = 64 * 1024) -> Iterator[bytes]:
+    """把文本流压缩为 gzip 流，累积到 buffer_size 再压缩输出"""
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 31)  # wbits=31 输出 gzip 格式
+    buffer, size = [], 0
+    for chunk in chunks:
+        data = chunk.encode('utf-8')
+        buffer.append(data)
+        size += len(data)
+        if size >= buffer_size:
+            compressed = compressor.compress(b''.join(buffer))
+            buffer, size = [], 0
+            if compressed:
+                yield compressed
+    yield compressor.compress(b''.join(buffer)) + compressor.flush()
+
+
+def iter_dataset_ndjson(dataset: Dataset, process_type: str, dimensions_key: str) -> Iterator[str]:
+    """数据集在某个处理类型和维度组合下的记录结果，按导入顺序每行一条"""
+    fields = ('record_id', 'position', 'status', 'result', 'error')
+    rows = RecordResult.objects.filter(
+        record__dataset=dataset, process_type=process_type, dimensions_key=dimensions_key
+    ).order_by('record__position').values_list(
+        'record_id', 'record__position', 'status', 'result', 'error'
+    ).iterator(chunk_size=2000)
+    for row in rows:
+        yield json.dumps(dict(zip(fields, row)), ensure_ascii=False) + '\n'
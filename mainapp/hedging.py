@@ -0,0 +1,79 @@
+import threading
+from typing import Dict, Optional
+from django.conf import settings
+from .provider_stats import get_provider_stats, percentile
+
+
+class HedgeBudget:
+    """
+    对冲请求的额外开销上限（令牌桶）
+    每个可对冲的请求积累 MAX_EXTRA_RATIO 个令牌，每发出一个对冲请求消耗 1 个，
+    因此长期来看对冲请求数不超过请求总数的 MAX_EXTRA_RATIO，短时最多突发 BURST 个
+    """
+
+    def __init__(self, ratio: float, burst: float):
+        self.ratio = ratio
+        self.burst = burst
+        self._tokens = burst
+        self._lock = threading.Lock()
+        self.requests = 0
+        self.hedged = 0
+        self.hedge_wins = 0
+
+    def on_request(self) -> None:
+        with self._lock:
+            self.requests += 1
+            self._tokens = min(self.burst, self._tokens + self.ratio)
+
+    def try_spend(self) -> bool:
+        with self._lock:
+            if self._tokens < 1:
+                return False
+            self._tokens -= 1
+            self.hedged += 1
+            return True
+
+    def on_hedge_win(self) -> None:
+        with self._lock:
+            self.hedge_wins += 1
+
+    def stats(self) -> Dict:
+        with self._lock:
+            return {
+                'requests': self.requests,
+                'hedged': self.hedged,
+                'hedge_wins': self.hedge_wins,
+                'extra_ratio': self.hedged / self.requests if self.requests else 0.0,
+            }
+
+
+def hedge_delay(stats_key: str) -> Optional[float]:
+    """
+    发出对冲请求前的等待时间：该服务最近成功请求延迟的 PERCENTILE 百分位
+    样本不足时返回 None（不对冲）
+    """
+    config = settings.REQUEST_HEDGING
+    latencies = get_provider_stats(stats_key).latencies()
+    if len(latencies) < config['MIN_SAMPLES']:
+        return None
+    return max(config['MIN_DELAY'], percentile(latencies, config['PERCENTILE']))
+
+
+def should_hedge(task_type: str) -> bool:
+    config = settings.REQUEST_HEDGING
+    return config['ENABLED'] and task_type in config['TASK_TYPES']
+
+
+_hedge_budget = None
+_hedge_budget_lock = threading.Lock()
+
+
+def get_hedge_budget() -> HedgeBudget:
+    """获取进程内共享的对冲额度"""
+    global _hedge_budget
+    if _hedge_budget is None:
+        with _hedge_budget_lock:
+            if _hedge_budget is None:
+                config = settings.REQUEST_HEDGING
+                _hedge_budget = HedgeBudget(config['MAX_EXTRA_RATIO'], config['BURST'])
+    return _hedge_budget
@@ -0,0 +1,327 @@
+import json
+import logging
+import threading
+import time
+import uuid
+from datetime import timedelta
+from typing import List, Optional, Dict, Iterator
+from django.conf import settings
+from django.db import close_old_connections, connection
+from django.utils import timezone
+from .models import Dataset, ProcessingJob, UploadedFile
+from .exceptions import JobLeaseLost
+from .config_cache import get_api_config
+from .ai_services import create_ai_service
+from .routing import create_routed_service, routed_configs
+from .data_services import TextProcessor
+from .uploads import read_upload
+from .batch import submit_batch_job
+from .datasets import process_dataset_job
+
+logger = logging.getLogger(__name__)
+
+
+def new_processing_key() -> str:
+    """生成处理标识"""
+    return f"process_{int(time.time())}_{uuid.uuid4().hex[:8]}"
+
+
+def enqueue_job(content: str, process_type: str, dimensions: List[str], upload: Optional[UploadedFile] = None,
+                use_cache: bool = True, execution_mode: str = 'realtime',
+                dataset: Optional[Dataset] = None) -> ProcessingJob:
+    """
+    创建排队中的处理任务
+    :param upload: 已上传的文件，传入时处理该文件而不是 content
+    :param execution_mode: realtime 逐块实时调用；batch 提交到批处理接口
+    :param dataset: 数据集，传入时只处理其中尚未完成的记录（忽略 content 和 upload）
+    """
+    job = ProcessingJob.objects.create(
+        key=new_processing_key(),
+        process_type=process_type,
+        dimensions=dimensions,
+        content='' if upload or dataset else content,
+        upload=None if dataset else upload,
+        dataset=dataset,
+        use_cache=use_cache,
+        execution_mode=execution_mode
+    )
+    logger.info(f"处理任务已入队: {job.key}")
+    return job
+
+
+def claim_next_job(worker_id: str) -> Optional[ProcessingJob]:
+    """
+    领取最早的排队任务
+    通过带状态条件的 UPDATE 保证同一任务只会被一个 worker 领取
+    """
+    while True:
+        job = ProcessingJob.objects.filter(status='queued').order_by('created_at').first()
+        if not job:
+            return None
+
+        now = timezone.now()
+        claimed = ProcessingJob.objects.filter(pk=job.pk, status='queued').update(
+            status='running',
+            worker_id=worker_id,
+            started_at=now,
+            updated_at=now
+        )
+        if claimed:
+            job.refresh_from_db()
+            logger.info(f"{worker_id} 领取任务: {job.key}")
+            return job
+
+
+def requeue_stale_jobs(stale_seconds: Optional[int] = None) -> int:
+    """将长时间没有心跳的运行中任务重新放回队列（例如 worker 进程被杀）"""
+    stale_seconds = stale_seconds or settings.PROCESSING_JOB_STALE_SECONDS
+    deadline = timezone.now() - timedelta(seconds=stale_seconds)
+    count = ProcessingJob.objects.filter(status='running', updated_at__lt=deadline).update(
+        status='queued',
+        worker_id=None,
+        updated_at=timezone.now()
+    )
+    if count:
+        logger.warning(f"已重新排队 {count} 个超时任务")
+    return count
+
+
+class JobHeartbeat:
+    """
+    任务执行期间由后台线程定期刷新 updated_at，单个文本块耗时超过超时时间时任务也不会被重新排队
+    心跳带 worker_id 条件，任务已不由当前 worker 运行时停止
+    """
+
+    def __init__(self, job: ProcessingJob, interval: Optional[float] = None):
+        self.job = job
+        self.interval = interval or settings.PROCESSING_JOB_HEARTBEAT_SECONDS
+        self._stopped = threading.Event()
+        self._thread = threading.Thread(target=self._run, name=f"heartbeat-{job.key}", daemon=True)
+
+    def __enter__(self) -> 'JobHeartbeat':
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self._stopped.set()
+        self._thread.join()
+
+    def _run(self) -> None:
+        try:
+            while not self._stopped.wait(self.interval):
+                alive = ProcessingJob.objects.filter(
+                    pk=self.job.pk, status='running', worker_id=self.job.worker_id
+                ).update(updated_at=timezone.now())
+                if not alive:
+                    logger.warning(f"任务 {self.job.key} 已不由 {self.job.worker_id} 运行，停止心跳")
+                    return
+        finally:
+            connection.close()
+
+
+def run_job(job: ProcessingJob) -> bool:
+    """
+    执行处理任务，结果和状态写回数据库
+    执行期间后台线程持续写入心跳；所有写入都以 worker_id 为条件，任务被其他 worker 接管后放弃本次执行
+    """
+    with JobHeartbeat(job):
+        return _run_job(job)
+
+
+def _run_job(job: ProcessingJob) -> bool:
+    try:
+        api_config = get_api_config()
+        if not api_config:
+            raise ValueError("未找到API配置")
+
+        # 存在多个启用的配置时，文本块按权重分配到各个服务
+        processor = TextProcessor(create_routed_service(routed_configs(api_config)), use_cache=job.use_cache)
+        if job.dataset_id:
+            # 数据集任务分轮实时处理，记录状态持久化，中断后重新运行只处理剩余记录
+            result = process_dataset_job(job, processor)
+        else:
+            # 已有文本块说明任务曾经运行过（worker 中断或手动恢复），从检查点继续，只处理未完成的块
+            resume = job.chunks.exists()
+            content = '' if resume else (read_upload(job.upload) if job.upload else job.content)
+            # 所选维度都由本地规则完成时不需要提交批处理
+            if not resume and job.execution_mode == 'batch' \
+                    and processor._plan_dimensions(job.process_type, job.dimensions)[1]:
+                # 批处理任务提交到最新的配置，提交后进入等待状态，结果由 poll_batch_jobs 收集
+                service = create_ai_service(api_config.service_type, api_config.api_key, api_config.base_url)
+                submit_batch_job(job, service, content)
+                return True
+
+            result = processor.process_content(
+                content=content,
+                process_type=job.process_type,
+                dimensions=job.dimensions,
+                processing_key=job.key,
+                job=job,
+                resume=resume
+            )
+        if not result:
+            raise Exception("处理失败")
+
+        job.status = 'completed'
+        job.result = result
+        job.progress = 100
+        job.finished_at = timezone.now()
+        # 部分块重试后仍失败时任务照常完成，失败的块记录在 error 中，可调用 resume_job 重新处理
+        failed = list(job.chunks.filter(status='failed').values_list('index', flat=True)) if not job.dataset_id else []
+        job.error = f"{len(failed)} 个文本块处理失败: {failed}" if failed else None
+        job.save_owned(['status', 'result', 'progress', 'finished_at', 'error'])
+        logger.info(f"任务完成: {job.key}")
+        return True
+
+    except JobLeaseLost as e:
+        logger.warning(f"{str(e)}，放弃本次执行")
+        return False
+    except Exception as e:
+        logger.error(f"任务 {job.key} 执行失败: {str(e)}", exc_info=True)
+        job.status = 'failed'
+        job.error = str(e)
+        job.finished_at = timezone.now()
+        try:
+            job.save_owned(['status', 'error', 'finished_at'])
+        except JobLeaseLost as lost:
+            logger.warning(f"{str(lost)}，不记录失败状态")
+        return False
+
+
+def resume_job(job: ProcessingJob) -> bool:
+    """
+    将已结束的任务重新放回队列，worker 领取后从检查点继续
+    已完成的块不会重新请求，失败的块重新获得完整的重试次数
+    :return: 任务仍在排队或运行中时返回 False
+    """
+    now = timezone.now()
+    updated = ProcessingJob.objects.filter(pk=job.pk).exclude(status__in=('queued', 'running', 'waiting')).update(
+        status='queued',
+        error=None,
+        finished_at=None,
+        worker_id=None,
+        updated_at=now
+    )
+    if updated:
+        job.refresh_from_db()
+        logger.info(f"任务已重新入队，将从检查点继续: {job.key}")
+    return bool(updated)
+
+
+def get_job_state(processing_key: str, since: Optional[int] = None) -> Optional[Dict]:
+    """
+    按 check_processing_status 的格式返回任务状态
+    :param since: 结果游标，只返回该游标之后新增的结果；为 None 时从头返回
+    """
+    job = ProcessingJob.objects.filter(key=processing_key).first()
+    if not job:
+        return None
+
+    state = {
+        'status': 'processing' if job.status in ('queued', 'running', 'waiting') else job.status,
+        'job_status': job.status,
+        'job_id': job.id,
+        'process_type': job.process_type,
+        'progress': job.progress,
+        'completed_chunks': job.completed_chunks,
+        'total_chunks': job.total_chunks,
+        'dedup': job.dedup_report,
+        'timestamp': job.updated_at.isoformat()
+    }
+    if job.status == 'completed':
+        state['result'] = job.result
+    elif job.status == 'failed':
+        state['error'] = job.error
+        
+    results = list(
+        job.results.filter(id__gt=since or 0).order_by('id').values('id', 'index', 'result')
+    )
+    state['results'] = [{'index': r['index'], 'result': r['result']} for r in results]
+    state['cursor'] = results[-1]['id'] if results else (since or 0)
+    return state
+
+
+def _sse(event: str, data: Dict) -> str:
+    """格式化一条 Server-Sent Event"""
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+
+def iter_job_events(job_id: int, poll_interval: Optional[float] = None) -> Iterator[str]:
+    """
+    逐步推送任务事件：chunk（块完成/失败）、progress（进度）、finished（结束）
+    任务进入批处理等待或推送超过 PROCESSING_EVENTS_MAX_SECONDS 时发送 poll 事件并结束，
+    客户端改为轮询 check_processing_status，避免长时间占用 Web 线程
+    worker 可能在其他进程中运行，因此以数据库中的结果记录和块状态为事件来源
+    """
+    poll_interval = poll_interval or settings.PROCESSING_EVENTS_POLL_INTERVAL
+    cursor = 0
+    failed = set()
+    last_progress = None
+    started = last_sent = time.monotonic()
+
+    while True:
+        job = ProcessingJob.objects.filter(pk=job_id).first()
+        if not job:
+            yield _sse('finished', {'status': 'failed', 'error': '任务不存在'})
+            return
+
+        # 结果只追加，按 id 游标读取新结果
+        for row in job.results.filter(id__gt=cursor).order_by('id').values('id', 'index', 'result'):
+            cursor = row['id']
+            yield _sse('chunk', {'index': row['index'], 'status': 'completed', 'result': row['result']})
+            last_sent = time.monotonic()
+
+        # 等待重试的块不推送；只推送新进入最终失败状态的块，恢复后再次失败的块会重新推送
+        current = {}
+        for chunk in job.chunks.filter(status='failed').values('index', 'error'):
+            current[chunk['index']] = chunk['error']
+            if chunk['index'] not in failed:
+                yield _sse('chunk', {'index': chunk['index'], 'status': 'failed', 'error': chunk['error']})
+                last_sent = time.monotonic()
+        failed = set(current)
+
+        progress = (job.status, job.completed_chunks, job.total_chunks)
+        if progress != last_progress:
+            last_progress = progress
+            yield _sse('progress', {
+                'job_status': job.status,
+                'progress': job.progress,
+                'completed_chunks': job.completed_chunks,
+                'total_chunks': job.total_chunks
+            })
+            last_sent = time.monotonic()
+
+        if job.status in ('completed', 'failed'):
+            # 结果已通过 chunk 事件发送，这里只补发游标之后的部分
+            yield _sse('finished', get_job_state(job.key, since=cursor))
+            return
+        if job.status == 'waiting':
+            # 批处理结果可能数小时后才返回
+            yield _sse('poll', {'reason': 'waiting', 'cursor': cursor})
+            return
+        if time.monotonic() - started >= settings.PROCESSING_EVENTS_MAX_SECONDS:
+            yield _sse('poll', {'reason': 'timeout', 'cursor': cursor})
+            return
+
+        # 定期发送注释行，防止代理断开空闲连接
+        if time.monotonic() - last_sent > 15:
+            yield ': keepalive\n\n'
+            last_sent = time.monotonic()
+
+        close_old_connections()
+        time.sleep(poll_interval)
+
+
+def work_loop(worker_id: str, poll_interval: float, once: bool = False) -> None:
+    """worker 主循环：不断领取并执行任务"""
+    logger.info(f"{worker_id} 已启动")
+    while True:
+        close_old_connections()
+        job = claim_next_job(worker_id)
+        if job:
+            run_job(job)
+            continue
+        if once:
+            break
+        time.sleep(poll_interval)
+    logger.info(f"{worker_id} 已退出")
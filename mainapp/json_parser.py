@@ -0,0 +1,170 @@
+import json
+import logging
+import re
+from typing import Any, List, Optional
+
+logger = logging.getLogger(__name__)
+
+_CLOSERS = {'{': '}', '[': ']'}
+_WHITESPACE = ' \t\r\n'
+_CODE_FENCE = re.compile(r'^```[\w-]*\s*|\s*```$')
+
+
+class ParseResult:
+    """解析结果：成功解析的顶层值、诊断信息以及输出是否被截断"""
+
+    def __init__(self, values: List[Any], diagnostics: List[str], truncated: bool = False):
+        self.values = values
+        self.diagnostics = diagnostics
+        self.truncated = truncated
+
+    @property
+    def data(self) -> Optional[Any]:
+        """单个值直接返回，多个拼接的值合并为列表，没有值时返回 None"""
+        if not self.values:
+            return None
+        if len(self.values) == 1:
+            return self.values[0]
+        return self.values
+
+
+class IncrementalJSONParser:
+    """
+    单遍增量 JSON 解析器，用于解析模型输出
+    - 跳过顶层值之外的内容（markdown 代码块标记、说明文字）
+    - 支持多个拼接的对象，删除 } 和 ] 前多余的逗号
+    - 输出被截断时（达到 max_tokens）回退到最后一个完整成员并补全括号
+    可以多次 feed 流式返回的片段，每次返回新解析完成的顶层值
+    """
+
+    def __init__(self):
+        self.values: List[Any] = []
+        self.diagnostics: List[str] = []
+        self._buffer: List[str] = []  # 当前顶层值的字符
+        self._stack: List[str] = []  # 未闭合的括号
+        self._in_string = False
+        self._escape = False
+        self._last_comma = None  # 尚未确认是否多余的逗号在 buffer 中的位置
+        self._cut = None  # 最近的安全截断点：(buffer 长度, 括号栈)
+        self._closed = False
+        self.truncated = False
+
+    def feed(self, text: str) -> List[Any]:
+        """输入一段文本，返回其中新解析完成的顶层值"""
+        if self._closed:
+            raise ValueError('解析器已关闭')
+        completed = []
+        buffer = self._buffer
+        for char in text:
+            if not self._stack:
+                # 顶层值之外：只关心下一个值的开始
+                if char in _CLOSERS:
+                    self._stack.append(char)
+                    buffer.append(char)
+                continue
+
+            if self._in_string:
+                buffer.append(char)
+                if self._escape:
+                    self._escape = False
+                elif char == '\\':
+                    self._escape = True
+                elif char == '"':
+                    self._in_string = False
+                continue
+
+            if char in _WHITESPACE:
+                buffer.append(char)
+                continue
+
+            if char in '}]':
+                if self._last_comma is not None:
+                    # 删除多余的逗号
+                    buffer[self._last_comma] = ''
+                    self.diagnostics.append(f"删除多余的逗号（第 {len(self.values) + 1} 个值）")
+                self._last_comma = None
+                buffer.append(char)
+                self._stack.pop()
+                if not self._stack:
+                    value = self._finish_value()
+                    if value is not None:
+                        completed.append(value)
+                else:
+                    self._cut = (len(buffer), list(self._stack))
+                continue
+
+            if char == ',':
+                self._cut = (len(buffer), list(self._stack))
+                self._last_comma = len(buffer)
+                buffer.append(char)
+                continue
+
+            self._last_comma = None
+            buffer.append(char)
+            if char == '"':
+                self._in_string = True
+            elif char in _CLOSERS:
+                self._stack.append(char)
+        return completed
+
+    def _finish_value(self) -> Optional[Any]:
+        text = ''.join(self._buffer)
+        self._reset_value()
+        try:
+            value = json.loads(text)
+        except json.JSONDecodeError as e:
+            self.diagnostics.append(f"跳过无法解析的片段: {str(e)}: {text[:50]}")
+            return None
+        self.values.append(value)
+        return value
+
+    def _reset_value(self) -> None:
+        self._buffer.clear()
+        self._stack = []
+        self._in_string = False
+        self._escape = False
+        self._last_comma = None
+        self._cut = None
+
+    def close(self) -> ParseResult:
+        """结束输入；最后一个值未闭合时尝试截取已完整的部分"""
+        if not self._closed:
+            self._closed = True
+            if self._stack:
+                self._salvage()
+        return ParseResult(self.values, self.diagnostics, truncated=self.truncated)
+
+    def _salvage(self) -> None:
+        self.truncated = True
+        if self._cut is None:
+            self.diagnostics.append("输出被截断，最后一个值没有完整的成员可以保留")
+            self._reset_value()
+            return
+
+        length, stack = self._cut
+        text = ''.join(self._buffer[:length]).rstrip(_WHITESPACE).rstrip(',')
+        text += ''.join(_CLOSERS[c] for c in reversed(stack))
+        self._reset_value()
+        try:
+            value = json.loads(text)
+        except json.JSONDecodeError as e:
+            self.diagnostics.append(f"输出被截断，补全失败: {str(e)}")
+            return
+        self.values.append(value)
+        self.diagnostics.append("输出被截断，已保留最后一个完整成员之前的内容")
+
+
+def parse_json_response(text: str) -> ParseResult:
+    """
+    解析完整的模型输出
+    没有对象或数组时按单个 JSON 值解析（去掉代码块标记），保留数字、字符串等顶层标量
+    """
+    parser = IncrementalJSONParser()
+    parser.feed(text)
+    result = parser.close()
+    if not result.values:
+        try:
+            result.values.append(json.loads(_CODE_FENCE.sub('', text.strip())))
+        except json.JSONDecodeError:
+            pass
+    return result
@@ -0,0 +1,163 @@
+import logging
+import re
+import threading
+from typing import Any, Dict, Iterable, List, Optional
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+_CJK = r'\u3400-\u9fff\uf900-\ufaff'
+
+# 格式统一：全角字母数字转半角、全角空格转半角、去掉零宽字符
+_FORMAT_TABLE = str.maketrans({
+    **{chr(code): chr(code - 0xFEE0) for code in range(0xFF10, 0xFF1A)},  # ０-９
+    **{chr(code): chr(code - 0xFEE0) for code in range(0xFF21, 0xFF3B)},  # Ａ-Ｚ
+    **{chr(code): chr(code - 0xFEE0) for code in range(0xFF41, 0xFF5B)},  # ａ-ｚ
+    '\u3000': ' ',
+    '\u00a0': ' ',
+    '\u200b': None,
+    '\u200c': None,
+    '\u200d': None,
+    '\ufeff': None,
+    '\r': None,
+})
+# 这些字符在语料中很少出现，先用正则定位再转换，比对全文 translate 快
+_FORMAT_CHARS = re.compile('[\uff10-\uff19\uff21-\uff3a\uff41-\uff5a\u3000\u00a0\u200b-\u200d\ufeff\r]+')
+# 批量清洗时拼接文本的分隔符
+_SEPARATOR = '\x00'
+_FORMAT_RULES = [
+    # 文本首尾的空白；分隔符两侧也算作文本首尾，批量清洗与逐条清洗结果一致
+    (re.compile(rf'(?<![^{_SEPARATOR}])[ \t]+|[ \t]+(?![^{_SEPARATOR}])'), ''),
+    (re.compile(r'[ \t]+$', re.MULTILINE), ''),  # 行尾空白，行首缩进保留
+    (re.compile(rf'(?<=[{_CJK}])[ \t]+(?=[{_CJK}])'), ''),  # 中文之间的空格
+    (re.compile(r'(?<=\S)[ \t]{2,}'), ' '),  # 行内连续空白
+    (re.compile(r'\n{3,}'), '\n\n'),
+]
+
+# 标点符号规范：中文语境下的半角标点转全角，重复标点合并
+_HALF_TO_FULL = {',': '，', '.': '。', '?': '？', '!': '！', ':': '：', ';': '；', '(': '（', ')': '）'}
+_PUNCTUATION_RULES = [
+    (re.compile(r'\.{3,}|。{3,}|…+'), '……'),
+    (re.compile(rf'(?<=[{_CJK}，。！？；：])[ \t]*([,?!:;)])|([,?!:;(])[ \t]*(?=[{_CJK}])'),
+     lambda m: _HALF_TO_FULL[m.group(1) or m.group(2)]),
+    (re.compile(rf'(?<=[{_CJK}）”])[.．](?![\d.])'), '。'),
+    (re.compile(r'(?<=\d)．(?=\d)'), '.'),
+    (re.compile(r'([，。；：、])\1+'), r'\1'),
+    (re.compile(r'[ \t]+(?=[，。！？；：、）”’])|(?<=[（“‘，。！？；：、])[ \t]+'), ''),
+]
+
+# 按规则执行顺序排列
+RULE_ORDER = ('格式统一', '标点符号规范', '错别字纠正')
+
+
+class LocalCleaner:
+    """
+    用预编译的转换表和正则实现确定性的清洗维度
+    每条规则对整段文本执行一次（str.translate / re.sub 在 C 层完成），批量文本拼接后一起处理
+    """
+
+    def __init__(self, typo_corrections: Optional[Dict[str, str]] = None):
+        self.typo_corrections = dict(typo_corrections or {})
+        self._typo_pattern = None
+        if self.typo_corrections:
+            # 长词优先，避免短词先匹配
+            words = sorted(self.typo_corrections, key=len, reverse=True)
+            self._typo_pattern = re.compile('|'.join(re.escape(w) for w in words))
+
+    def normalize_format(self, text: str) -> str:
+        text = _FORMAT_CHARS.sub(lambda m: m.group(0).translate(_FORMAT_TABLE), text)
+        for pattern, replacement in _FORMAT_RULES:
+            text = pattern.sub(replacement, text)
+        return text
+
+    def normalize_punctuation(self, text: str) -> str:
+        for pattern, replacement in _PUNCTUATION_RULES:
+            text = pattern.sub(replacement, text)
+        return text
+
+    def correct_typos(self, text: str) -> str:
+        """按词表替换常见错别字，词表之外的错别字仍由模型处理"""
+        if self._typo_pattern is None:
+            return text
+        return self._typo_pattern.sub(lambda m: self.typo_corrections[m.group(0)], text)
+
+    def clean(self, text: str, dimensions: Iterable[str]) -> str:
+        """按维度名称执行对应的规则"""
+        rules = {
+            '格式统一': self.normalize_format,
+            '标点符号规范': self.normalize_punctuation,
+            '错别字纠正': self.correct_typos,
+        }
+        selected = set(dimensions)
+        for name in RULE_ORDER:
+            if name in selected:
+                text = rules[name](text)
+        return text
+
+    def clean_texts(self, texts: List[str], dimensions: Iterable[str]) -> List[str]:
+        """批量清洗：用分隔符拼接成一个字符串，每条规则只扫描一次，结果与逐条 clean 相同"""
+        if not texts:
+            return []
+        if any(_SEPARATOR in text for text in texts):
+            return [self.clean(text, dimensions) for text in texts]
+        return self.clean(_SEPARATOR.join(texts), dimensions).split(_SEPARATOR)
+
+    def clean_values(self, values: List[Any], dimensions: Iterable[str]) -> List[Any]:
+        """清洗记录列表中的所有字符串（包括嵌套在对象和数组中的字符串）"""
+        texts = []
+
+        def collect(value):
+            if isinstance(value, str):
+                texts.append(value)
+            elif isinstance(value, dict):
+                for item in value.values():
+                    collect(item)
+            elif isinstance(value, list):
+                for item in value:
+                    collect(item)
+
+        for value in values:
+            collect(value)
+        cleaned = iter(self.clean_texts(texts, dimensions))
+
+        def rebuild(value):
+            if isinstance(value, str):
+                return next(cleaned)
+            if isinstance(value, dict):
+                return {key: rebuild(item) for key, item in value.items()}
+            if isinstance(value, list):
+                return [rebuild(item) for item in value]
+            return value
+
+        return [rebuild(value) for value in values]
+
+
+def split_dimensions(dimension_names: Iterable[str]) -> Dict[str, List[str]]:
+    """
+    按 LOCAL_CLEANING['DIMENSIONS'] 把维度分为本地规则和模型处理两类
+    partial 维度两边都有：本地先做确定性的部分，剩下的交给模型
+    """
+    config = settings.LOCAL_CLEANING
+    modes = config['DIMENSIONS'] if config['ENABLED'] else {}
+    local, model = [], []
+    for name in dimension_names:
+        mode = modes.get(name)
+        if mode in ('local', 'partial'):
+            local.append(name)
+        if mode != 'local':
+            model.append(name)
+    return {'local': local, 'model': model}
+
+
+_local_cleaner = None
+_local_cleaner_lock = threading.Lock()
+
+
+def get_local_cleaner() -> LocalCleaner:
+    """获取进程内共享的清洗器（正则只编译一次）"""
+    global _local_cleaner
+    if _local_cleaner is None:
+        with _local_cleaner_lock:
+            if _local_cleaner is None:
+                _local_cleaner = LocalCleaner(settings.LOCAL_CLEANING.get('TYPO_CORRECTIONS'))
+    return _local_cleaner
@@ -0,0 +1,15 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from mainapp.uploads import cleanup_uploads
+
+
+class Command(BaseCommand):
+    help = '删除超过保留期的上传文件，未结束任务引用的文件保留'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, default=settings.UPLOAD_RETENTION_DAYS,
+                            help='保留天数，早于该天数上传的文件会被删除')
+
+    def handle(self, *args, **options):
+        removed = cleanup_uploads(options['days'])
+        self.stdout.write(self.style.SUCCESS(f"已删除 {removed} 个过期上传文件"))
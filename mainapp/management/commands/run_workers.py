@@ -0,0 +1,50 @@
+import os
+import socket
+import threading
+import time
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from mainapp.batch import poll_batch_jobs
+from mainapp.jobs import requeue_stale_jobs, work_loop
+
+
+class Command(BaseCommand):
+    help = '启动文件处理 worker，领取并执行排队中的处理任务'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=settings.PROCESSING_WORKERS,
+                            help='并行执行任务的 worker 线程数')
+        parser.add_argument('--poll-interval', type=float, default=2.0,
+                            help='没有任务时的轮询间隔（秒）')
+        parser.add_argument('--once', action='store_true',
+                            help='处理完当前排队任务后退出')
+
+    def handle(self, *args, **options):
+        prefix = f"{socket.gethostname()}:{os.getpid()}"
+        requeue_stale_jobs()
+        poll_batch_jobs()
+
+        threads = []
+        for n in range(max(1, options['workers'])):
+            thread = threading.Thread(
+                target=work_loop,
+                args=(f"{prefix}:{n}", options['poll_interval'], options['once']),
+                daemon=True
+            )
+            thread.start()
+            threads.append(thread)
+        self.stdout.write(self.style.SUCCESS(f"已启动 {len(threads)} 个 worker"))
+
+        # 主线程定期回收超时任务、查询批处理结果
+        last_check = last_batch_poll = time.monotonic()
+        try:
+            while any(t.is_alive() for t in threads):
+                time.sleep(1)
+                if not options['once'] and time.monotonic() - last_check > settings.PROCESSING_JOB_STALE_SECONDS / 2:
+                    requeue_stale_jobs()
+                    last_check = time.monotonic()
+                if not options['once'] and time.monotonic() - last_batch_poll > settings.BATCH_PROCESSING['POLL_INTERVAL']:
+                    poll_batch_jobs()
+                    last_batch_poll = time.monotonic()
+        except KeyboardInterrupt:
+            self.stdout.write('正在退出...')
@@ -0,0 +1,67 @@
+# Generated by Django 5.1.2 on 2026-10-18 08:36
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('mainapp', '0010_alter_systemprompt_options'),
+    ]
+
+    operations = [
+        migrations.AlterModelOptions(
+            name='systemprompt',
+            options={'verbose_name': '系统提示词', 'verbose_name_plural': '系统示词'},
+        ),
+        migrations.CreateModel(
+            name='ProcessingJob',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('key', models.CharField(max_length=64, unique=True, verbose_name='处理标识')),
+                ('process_type', models.CharField(max_length=20, verbose_name='处理类型')),
+                ('dimensions', models.JSONField(default=list, verbose_name='维度IDs')),
+                ('content', models.TextField(verbose_name='原始内容')),
+                ('status', models.CharField(choices=[('queued', '排队中'), ('running', '处理中'), ('completed', '已完成'), ('failed', '失败')], default='queued', max_length=20, verbose_name='状态')),
+                ('progress', models.FloatField(default=0, verbose_name='进度')),
+                ('total_chunks', models.IntegerField(default=0, verbose_name='文本块总数')),
+                ('completed_chunks', models.IntegerField(default=0, verbose_name='已完成块数')),
+                ('result', models.TextField(blank=True, null=True, verbose_name='处理结果')),
+                ('error', models.TextField(blank=True, null=True, verbose_name='错误信息')),
+                ('worker_id', models.CharField(blank=True, max_length=100, null=True, verbose_name='执行者')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='创建时间')),
+                ('updated_at', models.DateTimeField(auto_now=True, verbose_name='更新时间')),
+                ('started_at', models.DateTimeField(blank=True, null=True, verbose_name='开始时间')),
+                ('finished_at', models.DateTimeField(blank=True, null=True, verbose_name='结束时间')),
+            ],
+            options={
+                'verbose_name': '处理任务',
+                'verbose_name_plural': '处理任务',
+                'db_table': 'processing_jobs',
+                'ordering': ['created_at'],
+                'indexes': [models.Index(fields=['status', 'created_at'], name='processing__status_ac8e44_idx'), models.Index(fields=['status', 'updated_at'], name='processing__status_f2abbe_idx')],
+            },
+        ),
+        migrations.CreateModel(
+            name='ProcessingChunk',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('index', models.IntegerField(verbose_name='块序号')),
+                ('content', models.TextField(verbose_name='块内容')),
+                ('status', models.CharField(choices=[('pending', '待处理'), ('completed', '已完成'), ('failed', '失败')], default='pending', max_length=20, verbose_name='状态')),
+                ('result', models.JSONField(blank=True, null=True, verbose_name='处理结果')),
+                ('error', models.TextField(blank=True, null=True, verbose_name='错误信息')),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('job', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='chunks', to='mainapp.processingjob')),
+            ],
+            options={
+                'verbose_name': '处理块',
+                'verbose_name_plural': '处理块',
+                'db_table': 'processing_chunks',
+                'ordering': ['job', 'index'],
+                'constraints': [models.UniqueConstraint(fields=('job', 'index'), name='unique_job_chunk_index')],
+            },
+        ),
+    ]
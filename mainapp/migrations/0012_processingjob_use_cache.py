@@ -0,0 +1,18 @@
+# Generated by Django 5.1.2 on 2026-10-18 08:38
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('mainapp', '0011_processingjob_processingchunk'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='processingjob',
+            name='use_cache',
+            field=models.BooleanField(default=True, verbose_name='使用响应缓存'),
+        ),
+    ]
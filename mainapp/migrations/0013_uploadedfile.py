@@ -0,0 +1,42 @@
+# Generated by Django 5.1.2 on 2026-10-18 08:40
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('mainapp', '0012_processingjob_use_cache'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='UploadedFile',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('file_id', models.CharField(max_length=64, unique=True, verbose_name='文件标识')),
+                ('filename', models.CharField(max_length=255, verbose_name='文件名')),
+                ('path', models.CharField(max_length=500, verbose_name='存储路径')),
+                ('encoding', models.CharField(max_length=20, verbose_name='文件编码')),
+                ('size', models.BigIntegerField(default=0, verbose_name='文件大小')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='上传时间')),
+            ],
+            options={
+                'verbose_name': '上传文件',
+                'verbose_name_plural': '上传文件',
+                'db_table': 'uploaded_files',
+                'ordering': ['-created_at'],
+            },
+        ),
+        migrations.AlterField(
+            model_name='processingjob',
+            name='content',
+            field=models.TextField(blank=True, default='', verbose_name='原始内容'),
+        ),
+        migrations.AddField(
+            model_name='processingjob',
+            name='upload',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='jobs', to='mainapp.uploadedfile', verbose_name='上传文件'),
+        ),
+    ]
@@ -0,0 +1,48 @@
+# Generated by Django 5.1.2 on 2026-10-18 08:48
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('mainapp', '0013_uploadedfile'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='processingjob',
+            name='execution_mode',
+            field=models.CharField(choices=[('realtime', '实时处理'), ('batch', '批处理接口')], default='realtime', max_length=20, verbose_name='执行方式'),
+        ),
+        migrations.AlterField(
+            model_name='processingjob',
+            name='status',
+            field=models.CharField(choices=[('queued', '排队中'), ('running', '处理中'), ('waiting', '等待批处理结果'), ('completed', '已完成'), ('failed', '失败')], default='queued', max_length=20, verbose_name='状态'),
+        ),
+        migrations.CreateModel(
+            name='BatchJob',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('service_type', models.CharField(max_length=20, verbose_name='服务类型')),
+                ('batch_id', models.CharField(max_length=100, unique=True, verbose_name='批处理ID')),
+                ('input_file_id', models.CharField(max_length=100, verbose_name='输入文件ID')),
+                ('output_file_id', models.CharField(blank=True, max_length=100, null=True, verbose_name='输出文件ID')),
+                ('error_file_id', models.CharField(blank=True, max_length=100, null=True, verbose_name='错误文件ID')),
+                ('status', models.CharField(default='validating', max_length=20, verbose_name='批处理状态')),
+                ('request_counts', models.JSONField(default=dict, verbose_name='请求统计')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='提交时间')),
+                ('updated_at', models.DateTimeField(auto_now=True, verbose_name='更新时间')),
+                ('polled_at', models.DateTimeField(blank=True, null=True, verbose_name='上次查询时间')),
+                ('completed_at', models.DateTimeField(blank=True, null=True, verbose_name='结束时间')),
+                ('job', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='batch', to='mainapp.processingjob')),
+            ],
+            options={
+                'verbose_name': '批处理任务',
+                'verbose_name_plural': '批处理任务',
+                'db_table': 'batch_jobs',
+                'indexes': [models.Index(fields=['status', 'polled_at'], name='batch_jobs_status_11fb10_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,46 @@
+# Generated by Django 5.1.2 on 2026-10-18 08:50
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+def copy_chunk_results(apps, schema_editor):
+    """把已有文本块中的结果迁移为结果记录"""
+    ProcessingChunk = apps.get_model('mainapp', 'ProcessingChunk')
+    ProcessingResult = apps.get_model('mainapp', 'ProcessingResult')
+    chunks = ProcessingChunk.objects.filter(status='completed', result__isnull=False).order_by('job_id', 'index')
+    ProcessingResult.objects.bulk_create(
+        (ProcessingResult(job_id=chunk.job_id, index=chunk.index, result=chunk.result) for chunk in chunks.iterator()),
+        batch_size=500
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('mainapp', '0014_batchjob'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ProcessingResult',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('index', models.IntegerField(verbose_name='块序号')),
+                ('result', models.JSONField(verbose_name='处理结果')),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('job', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='results', to='mainapp.processingjob')),
+            ],
+            options={
+                'verbose_name': '处理结果',
+                'verbose_name_plural': '处理结果',
+                'db_table': 'processing_results',
+                'indexes': [models.Index(fields=['job', 'id'], name='processing__job_id_ff4757_idx'), models.Index(fields=['job', 'index'], name='processing__job_id_702b12_idx')],
+            },
+        ),
+        migrations.RunPython(copy_chunk_results, migrations.RunPython.noop),
+        migrations.RemoveField(
+            model_name='processingchunk',
+            name='result',
+        ),
+    ]
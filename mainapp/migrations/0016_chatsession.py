@@ -0,0 +1,71 @@
+# Generated by Django 5.1.2 on 2026-10-18 08:54
+
+import django.utils.timezone
+from django.db import migrations, models
+from django.db.models import Count, Max, Min, Q
+
+
+def is_probe_content(content):
+    """与 services.is_probe_message 相同的判断（迁移中不引用运行时代码）"""
+    text = content.strip()
+    return text.lower() == 'test' or 'API验证' in text
+
+
+def backfill_chat_sessions(apps, schema_editor):
+    """标记已有的验证/测试消息，并汇总已有会话"""
+    ChatMessage = apps.get_model('mainapp', 'ChatMessage')
+    ChatSession = apps.get_model('mainapp', 'ChatSession')
+    # 先用 LIKE 缩小范围，再逐条按运行时的规则判断
+    candidates = ChatMessage.objects.filter(
+        Q(content__contains='API验证') | Q(content__icontains='test')
+    ).values_list('id', 'content')
+    probe_ids = [pk for pk, content in candidates.iterator() if is_probe_content(content)]
+    for i in range(0, len(probe_ids), 500):
+        ChatMessage.objects.filter(pk__in=probe_ids[i:i + 500]).update(is_probe=True)
+    sessions = ChatMessage.objects.filter(is_probe=False).values('session_id').annotate(
+        count=Count('id'), first=Min('timestamp'), last=Max('timestamp')
+    )
+    ChatSession.objects.bulk_create([
+        ChatSession(session_id=row['session_id'], message_count=row['count'],
+                    created_at=row['first'], last_activity=row['last'])
+        for row in sessions.iterator()
+    ], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('mainapp', '0015_processingresult'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ChatSession',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('session_id', models.CharField(max_length=100, unique=True, verbose_name='会话ID')),
+                ('message_count', models.IntegerField(default=0, verbose_name='消息数')),
+                ('created_at', models.DateTimeField(default=django.utils.timezone.now, verbose_name='创建时间')),
+                ('last_activity', models.DateTimeField(default=django.utils.timezone.now, verbose_name='最后活动时间')),
+            ],
+            options={
+                'verbose_name': '聊天会话',
+                'verbose_name_plural': '聊天会话',
+                'db_table': 'chat_sessions',
+            },
+        ),
+        migrations.AddField(
+            model_name='chatmessage',
+            name='is_probe',
+            field=models.BooleanField(default=False, verbose_name='验证/测试消息'),
+        ),
+        migrations.AddIndex(
+            model_name='chatmessage',
+            index=models.Index(fields=['session_id', 'is_probe', 'id'], name='chat_messag_session_dba43e_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='chatsession',
+            index=models.Index(fields=['last_activity', 'id'], name='chat_sessio_last_ac_cf9c49_idx'),
+        ),
+        migrations.RunPython(backfill_chat_sessions, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 5.1.2 on 2026-10-18 08:59
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('mainapp', '0016_chatsession'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='processingchunk',
+            name='duplicate_of',
+            field=models.IntegerField(blank=True, null=True, verbose_name='代表块序号'),
+        ),
+        migrations.AddField(
+            model_name='processingjob',
+            name='dedup_report',
+            field=models.JSONField(blank=True, default=dict, verbose_name='去重统计'),
+        ),
+    ]
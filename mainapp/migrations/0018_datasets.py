@@ -0,0 +1,84 @@
+# Generated by Django 5.1.2 on 2026-10-18 09:05
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('mainapp', '0017_chunk_dedup'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Dataset',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=255, verbose_name='名称')),
+                ('record_count', models.IntegerField(default=0, verbose_name='记录数')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='创建时间')),
+                ('updated_at', models.DateTimeField(auto_now=True, verbose_name='更新时间')),
+                ('upload', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='datasets', to='mainapp.uploadedfile', verbose_name='来源文件')),
+            ],
+            options={
+                'verbose_name': '数据集',
+                'verbose_name_plural': '数据集',
+                'db_table': 'datasets',
+                'ordering': ['-created_at'],
+            },
+        ),
+        migrations.AddField(
+            model_name='processingjob',
+            name='dataset',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='jobs', to='mainapp.dataset', verbose_name='数据集'),
+        ),
+        migrations.CreateModel(
+            name='Record',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('position', models.IntegerField(verbose_name='导入顺序')),
+                ('content_hash', models.CharField(max_length=64, verbose_name='内容哈希')),
+                ('content', models.JSONField(verbose_name='内容')),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('dataset', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='records', to='mainapp.dataset')),
+            ],
+            options={
+                'verbose_name': '数据集记录',
+                'verbose_name_plural': '数据集记录',
+                'db_table': 'dataset_records',
+                'ordering': ['dataset', 'position'],
+            },
+        ),
+        migrations.CreateModel(
+            name='RecordResult',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('process_type', models.CharField(max_length=20, verbose_name='处理类型')),
+                ('dimensions_key', models.CharField(max_length=255, verbose_name='维度组合')),
+                ('status', models.CharField(choices=[('pending', '待处理'), ('done', '已完成'), ('failed', '失败')], default='pending', max_length=20, verbose_name='状态')),
+                ('result', models.JSONField(blank=True, null=True, verbose_name='处理结果')),
+                ('error', models.TextField(blank=True, null=True, verbose_name='错误信息')),
+                ('updated_at', models.DateTimeField(auto_now=True, verbose_name='更新时间')),
+                ('job', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='record_results', to='mainapp.processingjob', verbose_name='处理任务')),
+                ('record', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='results', to='mainapp.record')),
+            ],
+            options={
+                'verbose_name': '记录处理结果',
+                'verbose_name_plural': '记录处理结果',
+                'db_table': 'dataset_record_results',
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='record',
+            constraint=models.UniqueConstraint(fields=('dataset', 'content_hash'), name='unique_dataset_record_hash'),
+        ),
+        migrations.AddIndex(
+            model_name='recordresult',
+            index=models.Index(fields=['process_type', 'dimensions_key', 'status'], name='dataset_rec_process_80eec7_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='recordresult',
+            constraint=models.UniqueConstraint(fields=('record', 'process_type', 'dimensions_key'), name='unique_record_result'),
+        ),
+    ]
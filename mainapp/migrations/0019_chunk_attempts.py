@@ -0,0 +1,23 @@
+# Generated by Django 5.1.2 on 2026-10-18 09:08
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('mainapp', '0018_datasets'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='processingchunk',
+            name='attempts',
+            field=models.IntegerField(default=0, verbose_name='尝试次数'),
+        ),
+        migrations.AlterField(
+            model_name='processingchunk',
+            name='status',
+            field=models.CharField(choices=[('pending', '待处理'), ('retrying', '等待重试'), ('completed', '已完成'), ('failed', '失败')], default='pending', max_length=20, verbose_name='状态'),
+        ),
+    ]
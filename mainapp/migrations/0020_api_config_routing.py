@@ -0,0 +1,23 @@
+# Generated by Django 5.1.2 on 2026-10-18 09:12
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('mainapp', '0019_chunk_attempts'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='apiconfig',
+            name='is_active',
+            field=models.BooleanField(default=True, verbose_name='启用'),
+        ),
+        migrations.AddField(
+            model_name='apiconfig',
+            name='weight',
+            field=models.PositiveIntegerField(default=1, verbose_name='路由权重'),
+        ),
+    ]
@@ -0,0 +1,44 @@
+# Generated by Django 5.1.2 on 2026-10-18 11:20
+
+import json
+from django.db import migrations, models
+
+
+def is_pack(content):
+    """与 packing.parse_pack 相同的判断（迁移中不引用运行时代码）"""
+    if not content.startswith('{"records": ['):
+        return False
+    try:
+        data = json.loads(content)
+    except json.JSONDecodeError:
+        return False
+    records = data.get('records') if isinstance(data, dict) and len(data) == 1 else None
+    return isinstance(records, list) and all(
+        isinstance(r, dict) and {'id', 'content'} <= set(r) <= {'id', 'content', 'duplicates'} for r in records)
+
+
+def backfill_packed(apps, schema_editor):
+    """已有任务按第一个文本块的内容标记是否为多记录请求"""
+    ProcessingChunk = apps.get_model('mainapp', 'ProcessingChunk')
+    ProcessingJob = apps.get_model('mainapp', 'ProcessingJob')
+    candidates = ProcessingChunk.objects.filter(index=1, content__startswith='{"records": [').values_list(
+        'job_id', 'content')
+    job_ids = [job_id for job_id, content in candidates.iterator() if is_pack(content)]
+    for i in range(0, len(job_ids), 500):
+        ProcessingJob.objects.filter(pk__in=job_ids[i:i + 500]).update(packed=True)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('mainapp', '0020_api_config_routing'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='processingjob',
+            name='packed',
+            field=models.BooleanField(default=False, verbose_name='多记录请求'),
+        ),
+        migrations.RunPython(backfill_packed, migrations.RunPython.noop),
+    ]
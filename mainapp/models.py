@@ -1,11 +1,15 @@
 from django.db import models
+from django.db.models import F
+from django.utils import timezone
 from django.contrib.auth.models import User
-from django.core.cache import cache
-from django.db.models.signals import post_migrate
+from django.db.models.signals import post_migrate, post_save, post_delete
 from django.dispatch import receiver
 from django.core.exceptions import ValidationError
 import json
 import logging
+from .ai_services import clear_service_registry
+from .config_cache import invalidate_config_cache
+from .exceptions import JobLeaseLost
 
 # Create your models here.
 
@@ -15,6 +19,8 @@ class APIConfig(models.Model):
     service_type = models.CharField(max_length=20)  # 'openai', 'zhipu', 'deepseek'
     api_key = models.CharField(max_length=255)
     base_url = models.CharField(max_length=255, blank=True, null=True)
+    weight = models.PositiveIntegerField(default=1, verbose_name='路由权重')  # 多个配置之间按权重分配请求
+    is_active = models.BooleanField(default=True, verbose_name='启用')
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
     
@@ -24,14 +30,15 @@ class APIConfig(models.Model):
             models.Index(fields=['service_type']),
             models.Index(fields=['created_at'])
         ]
-        
-    def save(self, *args, **kwargs):
-        cache.delete(f'api_config_{self.service_type}')
-        super().save(*args, **kwargs)
     
     def __str__(self):
         return f"{self.service_type} API Config"
 
+@receiver([post_save, post_delete], sender='mainapp.APIConfig')
+def reset_ai_services(sender, **kwargs):
+    """API 配置变更后丢弃已缓存的服务实例"""
+    clear_service_registry()
+
 class ChatMessage(models.Model):
     role = models.CharField(max_length=10)  # 'user' 或 'ai'
     content = models.TextField()
@@ -46,18 +53,52 @@ class ChatMessage(models.Model):
         ],
         default='pending'
     )
+    is_probe = models.BooleanField(default=False, verbose_name='验证/测试消息')  # 不作为对话上下文
     
     class Meta:
         db_table = 'chat_messages'
         ordering = ['timestamp']
         indexes = [
             models.Index(fields=['session_id', 'timestamp']),
+            models.Index(fields=['session_id', 'is_probe', 'id']),
             models.Index(fields=['status'])
         ]
         
     def __str__(self):
         return f"{self.role}: {self.content[:50]}..."
 
+class ChatSession(models.Model):
+    """聊天会话，消息数和最后活动时间在写入消息时更新"""
+    session_id = models.CharField(max_length=100, unique=True, verbose_name='会话ID')
+    message_count = models.IntegerField(default=0, verbose_name='消息数')
+    created_at = models.DateTimeField(default=timezone.now, verbose_name='创建时间')
+    last_activity = models.DateTimeField(default=timezone.now, verbose_name='最后活动时间')
+    
+    class Meta:
+        db_table = 'chat_sessions'
+        indexes = [
+            models.Index(fields=['last_activity', 'id'])
+        ]
+        verbose_name = '聊天会话'
+        verbose_name_plural = '聊天会话'
+        
+    def __str__(self):
+        return f"{self.session_id} ({self.message_count})"
+
+@receiver(post_save, sender=ChatMessage)
+def update_chat_session(sender, instance, created, **kwargs):
+    """新消息写入后更新会话的消息数和最后活动时间"""
+    if not created or instance.is_probe:
+        return
+    values = {'message_count': F('message_count') + 1, 'last_activity': instance.timestamp}
+    if not ChatSession.objects.filter(session_id=instance.session_id).update(**values):
+        _, created_session = ChatSession.objects.get_or_create(
+            session_id=instance.session_id,
+            defaults={'message_count': 1, 'created_at': instance.timestamp, 'last_activity': instance.timestamp}
+        )
+        if not created_session:
+            ChatSession.objects.filter(session_id=instance.session_id).update(**values)
+
 class SystemPrompt(models.Model):
     PROMPT_TYPES = [
         ('cleaning', '数据清洗'),
@@ -184,6 +225,247 @@ class LabelingDimension(BaseDimension):
             "关键词"
         ]
 
+@receiver([post_save, post_delete], sender=APIConfig)
+@receiver([post_save, post_delete], sender=SystemPrompt)
+@receiver([post_save, post_delete], sender=CleaningDimension)
+@receiver([post_save, post_delete], sender=LabelingDimension)
+def reset_config_cache(sender, **kwargs):
+    """配置、提示词或维度变更后使配置缓存失效"""
+    invalidate_config_cache()
+
+class UploadedFile(models.Model):
+    """服务端保存的上传文件，处理时通过 file_id 引用"""
+    file_id = models.CharField(max_length=64, unique=True, verbose_name='文件标识')
+    filename = models.CharField(max_length=255, verbose_name='文件名')
+    path = models.CharField(max_length=500, verbose_name='存储路径')
+    encoding = models.CharField(max_length=20, verbose_name='文件编码')
+    size = models.BigIntegerField(default=0, verbose_name='文件大小')
+    created_at = models.DateTimeField(auto_now_add=True, verbose_name='上传时间')
+    
+    class Meta:
+        db_table = 'uploaded_files'
+        ordering = ['-created_at']
+        verbose_name = '上传文件'
+        verbose_name_plural = '上传文件'
+        
+    def __str__(self):
+        return f"{self.filename} ({self.file_id})"
+
+class Dataset(models.Model):
+    """持久化的数据集，记录按内容哈希去重，可以分多次追加和处理"""
+    name = models.CharField(max_length=255, verbose_name='名称')
+    upload = models.ForeignKey(UploadedFile, on_delete=models.SET_NULL, null=True, blank=True,
+                               related_name='datasets', verbose_name='来源文件')
+    record_count = models.IntegerField(default=0, verbose_name='记录数')
+    created_at = models.DateTimeField(auto_now_add=True, verbose_name='创建时间')
+    updated_at = models.DateTimeField(auto_now=True, verbose_name='更新时间')
+
+    class Meta:
+        db_table = 'datasets'
+        ordering = ['-created_at']
+        verbose_name = '数据集'
+        verbose_name_plural = '数据集'
+
+    def __str__(self):
+        return f"{self.name} ({self.record_count})"
+
+class Record(models.Model):
+    """数据集中的单条记录"""
+    dataset = models.ForeignKey(Dataset, on_delete=models.CASCADE, related_name='records')
+    position = models.IntegerField(verbose_name='导入顺序')
+    content_hash = models.CharField(max_length=64, verbose_name='内容哈希')
+    content = models.JSONField(verbose_name='内容')
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        db_table = 'dataset_records'
+        ordering = ['dataset', 'position']
+        constraints = [
+            models.UniqueConstraint(fields=['dataset', 'content_hash'], name='unique_dataset_record_hash')
+        ]
+        verbose_name = '数据集记录'
+        verbose_name_plural = '数据集记录'
+
+    def __str__(self):
+        return f"{self.dataset_id}#{self.position}"
+
+class ProcessingJob(models.Model):
+    """文件处理任务，状态持久化到数据库，由 run_workers 命令领取执行"""
+    STATUS_CHOICES = [
+        ('queued', '排队中'),
+        ('running', '处理中'),
+        ('waiting', '等待批处理结果'),
+        ('completed', '已完成'),
+        ('failed', '失败')
+    ]
+    EXECUTION_MODES = [
+        ('realtime', '实时处理'),
+        ('batch', '批处理接口')
+    ]
+    
+    key = models.CharField(max_length=64, unique=True, verbose_name='处理标识')
+    process_type = models.CharField(max_length=20, verbose_name='处理类型')
+    dimensions = models.JSONField(default=list, verbose_name='维度IDs')
+    content = models.TextField(blank=True, default='', verbose_name='原始内容')
+    upload = models.ForeignKey(UploadedFile, on_delete=models.SET_NULL, null=True, blank=True,
+                               related_name='jobs', verbose_name='上传文件')
+    dataset = models.ForeignKey(Dataset, on_delete=models.SET_NULL, null=True, blank=True,
+                                related_name='jobs', verbose_name='数据集')  # 传入时只处理尚未完成的记录
+    use_cache = models.BooleanField(default=True, verbose_name='使用响应缓存')
+    execution_mode = models.CharField(max_length=20, choices=EXECUTION_MODES, default='realtime',
+                                      verbose_name='执行方式')
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='queued', verbose_name='状态')
+    progress = models.FloatField(default=0, verbose_name='进度')
+    total_chunks = models.IntegerField(default=0, verbose_name='文本块总数')
+    completed_chunks = models.IntegerField(default=0, verbose_name='已完成块数')
+    dedup_report = models.JSONField(default=dict, blank=True, verbose_name='去重统计')
+    packed = models.BooleanField(default=False, verbose_name='多记录请求')  # 文本块为打包的记录
+    result = models.TextField(blank=True, null=True, verbose_name='处理结果')
+    error = models.TextField(blank=True, null=True, verbose_name='错误信息')
+    worker_id = models.CharField(max_length=100, blank=True, null=True, verbose_name='执行者')
+    created_at = models.DateTimeField(auto_now_add=True, verbose_name='创建时间')
+    updated_at = models.DateTimeField(auto_now=True, verbose_name='更新时间')
+    started_at = models.DateTimeField(blank=True, null=True, verbose_name='开始时间')
+    finished_at = models.DateTimeField(blank=True, null=True, verbose_name='结束时间')
+    
+    class Meta:
+        db_table = 'processing_jobs'
+        ordering = ['created_at']
+        indexes = [
+            models.Index(fields=['status', 'created_at']),
+            models.Index(fields=['status', 'updated_at'])
+        ]
+        verbose_name = '处理任务'
+        verbose_name_plural = '处理任务'
+        
+    def __str__(self):
+        return f"{self.key} ({self.get_status_display()})"
+
+    def save_owned(self, update_fields):
+        """
+        保存指定字段，仅当任务仍由 self.worker_id 持有时生效（带 worker_id 条件的 UPDATE）
+        任务超时被重新排队或由其他 worker 领取后，原 worker 的写入会被拒绝并抛出 JobLeaseLost
+        """
+        self.updated_at = timezone.now()
+        values = {field: getattr(self, field) for field in update_fields}
+        values['updated_at'] = self.updated_at
+        if not ProcessingJob.objects.filter(pk=self.pk, worker_id=self.worker_id).update(**values):
+            raise JobLeaseLost(f"任务 {self.key} 已不由 {self.worker_id} 持有")
+
+class ProcessingChunk(models.Model):
+    """处理任务中的单个文本块"""
+    STATUS_CHOICES = [
+        ('pending', '待处理'),
+        ('retrying', '等待重试'),
+        ('completed', '已完成'),
+        ('failed', '失败')
+    ]
+    
+    job = models.ForeignKey(ProcessingJob, on_delete=models.CASCADE, related_name='chunks')
+    index = models.IntegerField(verbose_name='块序号')
+    content = models.TextField(verbose_name='块内容')
+    duplicate_of = models.IntegerField(blank=True, null=True, verbose_name='代表块序号')  # 近似重复块不单独请求，复用代表块的结果
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='pending', verbose_name='状态')
+    error = models.TextField(blank=True, null=True, verbose_name='错误信息')
+    attempts = models.IntegerField(default=0, verbose_name='尝试次数')
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+    
+    class Meta:
+        db_table = 'processing_chunks'
+        ordering = ['job', 'index']
+        constraints = [
+            models.UniqueConstraint(fields=['job', 'index'], name='unique_job_chunk_index')
+        ]
+        verbose_name = '处理块'
+        verbose_name_plural = '处理块'
+        
+    def __str__(self):
+        return f"{self.job.key} #{self.index}"
+
+class ProcessingResult(models.Model):
+    """
+    文本块处理结果，只追加不修改
+    自增 id 作为增量查询的游标，轮询和事件流只读取游标之后的新结果
+    """
+    job = models.ForeignKey(ProcessingJob, on_delete=models.CASCADE, related_name='results')
+    index = models.IntegerField(verbose_name='块序号')
+    result = models.JSONField(verbose_name='处理结果')
+    created_at = models.DateTimeField(auto_now_add=True)
+    
+    class Meta:
+        db_table = 'processing_results'
+        indexes = [
+            models.Index(fields=['job', 'id']),
+            models.Index(fields=['job', 'index'])
+        ]
+        verbose_name = '处理结果'
+        verbose_name_plural = '处理结果'
+        
+    def __str__(self):
+        return f"{self.job.key} #{self.index}"
+
+class BatchJob(models.Model):
+    """提交到 OpenAI 兼容批处理接口的任务，由 run_workers 轮询结果"""
+    ACTIVE_STATUSES = ('validating', 'in_progress', 'finalizing', 'cancelling')
+    
+    job = models.OneToOneField(ProcessingJob, on_delete=models.CASCADE, related_name='batch')
+    service_type = models.CharField(max_length=20, verbose_name='服务类型')
+    batch_id = models.CharField(max_length=100, unique=True, verbose_name='批处理ID')
+    input_file_id = models.CharField(max_length=100, verbose_name='输入文件ID')
+    output_file_id = models.CharField(max_length=100, blank=True, null=True, verbose_name='输出文件ID')
+    error_file_id = models.CharField(max_length=100, blank=True, null=True, verbose_name='错误文件ID')
+    status = models.CharField(max_length=20, default='validating', verbose_name='批处理状态')
+    request_counts = models.JSONField(default=dict, verbose_name='请求统计')
+    created_at = models.DateTimeField(auto_now_add=True, verbose_name='提交时间')
+    updated_at = models.DateTimeField(auto_now=True, verbose_name='更新时间')
+    polled_at = models.DateTimeField(blank=True, null=True, verbose_name='上次查询时间')
+    completed_at = models.DateTimeField(blank=True, null=True, verbose_name='结束时间')
+    
+    class Meta:
+        db_table = 'batch_jobs'
+        indexes = [
+            models.Index(fields=['status', 'polled_at'])
+        ]
+        verbose_name = '批处理任务'
+        verbose_name_plural = '批处理任务'
+        
+    def __str__(self):
+        return f"{self.batch_id} ({self.status})"
+
+class RecordResult(models.Model):
+    """记录在某个处理类型和维度组合下的处理状态与结果"""
+    STATUS_CHOICES = [
+        ('pending', '待处理'),
+        ('done', '已完成'),
+        ('failed', '失败')
+    ]
+
+    record = models.ForeignKey(Record, on_delete=models.CASCADE, related_name='results')
+    process_type = models.CharField(max_length=20, verbose_name='处理类型')
+    dimensions_key = models.CharField(max_length=255, verbose_name='维度组合')  # 排序后的维度 ID，以逗号分隔
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='pending', verbose_name='状态')
+    result = models.JSONField(blank=True, null=True, verbose_name='处理结果')
+    error = models.TextField(blank=True, null=True, verbose_name='错误信息')
+    job = models.ForeignKey(ProcessingJob, on_delete=models.SET_NULL, null=True, blank=True,
+                            related_name='record_results', verbose_name='处理任务')
+    updated_at = models.DateTimeField(auto_now=True, verbose_name='更新时间')
+
+    class Meta:
+        db_table = 'dataset_record_results'
+        constraints = [
+            models.UniqueConstraint(fields=['record', 'process_type', 'dimensions_key'],
+                                    name='unique_record_result')
+        ]
+        indexes = [
+            models.Index(fields=['process_type', 'dimensions_key', 'status'])
+        ]
+        verbose_name = '记录处理结果'
+        verbose_name_plural = '记录处理结果'
+
+    def __str__(self):
+        return f"{self.record} {self.process_type}[{self.dimensions_key}]: {self.status}"
+
 @receiver(post_migrate)
 def create_default_dimensions(sender, **kwargs):
     if sender.name == 'mainapp':
@@ -0,0 +1,147 @@
+import json
+import logging
+from typing import Any, Dict, Iterable, List, Optional
+from .tokens import count_text_tokens_batch
+
+logger = logging.getLogger(__name__)
+
+PACK_INSTRUCTION = (
+    "\n\n输入是一个 JSON 对象，records 数组中每条记录包含 id 和 content。"
+    "请对每条记录分别按上述要求处理，只返回一个 JSON 数组，每条记录对应一个元素，"
+    "元素中必须包含与输入相同的 id 字段；如果单条记录的结果不是对象，放在 result 字段中。"
+    "不要合并或遗漏记录。"
+)
+
+
+def split_records(content: str) -> Optional[List[Dict]]:
+    """
+    把 JSON 数组或 JSONL 内容拆分为带 id 的记录
+    记录自带唯一的 id 字段时沿用，否则按位置从 1 开始编号；不是记录列表时返回 None
+    """
+    text = content.strip()
+    if not text or text[0] not in '[{':
+        return None
+    try:
+        items = json.loads(text)
+        if not isinstance(items, list):
+            items = [items]
+    except json.JSONDecodeError:
+        try:
+            items = [json.loads(line) for line in text.splitlines() if line.strip()]
+        except json.JSONDecodeError:
+            return None
+    if len(items) < 2:
+        return None
+
+    ids = [item.get('id') if isinstance(item, dict) else None for item in items]
+    if all(isinstance(i, (str, int)) and not isinstance(i, bool) for i in ids) \
+            and len({str(i) for i in ids}) == len(ids):
+        ids = [str(i) for i in ids]
+    else:
+        ids = [str(i) for i in range(1, len(items) + 1)]
+    return [{'id': record_id, 'content': item} for record_id, item in zip(ids, items)]
+
+
+def pack_records(records: List[Dict], max_tokens: int, max_records: int, model: str = "gpt-4") -> List[List[Dict]]:
+    """
+    按原顺序把记录装入请求，每个请求不超过 max_tokens 和 max_records
+    单条记录超过预算时单独成为一个请求
+    """
+    counts = count_text_tokens_batch([json.dumps(r, ensure_ascii=False) for r in records], model)
+    packs, current, used = [], [], 0
+    for record, tokens in zip(records, counts):
+        if current and (used + tokens > max_tokens or len(current) >= max_records):
+            packs.append(current)
+            current, used = [], 0
+        if tokens > max_tokens:
+            logger.warning(f"记录 {record['id']} 超出单个请求的 token 预算: {tokens} > {max_tokens}")
+        current.append(record)
+        used += tokens
+    if current:
+        packs.append(current)
+    return packs
+
+
+def build_pack(records: List[Dict]) -> str:
+    """多记录请求的用户消息，只包含 id 和 content"""
+    return json.dumps({'records': [{'id': r['id'], 'content': r['content']} for r in records]}, ensure_ascii=False)
+
+
+def store_pack(records: List[Dict]) -> str:
+    """
+    保存到文本块中的打包内容
+    代表记录可带 duplicates（近似重复记录的 id 列表），请求时由 request_text 去掉
+    """
+    return json.dumps({'records': records}, ensure_ascii=False)
+
+
+def request_text(chunk: str) -> str:
+    """文本块实际发送给模型的内容"""
+    records = parse_pack(chunk)
+    return chunk if records is None else build_pack(records)
+
+
+def parse_pack(chunk: str) -> Optional[List[Dict]]:
+    """从文本块还原打包的记录，普通文本块返回 None"""
+    if not chunk.startswith('{"records": ['):
+        return None
+    try:
+        data = json.loads(chunk)
+    except json.JSONDecodeError:
+        return None
+    records = data.get('records') if isinstance(data, dict) and len(data) == 1 else None
+    if not isinstance(records, list) or not all(
+            isinstance(r, dict) and {'id', 'content'} <= set(r) <= {'id', 'content', 'duplicates'} for r in records):
+        return None
+    return records
+
+
+def record_text(record: Dict) -> str:
+    """用于近似重复检测的记录文本，忽略记录自带的 id"""
+    content = record['content']
+    if isinstance(content, str):
+        return content
+    if isinstance(content, dict):
+        content = {k: v for k, v in content.items() if k != 'id'}
+    return json.dumps(content, ensure_ascii=False, sort_keys=True)
+
+
+def failure_result(index: int, chunk: str, packed: bool, error: Optional[str]) -> Any:
+    """
+    失败块的错误标记：普通块为 {"chunk": 序号, "error": ...}
+    打包块按记录展开为 {"id": ..., "error": ...}，包括被合并的重复记录
+    """
+    records = parse_pack(chunk) if packed else None
+    if records is None:
+        return {'chunk': index, 'error': error}
+    return [
+        {'id': record_id, 'error': error}
+        for r in records for record_id in [r['id']] + r.get('duplicates', [])
+    ]
+
+
+def with_pack_instruction(system_prompt: str) -> str:
+    """在系统提示词后追加多记录说明"""
+    return system_prompt + PACK_INSTRUCTION
+
+
+def demux_results(data: Any, ids: Iterable[str]) -> Dict[str, Dict]:
+    """
+    按 id 拆分模型返回的结果，只保留请求中的 id
+    兼容直接返回数组、{"records"/"results": [...]} 以及只返回单个对象的情况
+    """
+    wanted = set(ids)
+    if isinstance(data, dict):
+        nested = next((data[k] for k in ('records', 'results') if isinstance(data.get(k), list)), None)
+        data = nested if nested is not None else [data]
+    if not isinstance(data, list):
+        return {}
+
+    found = {}
+    for item in data:
+        if not isinstance(item, dict) or 'id' not in item:
+            continue
+        record_id = str(item['id'])
+        if record_id in wanted and record_id not in found:
+            found[record_id] = dict(item, id=record_id)
+    return found
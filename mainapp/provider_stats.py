@@ -0,0 +1,101 @@
+import math
+import threading
+import time
+from collections import deque
+from typing import Dict, List, Optional
+from django.conf import settings
+
+
+def percentile(values: List[float], q: float) -> Optional[float]:
+    """最近秩法计算百分位数，values 为空时返回 None"""
+    if not values:
+        return None
+    ordered = sorted(values)
+    rank = max(1, math.ceil(q / 100 * len(ordered)))
+    return ordered[rank - 1]
+
+
+class ProviderStats:
+    """
+    单个服务（服务类型 + API 密钥）最近请求的延迟和结果
+    只保留最近 WINDOW_SIZE 个且不超过 WINDOW_SECONDS 的样本；错误率（含 429）过高时暂时摘除
+    """
+
+    def __init__(self, window_size: int, window_seconds: float):
+        self.window_seconds = window_seconds
+        self._samples = deque(maxlen=window_size)  # (时间, 延迟秒数, 结果 ok/error/throttled)
+        self._lock = threading.Lock()
+        self.ejected_until = 0.0
+
+    def record(self, latency: float, outcome: str) -> None:
+        config = settings.PROVIDER_ROUTING
+        now = time.time()
+        with self._lock:
+            self._samples.append((now, latency, outcome))
+            snapshot = self._snapshot(now)
+            if snapshot['count'] >= config['MIN_SAMPLES'] \
+                    and snapshot['error_rate'] + snapshot['throttle_rate'] >= config['EJECT_ERROR_RATE']:
+                # 摘除期间不分配请求；恢复后清空样本重新统计，避免旧的失败样本立即再次触发摘除
+                self.ejected_until = now + config['EJECT_SECONDS']
+                self._samples.clear()
+
+    def is_ejected(self) -> bool:
+        return time.time() < self.ejected_until
+
+    def _snapshot(self, now: float) -> Dict:
+        while self._samples and now - self._samples[0][0] > self.window_seconds:
+            self._samples.popleft()
+        count = len(self._samples)
+        latencies = [latency for _, latency, outcome in self._samples if outcome == 'ok']
+        errors = sum(1 for _, _, outcome in self._samples if outcome == 'error')
+        throttled = sum(1 for _, _, outcome in self._samples if outcome == 'throttled')
+        return {
+            'count': count,
+            'p50': percentile(latencies, 50),
+            'p95': percentile(latencies, 95),
+            'error_rate': errors / count if count else 0.0,
+            'throttle_rate': throttled / count if count else 0.0,
+        }
+
+    def snapshot(self) -> Dict:
+        """当前窗口内的请求数、成功请求的 p50/p95 延迟（秒）、错误率和 429 比例"""
+        with self._lock:
+            snapshot = self._snapshot(time.time())
+        snapshot['ejected'] = self.is_ejected()
+        return snapshot
+
+    def latencies(self) -> List[float]:
+        """当前窗口内成功请求的延迟"""
+        now = time.time()
+        with self._lock:
+            self._snapshot(now)
+            return [latency for _, latency, outcome in self._samples if outcome == 'ok']
+
+
+_provider_stats: Dict[str, ProviderStats] = {}
+_provider_stats_lock = threading.Lock()
+
+
+def get_provider_stats(key: str) -> ProviderStats:
+    """
+    获取进程内共享的服务统计
+    :param key: RateLimiter.make_key 生成的服务标识，服务实例注册表清空后统计仍然保留
+    """
+    stats = _provider_stats.get(key)
+    if stats is None:
+        with _provider_stats_lock:
+            stats = _provider_stats.get(key)
+            if stats is None:
+                config = settings.PROVIDER_ROUTING
+                stats = ProviderStats(config['WINDOW_SIZE'], config['WINDOW_SECONDS'])
+                _provider_stats[key] = stats
+    return stats
+
+
+def record_call(key: str, latency: float, ok: bool, status_code: Optional[int] = None) -> None:
+    """记录一次请求的延迟和结果（429 单独统计）"""
+    if ok:
+        outcome = 'ok'
+    else:
+        outcome = 'throttled' if status_code == 429 else 'error'
+    get_provider_stats(key).record(latency, outcome)
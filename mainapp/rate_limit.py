@@ -0,0 +1,145 @@
+import asyncio
+import hashlib
+import logging
+import os
+import sqlite3
+import threading
+import time
+from typing import Optional
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+
+class RateLimiter:
+    """
+    按服务和 API 密钥区分的 RPM/TPM 令牌桶
+    状态保存在 SQLite 中，用 BEGIN IMMEDIATE 串行化更新，线程之间和进程之间（Web 与 run_workers）共享额度；
+    额度不足时调用方等待，而不是直接失败
+    """
+
+    def __init__(self, path: str):
+        self.path = str(path)
+        self._local = threading.local()
+        os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+        self._connect().execute('''
+            CREATE TABLE IF NOT EXISTS buckets (
+                key TEXT PRIMARY KEY,
+                requests REAL NOT NULL,
+                tokens REAL NOT NULL,
+                updated_at REAL NOT NULL,
+                blocked_until REAL NOT NULL DEFAULT 0
+            )
+        ''')
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            conn.execute('PRAGMA journal_mode=WAL')
+            self._local.conn = conn
+        return conn
+
+    @staticmethod
+    def make_key(service_type: str, api_key: str) -> str:
+        """不直接保存密钥，只使用其摘要"""
+        return f"{service_type}:{hashlib.sha256(api_key.encode('utf-8')).hexdigest()[:16]}"
+
+    def try_acquire(self, key: str, rpm: int, tpm: int, tokens: int) -> float:
+        """
+        尝试扣减 1 次请求和 tokens 个 token
+        :return: 0 表示成功，否则为建议等待的秒数
+        """
+        tokens = min(tokens, tpm)  # 单次请求超过整桶容量时按整桶计算，避免永远等待
+        conn = self._connect()
+        now = time.time()
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            row = conn.execute(
+                'SELECT requests, tokens, updated_at, blocked_until FROM buckets WHERE key = ?', (key,)
+            ).fetchone()
+            if row:
+                elapsed = max(0.0, now - row[2])
+                available_requests = min(rpm, row[0] + elapsed * rpm / 60)
+                available_tokens = min(tpm, row[1] + elapsed * tpm / 60)
+                blocked_until = row[3]
+            else:
+                available_requests, available_tokens, blocked_until = rpm, tpm, 0
+
+            if now < blocked_until:
+                wait = blocked_until - now
+            elif available_requests >= 1 and available_tokens >= tokens:
+                available_requests -= 1
+                available_tokens -= tokens
+                wait = 0.0
+            else:
+                wait = max(
+                    (1 - available_requests) * 60 / rpm,
+                    (tokens - available_tokens) * 60 / tpm,
+                    0.05
+                )
+
+            conn.execute(
+                'INSERT OR REPLACE INTO buckets (key, requests, tokens, updated_at, blocked_until) VALUES (?, ?, ?, ?, ?)',
+                (key, available_requests, available_tokens, now, blocked_until)
+            )
+            conn.execute('COMMIT')
+            return wait
+        except Exception:
+            conn.execute('ROLLBACK')
+            raise
+
+    def acquire(self, key: str, rpm: int, tpm: int, tokens: int) -> float:
+        """阻塞直到获得额度，返回等待的总秒数"""
+        waited = 0.0
+        while True:
+            wait = self.try_acquire(key, rpm, tpm, tokens)
+            if wait <= 0:
+                if waited:
+                    logger.info(f"限流等待 {waited:.1f}s: {key}")
+                return waited
+            time.sleep(wait)
+            waited += wait
+
+    async def aacquire(self, key: str, rpm: int, tpm: int, tokens: int) -> float:
+        """acquire 的异步版本，等待期间不占用线程"""
+        waited = 0.0
+        while True:
+            wait = await asyncio.to_thread(self.try_acquire, key, rpm, tpm, tokens)
+            if wait <= 0:
+                return waited
+            await asyncio.sleep(wait)
+            waited += wait
+
+    def refund(self, key: str, tpm: int, tokens: int) -> None:
+        """请求完成后退还多预估的 token"""
+        if tokens <= 0:
+            return
+        self._connect().execute(
+            'UPDATE buckets SET tokens = MIN(?, tokens + ?) WHERE key = ?', (tpm, tokens, key)
+        )
+
+    def block(self, key: str, seconds: float) -> None:
+        """收到 429 后在指定时间内暂停该桶的所有请求"""
+        until = time.time() + seconds
+        self._connect().execute(
+            'UPDATE buckets SET blocked_until = MAX(blocked_until, ?), requests = 0 WHERE key = ?', (until, key)
+        )
+        logger.warning(f"收到限流响应，暂停 {seconds:.0f}s: {key}")
+
+
+_rate_limiter = None
+_rate_limiter_lock = threading.Lock()
+
+
+def get_rate_limiter() -> Optional[RateLimiter]:
+    """获取进程内共享的限流器，未启用时返回 None"""
+    global _rate_limiter
+    config = settings.AI_RATE_LIMITS
+    if not config.get('ENABLED'):
+        return None
+    if _rate_limiter is None:
+        with _rate_limiter_lock:
+            if _rate_limiter is None:
+                _rate_limiter = RateLimiter(config['PATH'])
+    return _rate_limiter
@@ -0,0 +1,172 @@
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from typing import List, Dict, Optional
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+
+class ResponseCache:
+    """
+    基于 SQLite 的 LLM 响应缓存
+    按内容寻址（服务类型、模型、temperature、完整消息），LRU + TTL 淘汰，
+    多个进程（Web 与 run_workers）共享同一个缓存文件
+    """
+
+    EVICT_EVERY = 50  # 每写入多少次检查一次容量
+
+    def __init__(self, path: str, max_entries: int = 100000, max_bytes: int = 512 * 1024 * 1024,
+                 ttl: int = 30 * 86400):
+        self.path = str(path)
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self._local = threading.local()
+        self._writes = 0
+        self._lock = threading.Lock()
+        os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+        self._init_db()
+
+    def _connect(self) -> sqlite3.Connection:
+        """每个线程使用独立的连接"""
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            self._local.conn = conn
+        return conn
+
+    def _init_db(self) -> None:
+        conn = self._connect()
+        conn.execute('''
+            CREATE TABLE IF NOT EXISTS responses (
+                key TEXT PRIMARY KEY,
+                value TEXT NOT NULL,
+                size INTEGER NOT NULL,
+                created_at REAL NOT NULL,
+                accessed_at REAL NOT NULL
+            )
+        ''')
+        conn.execute('CREATE INDEX IF NOT EXISTS responses_accessed_at ON responses (accessed_at)')
+        conn.execute('CREATE TABLE IF NOT EXISTS counters (name TEXT PRIMARY KEY, value INTEGER NOT NULL)')
+        conn.execute("INSERT OR IGNORE INTO counters (name, value) VALUES ('hits', 0), ('misses', 0)")
+
+    @staticmethod
+    def make_key(provider: str, model: str, temperature: float, messages: List[Dict]) -> str:
+        """根据请求内容生成缓存键，系统提示词和文本块都包含在 messages 中"""
+        payload = json.dumps(
+            [provider, model, temperature, [[m.get('role'), m.get('content')] for m in messages]],
+            ensure_ascii=False,
+            separators=(',', ':')
+        )
+        return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+    def get(self, key: str) -> Optional[str]:
+        """读取缓存，命中时刷新访问时间"""
+        try:
+            conn = self._connect()
+            now = time.time()
+            row = conn.execute(
+                'SELECT value, created_at FROM responses WHERE key = ?', (key,)
+            ).fetchone()
+            if row and now - row[1] <= self.ttl:
+                conn.execute('UPDATE responses SET accessed_at = ? WHERE key = ?', (now, key))
+                conn.execute("UPDATE counters SET value = value + 1 WHERE name = 'hits'")
+                return row[0]
+            if row:
+                conn.execute('DELETE FROM responses WHERE key = ?', (key,))
+            conn.execute("UPDATE counters SET value = value + 1 WHERE name = 'misses'")
+        except sqlite3.Error as e:
+            logger.error(f"读取响应缓存失败: {str(e)}")
+        return None
+
+    def set(self, key: str, value: str) -> None:
+        """写入缓存"""
+        try:
+            now = time.time()
+            self._connect().execute(
+                'INSERT OR REPLACE INTO responses (key, value, size, created_at, accessed_at) VALUES (?, ?, ?, ?, ?)',
+                (key, value, len(value.encode('utf-8')), now, now)
+            )
+            with self._lock:
+                self._writes += 1
+                should_evict = self._writes % self.EVICT_EVERY == 0
+            if should_evict:
+                self.evict()
+        except sqlite3.Error as e:
+            logger.error(f"写入响应缓存失败: {str(e)}")
+
+    def evict(self) -> int:
+        """删除过期条目，再按最近访问时间淘汰超出容量的条目"""
+        conn = self._connect()
+        removed = conn.execute(
+            'DELETE FROM responses WHERE created_at < ?', (time.time() - self.ttl,)
+        ).rowcount
+
+        count, total = conn.execute('SELECT COUNT(*), COALESCE(SUM(size), 0) FROM responses').fetchone()
+        if count > self.max_entries or total > self.max_bytes:
+            # 从最久未访问的条目开始累计，找到需要保留的分界点
+            excess_count = max(0, count - self.max_entries)
+            excess_bytes = max(0, total - self.max_bytes)
+            cutoff = None
+            for n, (accessed_at, size) in enumerate(
+                    conn.execute('SELECT accessed_at, size FROM responses ORDER BY accessed_at'), 1):
+                excess_bytes -= size
+                if n >= excess_count and excess_bytes <= 0:
+                    cutoff = accessed_at
+                    break
+            if cutoff is not None:
+                removed += conn.execute('DELETE FROM responses WHERE accessed_at <= ?', (cutoff,)).rowcount
+        if removed:
+            logger.info(f"响应缓存淘汰 {removed} 条")
+        return removed
+
+    def stats(self) -> Dict:
+        """命中统计和容量信息"""
+        conn = self._connect()
+        counters = dict(conn.execute('SELECT name, value FROM counters').fetchall())
+        count, total = conn.execute('SELECT COUNT(*), COALESCE(SUM(size), 0) FROM responses').fetchone()
+        lookups = counters.get('hits', 0) + counters.get('misses', 0)
+        return {
+            'hits': counters.get('hits', 0),
+            'misses': counters.get('misses', 0),
+            'hit_rate': counters.get('hits', 0) / lookups if lookups else 0,
+            'entries': count,
+            'bytes': total,
+            'max_entries': self.max_entries,
+            'max_bytes': self.max_bytes
+        }
+
+    def clear(self) -> None:
+        """清空缓存和统计"""
+        conn = self._connect()
+        conn.execute('DELETE FROM responses')
+        conn.execute('UPDATE counters SET value = 0')
+
+
+_response_cache = None
+_response_cache_lock = threading.Lock()
+
+
+def get_response_cache() -> Optional[ResponseCache]:
+    """获取进程内共享的响应缓存，未启用时返回 None"""
+    global _response_cache
+    config = settings.LLM_RESPONSE_CACHE
+    if not config.get('ENABLED'):
+        return None
+    if _response_cache is None:
+        with _response_cache_lock:
+            if _response_cache is None:
+                _response_cache = ResponseCache(
+                    path=config['PATH'],
+                    max_entries=config.get('MAX_ENTRIES', 100000),
+                    max_bytes=config.get('MAX_BYTES', 512 * 1024 * 1024),
+                    ttl=config.get('TTL', 30 * 86400)
+                )
+    return _response_cache
@@ -0,0 +1,294 @@
+import asyncio
+import logging
+import random
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import AsyncIterator, Callable, Dict, Iterator, List, NamedTuple, Optional, Tuple
+from django.conf import settings
+from .ai_services import create_ai_service, create_async_ai_service
+from .config_cache import get_api_configs
+from .hedging import get_hedge_budget, hedge_delay, should_hedge
+from .provider_stats import get_provider_stats
+from .rate_limit import RateLimiter
+
+logger = logging.getLogger(__name__)
+
+
+class Provider(NamedTuple):
+    config_id: int
+    label: str
+    weight: int
+    stats_key: str
+    service: object
+
+
+def _provider(config, service) -> Provider:
+    return Provider(
+        config_id=config.id,
+        label=f"{config.service_type}#{config.id}",
+        weight=max(0, config.weight),
+        stats_key=RateLimiter.make_key(config.service_type, config.api_key),
+        service=service
+    )
+
+
+def effective_weights(providers: List[Provider]) -> Dict[int, float]:
+    """
+    按实时统计调整后的权重：配置权重 × 健康度 × 延迟系数
+    健康度 = 1 - 错误率 - 429 比例；延迟系数 = 最快服务的 (p50 + p95) / 本服务的 (p50 + p95)
+    样本不足时只使用配置权重；已摘除的服务权重为 0
+    """
+    config = settings.PROVIDER_ROUTING
+    snapshots = {p.config_id: get_provider_stats(p.stats_key).snapshot() for p in providers}
+    blends = {
+        config_id: s['p50'] + s['p95'] for config_id, s in snapshots.items()
+        if s['count'] >= config['MIN_SAMPLES'] and s['p50'] is not None
+    }
+    fastest = min(blends.values(), default=None)
+
+    weights = {}
+    for p in providers:
+        snapshot = snapshots[p.config_id]
+        if snapshot['ejected']:
+            weights[p.config_id] = 0.0
+            continue
+        weight = float(p.weight)
+        if snapshot['count'] >= config['MIN_SAMPLES']:
+            weight *= max(0.0, 1 - snapshot['error_rate'] - snapshot['throttle_rate'])
+            if p.config_id in blends and blends[p.config_id] > 0:
+                weight *= fastest / blends[p.config_id]
+            # 保留少量流量，服务恢复后统计能随之更新
+            weight = max(weight, p.weight * config['MIN_WEIGHT_RATIO'])
+        weights[p.config_id] = weight
+    return weights
+
+
+class ProviderRouter:
+    """
+    在多个 API 配置之间分配请求，接口与 AIServiceBase 一致
+    每次请求按调整后的权重随机选择服务，失败（包括 429）时换下一个服务重试，最多 MAX_FAILOVER 次
+    开启请求对冲时，首选服务超过其延迟百分位仍未返回，会向下一个服务（只有一个服务时为同一服务）
+    再发一次相同的请求，采用先返回的有效结果；流式请求不对冲
+    """
+
+    def __init__(self, providers: List[Provider]):
+        self.providers = providers
+        context_windows = settings.TEXT_CHUNKING['CONTEXT_WINDOWS']
+        # 分块和上下文裁剪按上下文窗口最小的服务计算，保证每个文本块可以发给任意服务
+        narrowest = min(providers, key=lambda p: context_windows.get(p.service.service_type, 0))
+        self.service_type = narrowest.service.service_type
+        self.max_tokens = min(p.service.max_tokens for p in providers)
+        # 并发数为各服务之和，多个服务同时处理同一任务的文本块
+        self.concurrency = sum(
+            settings.AI_SERVICE_CONCURRENCY.get(p.service.service_type, 1) for p in providers
+        )
+
+    def _ordered(self) -> List[Provider]:
+        """按权重随机排列服务（不放回抽样），只保留首选和故障转移所需的数量"""
+        weights = effective_weights(self.providers)
+        candidates = [p for p in self.providers if weights[p.config_id] > 0]
+        if not candidates:
+            # 所有服务都被摘除时仍按配置权重尝试，不直接拒绝请求
+            candidates = list(self.providers)
+            weights = {p.config_id: p.weight or 1 for p in self.providers}
+
+        ordered = []
+        while candidates and len(ordered) <= settings.PROVIDER_ROUTING['MAX_FAILOVER']:
+            pick = random.uniform(0, sum(weights[p.config_id] for p in candidates))
+            for p in candidates:
+                pick -= weights[p.config_id]
+                if pick <= 0:
+                    break
+            ordered.append(p)
+            candidates.remove(p)
+        return ordered
+
+    @staticmethod
+    def _call(provider: Provider, messages: List[Dict], task_type: str, use_cache: bool,
+              cacheable: Optional[Callable[[str], bool]] = None) -> Optional[str]:
+        try:
+            return provider.service.chat_completion(messages, task_type=task_type, use_cache=use_cache,
+                                                    cacheable=cacheable)
+        except Exception as e:
+            logger.error(f"{provider.label} 调用失败: {str(e)}")
+            return None
+
+    def _hedged_call(self, providers: List[Provider], messages: List[Dict], task_type: str, use_cache: bool,
+                     cacheable: Optional[Callable[[str], bool]] = None) -> Tuple[Optional[str], List[Provider]]:
+        """
+        首选服务超过延迟阈值未返回时发出对冲请求，返回 (先到的有效结果, 已尝试的服务)
+        被放弃的请求无法中断，在后台线程中结束（结果仍会写入响应缓存和延迟统计）
+        """
+        primary = providers[0]
+        budget = get_hedge_budget()
+        budget.on_request()
+        delay = hedge_delay(primary.stats_key)
+        if delay is None:
+            return self._call(primary, messages, task_type, use_cache, cacheable), [primary]
+
+        executor = ThreadPoolExecutor(max_workers=2)
+        try:
+            first = executor.submit(self._call, primary, messages, task_type, use_cache, cacheable)
+            futures = {first: primary}
+            done, _ = wait(futures, timeout=delay)
+            if not done and budget.try_spend():
+                secondary = providers[1] if len(providers) > 1 else primary
+                logger.info(f"{primary.label} 超过 {delay:.1f}s 未返回，向 {secondary.label} 发送对冲请求")
+                futures[executor.submit(self._call, secondary, messages, task_type, use_cache, cacheable)] = secondary
+
+            pending = set(futures)
+            while pending:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    result = future.result()
+                    if result is not None:
+                        if future is not first:
+                            budget.on_hedge_win()
+                        return result, list(futures.values())
+            return None, list(futures.values())
+        finally:
+            executor.shutdown(wait=False)
+
+    def chat_completion(self, messages: List[Dict], task_type: str = 'chat', use_cache: bool = True,
+                        cacheable: Optional[Callable[[str], bool]] = None) -> Optional[str]:
+        providers = self._ordered()
+        hedged = should_hedge(task_type)
+        if hedged:
+            result, tried = self._hedged_call(providers, messages, task_type, use_cache, cacheable)
+            if result is not None:
+                return result
+            providers = [p for p in providers if p not in tried]
+        for attempt, provider in enumerate(providers):
+            if attempt or hedged:
+                logger.warning(f"切换到 {provider.label} 重试")
+            result = self._call(provider, messages, task_type, use_cache, cacheable)
+            if result is not None:
+                return result
+        return None
+
+    def stream_chat_completion(self, messages: List[Dict], task_type: str = 'chat') -> Iterator[str]:
+        """流式请求只在收到第一段内容之前切换服务，之后出错直接抛出"""
+        providers = self._ordered()
+        for attempt, provider in enumerate(providers):
+            started = False
+            try:
+                for delta in provider.service.stream_chat_completion(messages, task_type):
+                    started = True
+                    yield delta
+                return
+            except Exception as e:
+                if started or attempt == len(providers) - 1:
+                    raise
+                logger.warning(f"{provider.label} 流式调用失败，切换服务: {str(e)}")
+
+
+class AsyncProviderRouter(ProviderRouter):
+    """ProviderRouter 的异步版本，服务为 AsyncAIServiceBase 实例"""
+
+    @staticmethod
+    async def _acall(provider: Provider, messages: List[Dict], task_type: str, use_cache: bool,
+                     cacheable: Optional[Callable[[str], bool]] = None) -> Optional[str]:
+        try:
+            return await provider.service.chat_completion(messages, task_type=task_type, use_cache=use_cache,
+                                                          cacheable=cacheable)
+        except Exception as e:
+            logger.error(f"{provider.label} 异步调用失败: {str(e)}")
+            return None
+
+    async def _ahedged_call(self, providers: List[Provider], messages: List[Dict], task_type: str, use_cache: bool,
+                            cacheable: Optional[Callable[[str], bool]] = None) -> Tuple[Optional[str], List[Provider]]:
+        """_hedged_call 的异步版本，得到结果后取消未完成的请求"""
+        primary = providers[0]
+        budget = get_hedge_budget()
+        budget.on_request()
+        delay = hedge_delay(primary.stats_key)
+        if delay is None:
+            return await self._acall(primary, messages, task_type, use_cache, cacheable), [primary]
+
+        first = asyncio.ensure_future(self._acall(primary, messages, task_type, use_cache, cacheable))
+        tasks = {first: primary}
+        pending = set(tasks)
+        try:
+            done, _ = await asyncio.wait(pending, timeout=delay)
+            if not done and budget.try_spend():
+                secondary = providers[1] if len(providers) > 1 else primary
+                logger.info(f"{primary.label} 超过 {delay:.1f}s 未返回，向 {secondary.label} 发送对冲请求")
+                hedge = self._acall(secondary, messages, task_type, use_cache, cacheable)
+                tasks[asyncio.ensure_future(hedge)] = secondary
+                pending = set(tasks)
+
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    result = task.result()
+                    if result is not None:
+                        if task is not first:
+                            budget.on_hedge_win()
+                        return result, list(tasks.values())
+            return None, list(tasks.values())
+        finally:
+            for task in pending:
+                task.cancel()
+
+    async def chat_completion(self, messages: List[Dict], task_type: str = 'chat', use_cache: bool = True,
+                              cacheable: Optional[Callable[[str], bool]] = None) -> Optional[str]:
+        providers = self._ordered()
+        hedged = should_hedge(task_type)
+        if hedged:
+            result, tried = await self._ahedged_call(providers, messages, task_type, use_cache, cacheable)
+            if result is not None:
+                return result
+            providers = [p for p in providers if p not in tried]
+        for attempt, provider in enumerate(providers):
+            if attempt or hedged:
+                logger.warning(f"切换到 {provider.label} 重试")
+            result = await self._acall(provider, messages, task_type, use_cache, cacheable)
+            if result is not None:
+                return result
+        return None
+
+    async def stream_chat_completion(self, messages: List[Dict], task_type: str = 'chat') -> AsyncIterator[str]:
+        providers = self._ordered()
+        for attempt, provider in enumerate(providers):
+            started = False
+            try:
+                async for delta in provider.service.stream_chat_completion(messages, task_type):
+                    started = True
+                    yield delta
+                return
+            except Exception as e:
+                if started or attempt == len(providers) - 1:
+                    raise
+                logger.warning(f"{provider.label} 流式调用失败，切换服务: {str(e)}")
+
+
+def routed_configs(primary) -> List:
+    """参与路由的 API 配置：primary 在前，其后是其他启用的配置；未开启路由时只有 primary"""
+    if not settings.PROVIDER_ROUTING['ENABLED']:
+        return [primary]
+    return [primary] + [c for c in get_api_configs() if c.pk != primary.pk]
+
+
+def create_routed_service(configs: List, async_service: bool = False):
+    """
+    按配置列表创建服务：只有一个配置且未开启请求对冲时直接返回该服务实例，否则返回路由
+    异步服务需在事件循环中创建（连接池绑定在事件循环上），配置列表由调用方预先读取
+    """
+    build = create_async_ai_service if async_service else create_ai_service
+    providers = [_provider(c, build(c.service_type, c.api_key, c.base_url)) for c in configs]
+    if len(providers) == 1 and not settings.REQUEST_HEDGING['ENABLED']:
+        return providers[0].service
+    logger.info(f"多服务路由: {', '.join(f'{p.label}(权重 {p.weight})' for p in providers)}")
+    return (AsyncProviderRouter if async_service else ProviderRouter)(providers)
+
+
+def provider_status() -> List[Dict]:
+    """各启用配置的权重、调整后的权重和实时统计"""
+    providers = [_provider(c, None) for c in get_api_configs()]
+    weights = effective_weights(providers)
+    return [{
+        'config_id': p.config_id,
+        'provider': p.label,
+        'weight': p.weight,
+        'effective_weight': round(weights[p.config_id], 3),
+        **get_provider_stats(p.stats_key).snapshot()
+    } for p in providers]
@@ -1,13 +1,67 @@
+from django.conf import settings
 from django.core.cache import cache
-from django.db.models import Q
+from django.db.models import QuerySet
 from .models import APIConfig, ChatMessage, SystemPrompt
-from .ai_services import AIServiceFactory
+from .routing import create_routed_service, routed_configs
+from .config_cache import get_default_prompt
+from asgiref.sync import sync_to_async
 import logging
-from typing import Optional
+from typing import Optional, List, Dict, Union, Iterator, AsyncIterator
 from .exceptions import AIWebException 
+from .tokens import count_text_tokens_batch, get_token_counter
 
 logger = logging.getLogger(__name__)
 
+CHAT_HISTORY_LIMIT = 10  # 作为上下文的最近消息数
+
+
+def is_probe_message(content: str) -> bool:
+    """API 验证和测试消息，不作为对话上下文"""
+    text = content.strip()
+    return text.lower() == 'test' or 'API验证' in text
+
+
+def recent_history(session_id: str, before_id: Optional[int] = None) -> QuerySet:
+    """
+    会话中最近的消息（从新到旧）
+    沿 (session_id, is_probe, id) 索引倒序读取，只取 CHAT_HISTORY_LIMIT 条
+    :param before_id: 只取该消息之前的历史（排除刚保存的当前消息）
+    """
+    messages = ChatMessage.objects.filter(session_id=session_id, is_probe=False)
+    if before_id:
+        messages = messages.filter(id__lt=before_id)
+    return messages.order_by('-id')[:CHAT_HISTORY_LIMIT]
+
+
+def build_chat_messages(system_content: Optional[str], history, message: str) -> List[Dict]:
+    """组装系统提示词、历史消息和当前消息"""
+    messages = []
+    if system_content:
+        messages.append({"role": "system", "content": system_content})
+    
+    # 添加历史消息，确保是有效的对话内容
+    for msg in history:
+        if msg.content.strip():  # 确保消息不是空的
+            messages.append({
+                "role": msg.role,
+                "content": msg.content
+            })
+    
+    # 添加当前消息
+    messages.append({"role": "user", "content": message})
+    return messages
+
+
+def fit_chat_messages(messages: List[Dict], service) -> List[Dict]:
+    """按模型上下文窗口裁剪历史消息，为回复预留 max_tokens"""
+    config = settings.TEXT_CHUNKING
+    context_window = config['CONTEXT_WINDOWS'].get(service.service_type, config['DEFAULT_CONTEXT_WINDOW'])
+    trimmed = get_token_counter().truncate(messages, context_window - service.max_tokens)
+    if len(trimmed) < len(messages):
+        logger.info(f"历史消息超出上下文窗口，已裁剪 {len(messages) - len(trimmed)} 条")
+    return trimmed
+
+
 class ChatService:
     def __init__(self, api_config: APIConfig):
         """
@@ -18,54 +72,40 @@ class ChatService:
             raise AIWebException("API配置不能为空")
             
         self.api_config = api_config
-        self.service = AIServiceFactory.create_service(
-            service_type=api_config.service_type,
-            api_key=api_config.api_key,
-            base_url=api_config.base_url
-        )
+        try:
+            # 存在多个启用的配置时按路由分配，失败时切换服务
+            self.service = create_routed_service(routed_configs(api_config))
+        except ValueError as e:
+            logger.error(f"创建AI服务失败: {str(e)}")
+            self.service = None
         
         if not self.service:
             raise AIWebException("创建AI服务失败")
             
         # 获取默认的聊天系统提示词
-        self.system_prompt = SystemPrompt.objects.filter(
-            type='chat',
-            is_default=True
-        ).first()
+        self.system_prompt = get_default_prompt('chat')
 
-    def process_message(self, message: str, session_id: str = 'default') -> dict:
+    def process_message(self, message: str, session_id: str = 'default', stream: bool = False,
+                        before_id: Optional[int] = None) -> Union[dict, Iterator[str]]:
         """
         处理聊天消息
         :param message: 用户消息
         :param session_id: 会话ID
+        :param stream: 为 True 时返回逐段生成回复的迭代器
+        :param before_id: 当前消息已保存时传入其 ID，历史中不再重复包含
         :return: 处理结果
         """
         try:
             # 使用系统提示词（如果存在）
             system_content = self.system_prompt.content if self.system_prompt else None
             
-            # 获取历史消息，使用 Q 对象组合多个条件
-            history = ChatMessage.objects.filter(
-                session_id=session_id
-            ).filter(
-                ~Q(content__contains='API验证') & 
-                ~Q(content__contains='test')
-            ).order_by('timestamp')[:10]  # 限制历史消息数量
+            # 获取最近的历史消息，按时间正序排列
+            history = list(recent_history(session_id, before_id))[::-1]
             
-            messages = []
-            if system_content:
-                messages.append({"role": "system", "content": system_content})
+            messages = fit_chat_messages(build_chat_messages(system_content, history, message), self.service)
             
-            # 添加历史消息，确保是有效的对话内容
-            for msg in history:
-                if msg.content.strip():  # 确保消息不是空的
-                    messages.append({
-                        "role": msg.role,
-                        "content": msg.content
-                    })
-            
-            # 添加当前消息
-            messages.append({"role": "user", "content": message})
+            if stream:
+                return self.service.stream_chat_completion(messages)
             
             # 调用AI服务
             response = self.service.chat_completion(messages)
@@ -73,10 +113,70 @@ class ChatService:
             return {
                 'reply': response,
                 'status': 'success',
-                'tokens_used': len(message + response) // 4,  # 估算token数
+                'tokens_used': sum(count_text_tokens_batch([message, response])),
                 'max_tokens': self.service.max_tokens
             }
             
         except Exception as e:
             logger.error(f"处理消息错误: {str(e)}", exc_info=True)
             raise AIWebException(f"处理消息失败: {str(e)}")
+
+
+class AsyncChatService:
+    """异步聊天服务，供 ASGI 下的异步视图使用"""
+    
+    def __init__(self, api_config: APIConfig, system_prompt: Optional[SystemPrompt] = None,
+                 configs: Optional[List[APIConfig]] = None):
+        """
+        :param configs: 参与路由的配置（routed_configs 的结果），为空时只使用 api_config
+        """
+        if not api_config:
+            raise AIWebException("API配置不能为空")
+            
+        self.api_config = api_config
+        try:
+            self.service = create_routed_service(configs or [api_config], async_service=True)
+        except ValueError as e:
+            raise AIWebException(f"创建AI服务失败: {str(e)}")
+        self.system_prompt = system_prompt
+
+    @classmethod
+    async def create(cls, api_config: APIConfig) -> 'AsyncChatService':
+        """创建服务实例并加载默认的聊天系统提示词和参与路由的配置"""
+        system_prompt = await sync_to_async(get_default_prompt)('chat')
+        configs = await sync_to_async(routed_configs)(api_config)
+        return cls(api_config, system_prompt, configs)
+
+    async def process_message(self, message: str, session_id: str = 'default', stream: bool = False,
+                              before_id: Optional[int] = None) -> Union[dict, AsyncIterator[str]]:
+        """
+        异步处理聊天消息
+        :param message: 用户消息
+        :param session_id: 会话ID
+        :param stream: 为 True 时返回逐段生成回复的异步迭代器
+        :param before_id: 当前消息已保存时传入其 ID，历史中不再重复包含
+        :return: 处理结果
+        """
+        try:
+            system_content = self.system_prompt.content if self.system_prompt else None
+            
+            history = [msg async for msg in recent_history(session_id, before_id)][::-1]
+            messages = fit_chat_messages(build_chat_messages(system_content, history, message), self.service)
+            
+            if stream:
+                return self.service.stream_chat_completion(messages)
+            
+            response = await self.service.chat_completion(messages)
+            if response is None:
+                raise AIWebException("AI服务未返回结果")
+            
+            return {
+                'reply': response,
+                'status': 'success',
+                'tokens_used': sum(count_text_tokens_batch([message, response])),
+                'max_tokens': self.service.max_tokens
+            }
+            
+        except Exception as e:
+            logger.error(f"异步处理消息错误: {str(e)}", exc_info=True)
+            raise AIWebException(f"处理消息失败: {str(e)}")
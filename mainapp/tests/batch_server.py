@@ -0,0 +1,124 @@
+import json
+import re
+import threading
+import time
+from email.parser import BytesParser
+from email.policy import HTTP
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Callable, Dict, List, Optional
+
+
+class BatchServer:
+    """
+    本地模拟的 OpenAI 兼容批处理服务，只实现 /files 和 /batches 中用到的接口
+    批处理提交后保持 validating 状态，调用 finish() 时按 responder 生成每个请求的结果
+    :param responder: 根据请求体生成回复文本，返回 None 表示该请求失败（写入错误文件）
+    """
+
+    def __init__(self, responder: Optional[Callable[[Dict], Optional[str]]] = None):
+        self.responder = responder or (lambda body: '{"output": "ok"}')
+        self.files: Dict[str, bytes] = {}
+        self.batches: Dict[str, Dict] = {}
+        self.requests: List[str] = []
+        self._lock = threading.Lock()
+        self._httpd = ThreadingHTTPServer(('127.0.0.1', 0), self._handler())
+        self.url = f"http://127.0.0.1:{self._httpd.server_address[1]}/v1"
+        self._thread = threading.Thread(target=self._httpd.serve_forever, daemon=True)
+
+    def __enter__(self) -> 'BatchServer':
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self._httpd.shutdown()
+        self._httpd.server_close()
+
+    def _new_file(self, data: bytes) -> str:
+        with self._lock:
+            file_id = f"file-{len(self.files) + 1}"
+            self.files[file_id] = data
+        return file_id
+
+    def finish(self, batch_id: str, status: str = 'completed') -> None:
+        """结束批处理：逐条生成结果写入输出文件和错误文件"""
+        batch = self.batches[batch_id]
+        outputs, errors = [], []
+        for line in self.files[batch['input_file_id']].decode('utf-8').splitlines():
+            request = json.loads(line)
+            reply = self.responder(request['body']) if status == 'completed' else None
+            if reply is None:
+                errors.append({'id': f"req-{request['custom_id']}", 'custom_id': request['custom_id'],
+                               'response': {'status_code': 500, 'body': {'error': {'message': '模拟失败'}}}})
+                continue
+            outputs.append({'id': f"req-{request['custom_id']}", 'custom_id': request['custom_id'], 'response': {
+                'status_code': 200,
+                'body': {'choices': [{'index': 0, 'message': {'role': 'assistant', 'content': reply}}]}
+            }})
+        batch['status'] = status
+        batch['request_counts'] = {'total': len(outputs) + len(errors), 'completed': len(outputs),
+                                   'failed': len(errors)}
+        if outputs:
+            batch['output_file_id'] = self._new_file(
+                '\n'.join(json.dumps(o, ensure_ascii=False) for o in outputs).encode('utf-8'))
+        if errors:
+            batch['error_file_id'] = self._new_file(
+                '\n'.join(json.dumps(e, ensure_ascii=False) for e in errors).encode('utf-8'))
+
+    def _handler(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, format, *args):
+                pass
+
+            def _send(self, status: int, body, content_type: str = 'application/json') -> None:
+                data = body if isinstance(body, bytes) else json.dumps(body, ensure_ascii=False).encode('utf-8')
+                self.send_response(status)
+                self.send_header('Content-Type', content_type)
+                self.send_header('Content-Length', str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def _body(self) -> bytes:
+                return self.rfile.read(int(self.headers.get('Content-Length') or 0))
+
+            def do_POST(self):
+                server.requests.append(f"POST {self.path}")
+                if self.path == '/v1/files':
+                    message = BytesParser(policy=HTTP).parsebytes(
+                        f"Content-Type: {self.headers['Content-Type']}\r\n\r\n".encode() + self._body()
+                    )
+                    parts = {part.get_param('name', header='content-disposition'): part
+                             for part in message.iter_parts()}
+                    data = parts['file'].get_payload(decode=True)
+                    file_id = server._new_file(data)
+                    self._send(200, {'id': file_id, 'object': 'file', 'bytes': len(data),
+                                     'created_at': int(time.time()), 'filename': parts['file'].get_filename(),
+                                     'purpose': parts['purpose'].get_content().strip(), 'status': 'processed'})
+                elif self.path == '/v1/batches':
+                    body = json.loads(self._body())
+                    batch_id = f"batch-{len(server.batches) + 1}"
+                    lines = server.files[body['input_file_id']].decode('utf-8').splitlines()
+                    server.batches[batch_id] = {
+                        'id': batch_id, 'object': 'batch', 'endpoint': body['endpoint'],
+                        'input_file_id': body['input_file_id'], 'completion_window': body['completion_window'],
+                        'status': 'validating', 'created_at': int(time.time()), 'output_file_id': None,
+                        'error_file_id': None, 'request_counts': {'total': len(lines), 'completed': 0, 'failed': 0}
+                    }
+                    self._send(200, server.batches[batch_id])
+                else:
+                    self._send(404, {'error': {'message': 'not found'}})
+
+            def do_GET(self):
+                server.requests.append(f"GET {self.path}")
+                match = re.fullmatch(r'/v1/batches/([\w-]+)', self.path)
+                if match and match.group(1) in server.batches:
+                    self._send(200, server.batches[match.group(1)])
+                    return
+                match = re.fullmatch(r'/v1/files/([\w-]+)/content', self.path)
+                if match and match.group(1) in server.files:
+                    self._send(200, server.files[match.group(1)], 'application/octet-stream')
+                    return
+                self._send(404, {'error': {'message': 'not found'}})
+
+        return Handler
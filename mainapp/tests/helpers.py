@@ -0,0 +1,113 @@
+import shutil
+import tempfile
+import threading
+from typing import Callable, Dict, List, Optional
+from django.conf import settings
+from django.test import TestCase, override_settings
+from mainapp import config_cache, hedging, provider_stats, rate_limit, response_cache
+from mainapp.ai_services import AIServiceBase, AsyncAIServiceBase, clear_service_registry
+from mainapp.models import CleaningDimension, LabelingDimension
+
+
+def _reset_singletons() -> None:
+    config_cache._config_cache = None
+    rate_limit._rate_limiter = None
+    response_cache._response_cache = None
+    hedging._hedge_budget = None
+    provider_stats._provider_stats.clear()
+    clear_service_registry()
+
+
+class IsolatedTestCase(TestCase):
+    """
+    每个测试使用独立的临时目录保存限流、响应缓存、配置版本和上传文件，并重置进程内的单例
+    默认关闭限流和响应缓存，重试不等待；需要时在测试中用 override_settings 打开
+    """
+
+    def setUp(self):
+        super().setUp()
+        self.tmpdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tmpdir, ignore_errors=True)
+        overrides = override_settings(
+            CONFIG_CACHE_VERSION_FILE=f'{self.tmpdir}/config.version',
+            MEDIA_ROOT=f'{self.tmpdir}/media',
+            AI_RATE_LIMITS={**settings.AI_RATE_LIMITS, 'ENABLED': False, 'PATH': f'{self.tmpdir}/rate_limits.sqlite3'},
+            LLM_RESPONSE_CACHE={**settings.LLM_RESPONSE_CACHE, 'ENABLED': False,
+                                'PATH': f'{self.tmpdir}/llm_responses.sqlite3'},
+            CHUNK_RETRIES={'MAX_ATTEMPTS': 3, 'BACKOFF_BASE': 0, 'BACKOFF_MAX': 0},
+        )
+        overrides.enable()
+        self.addCleanup(overrides.disable)
+        _reset_singletons()
+        self.addCleanup(_reset_singletons)
+
+    @staticmethod
+    def dimension_ids(process_type: str, names: Optional[List[str]] = None) -> List[int]:
+        """迁移中创建的默认维度 ID"""
+        model = CleaningDimension if process_type == 'cleaning' else LabelingDimension
+        dimensions = model.objects.all()
+        if names is not None:
+            dimensions = dimensions.filter(name__in=names)
+        return list(dimensions.values_list('id', flat=True))
+
+
+def user_content(messages: List[Dict]) -> str:
+    return messages[-1]['content']
+
+
+class FakeService(AIServiceBase):
+    """
+    不发送网络请求的同步服务
+    :param reply: 根据请求消息生成回复，返回 None 表示调用失败
+    """
+
+    service_type = 'openai'
+    model = 'fake-model'
+
+    def __init__(self, reply: Optional[Callable[[List[Dict]], Optional[str]]] = None, api_key: str = 'test-key'):
+        super().__init__(api_key)
+        self.reply = reply or (lambda messages: '{"output": "ok"}')
+        self.calls: List[List[Dict]] = []
+        self._calls_lock = threading.Lock()
+
+    def _chat_completion(self, messages: List[Dict], task_type: str) -> Optional[str]:
+        with self._calls_lock:
+            self.calls.append(messages)
+        return self.reply(messages)
+
+    def stream_chat_completion(self, messages: List[Dict], task_type: str = 'chat'):
+        reply = self._chat_completion(messages, task_type)
+        if reply is None:
+            raise RuntimeError('stream failed')
+        for i in range(0, len(reply), 2):
+            yield reply[i:i + 2]
+
+    def validate_api_key(self) -> bool:
+        return True
+
+
+class AsyncFakeService(AsyncAIServiceBase):
+    """FakeService 的异步版本，reply 可以是普通函数或协程函数"""
+
+    service_type = 'openai'
+    model = 'fake-model'
+
+    def __init__(self, reply=None, api_key: str = 'test-key'):
+        super().__init__(api_key)
+        self.reply = reply or (lambda messages: '{"output": "ok"}')
+        self.calls: List[List[Dict]] = []
+
+    def get_default_base_url(self) -> str:
+        return 'http://127.0.0.1:9/v1'
+
+    async def _chat_completion(self, messages: List[Dict], task_type: str) -> Optional[str]:
+        self.calls.append(messages)
+        result = self.reply(messages)
+        if hasattr(result, '__await__'):
+            result = await result
+        return result
+
+    async def stream_chat_completion(self, messages: List[Dict], task_type: str = 'chat'):
+        reply = await self._chat_completion(messages, task_type)
+        for i in range(0, len(reply), 2):
+            yield reply[i:i + 2]
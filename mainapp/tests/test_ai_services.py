@@ -0,0 +1,53 @@
+import asyncio
+from mainapp.ai_services import (AIServiceFactory, DeepseekService, OpenAIService, create_ai_service,
+                                 create_async_ai_service)
+from mainapp.models import APIConfig
+from .helpers import IsolatedTestCase
+
+
+class ServiceRegistryTests(IsolatedTestCase):
+    def test_same_config_reuses_one_instance_and_its_client(self):
+        service = create_ai_service('openai', 'key-1', 'https://example.test/v1')
+        self.assertIsInstance(service, OpenAIService)
+        self.assertIs(create_ai_service('openai', 'key-1', 'https://example.test/v1'), service)
+        self.assertIs(AIServiceFactory.create_service('openai', 'key-1', 'https://example.test/v1'), service)
+        self.assertIs(service.client._client, service.http_client)
+
+    def test_key_and_base_url_distinguish_instances(self):
+        service = create_ai_service('openai', 'key-1')
+        self.assertIsNot(create_ai_service('openai', 'key-2'), service)
+        self.assertIsNot(create_ai_service('openai', 'key-1', 'https://other.test/v1'), service)
+
+    def test_base_url_is_ignored_for_fixed_endpoint_providers(self):
+        service = create_ai_service('deepseek', 'key-1')
+        self.assertIsInstance(service, DeepseekService)
+        self.assertIs(create_ai_service('deepseek', 'key-1', 'https://ignored.test/v1'), service)
+
+    def test_http_client_uses_configured_pool(self):
+        pool = create_ai_service('openai', 'key-1').http_client._transport._pool
+        self.assertEqual(pool._max_connections, 32)
+        self.assertEqual(pool._max_keepalive_connections, 16)
+
+    def test_saving_or_deleting_api_config_drops_instances(self):
+        service = create_ai_service('openai', 'key-1')
+        config = APIConfig.objects.create(service_type='openai', api_key='key-1')
+        created = create_ai_service('openai', 'key-1')
+        self.assertIsNot(created, service)
+
+        config.delete()
+        self.assertIsNot(create_ai_service('openai', 'key-1'), created)
+
+    def test_unknown_service_type(self):
+        with self.assertRaises(ValueError):
+            create_ai_service('unknown', 'key-1')
+
+
+class AsyncServiceRegistryTests(IsolatedTestCase):
+    def test_async_instances_are_cached_per_event_loop(self):
+        async def create_twice():
+            return create_async_ai_service('openai', 'key-1'), create_async_ai_service('openai', 'key-1')
+
+        first, second = asyncio.run(create_twice())
+        self.assertIs(first, second)
+        other, _ = asyncio.run(create_twice())
+        self.assertIsNot(other, first)
@@ -0,0 +1,133 @@
+import json
+import re
+from unittest import mock
+from django.conf import settings
+from django.test import override_settings
+from mainapp import ai_services, jobs
+from mainapp.batch import build_batch_file, poll_batch_jobs
+from mainapp.models import APIConfig, BatchJob
+from .batch_server import BatchServer
+from .helpers import FakeService, IsolatedTestCase
+from .test_processing import dialogue
+
+
+def first_turn_reply(body):
+    turn = re.search(r'第(\d+)段', body['messages'][-1]['content']).group(1)
+    return json.dumps({'first': int(turn)})
+
+
+@override_settings(NEAR_DUPLICATE_DETECTION={'ENABLED': False, 'MAX_DISTANCE': 0, 'NGRAM': 3})
+class BatchProcessingTests(IsolatedTestCase):
+    def setUp(self):
+        super().setUp()
+        self.server = BatchServer(first_turn_reply)
+        self.server.__enter__()
+        self.addCleanup(self.server.__exit__)
+        overrides = override_settings(BATCH_PROCESSING={**settings.BATCH_PROCESSING,
+                                                        'BASE_URLS': {'openai': self.server.url}})
+        overrides.enable()
+        self.addCleanup(overrides.disable)
+
+        APIConfig.objects.create(service_type='openai', api_key='test-key')
+        self.service = FakeService()
+        self.service.max_tokens = 200
+        patcher = mock.patch.object(ai_services, '_build_ai_service', return_value=self.service)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def submit(self, turns: int = 30):
+        job = jobs.enqueue_job(dialogue(turns), 'labeling', self.dimension_ids('labeling')[:2],
+                               execution_mode='batch')
+        self.assertTrue(jobs.run_job(jobs.claim_next_job('w1')))
+        job.refresh_from_db()
+        return job
+
+    def test_submit_poll_collect(self):
+        job = self.submit()
+        self.assertEqual(job.status, 'waiting')
+        batch = BatchJob.objects.get(job=job)
+        self.assertEqual(self.server.batches[batch.batch_id]['endpoint'], '/v1/chat/completions')
+        lines = self.server.files[batch.input_file_id].decode('utf-8').splitlines()
+        self.assertEqual(len(lines), job.total_chunks)
+        self.assertEqual(self.service.calls, [])  # 没有实时调用
+
+        self.assertEqual(poll_batch_jobs(poll_interval=0), 1)
+        job.refresh_from_db()
+        self.assertEqual(job.status, 'waiting')
+
+        self.server.finish(batch.batch_id)
+        poll_batch_jobs(poll_interval=0)
+        job.refresh_from_db()
+        batch.refresh_from_db()
+        self.assertEqual(job.status, 'completed')
+        self.assertEqual(batch.status, 'completed')
+        self.assertIsNotNone(batch.completed_at)
+        firsts = [item['first'] for item in json.loads(job.result)]
+        self.assertEqual(len(firsts), job.total_chunks)
+        self.assertEqual(firsts, sorted(firsts))
+        self.assertFalse(job.chunks.exclude(status='completed').exists())
+
+    def test_failed_requests_are_recorded_per_chunk(self):
+        self.server.responder = lambda body: None if '第0段' in body['messages'][-1]['content'] \
+            else first_turn_reply(body)
+        job = self.submit()
+        self.server.finish(job.batch.batch_id)
+        poll_batch_jobs(poll_interval=0)
+
+        job.refresh_from_db()
+        self.assertEqual(job.status, 'completed')
+        failed = job.chunks.get(status='failed')
+        self.assertEqual(failed.index, 1)
+        self.assertIn('模拟失败', failed.error)
+        firsts = [item['first'] for item in json.loads(job.result)]
+        self.assertEqual(len(firsts), job.total_chunks - 1)
+        self.assertNotIn(0, firsts)
+
+    def test_missing_records_are_deferred_to_a_realtime_job(self):
+        def reply(body):
+            ids = [r['id'] for r in json.loads(body['messages'][-1]['content'])['records']]
+            return json.dumps([{'id': i, 'label': 'batch'} for i in ids if i != 'r1'])
+
+        self.server.responder = reply
+        self.service.reply = lambda messages: json.dumps([{'id': 'r1', 'label': 'realtime'}])
+        content = json.dumps([{'id': f'r{i}', 'text': f'第{i}条记录'} for i in range(3)], ensure_ascii=False)
+        job = jobs.enqueue_job(content, 'labeling', self.dimension_ids('labeling')[:2], use_cache=False,
+                               execution_mode='batch')
+        jobs.run_job(jobs.claim_next_job('w1'))
+        job.refresh_from_db()
+        self.assertTrue(job.packed)
+
+        self.server.finish(job.batch.batch_id)
+        with mock.patch.object(self.service, 'chat_completion', wraps=self.service.chat_completion) as call:
+            poll_batch_jobs(poll_interval=0)
+            job.refresh_from_db()
+            self.assertEqual(job.status, 'queued')
+            self.assertEqual(job.chunks.get().status, 'pending')
+            call.assert_not_called()  # 查询线程中没有实时调用
+
+            self.assertTrue(jobs.run_job(jobs.claim_next_job('w2')))
+            self.assertFalse(call.call_args.kwargs['use_cache'])
+        job.refresh_from_db()
+        self.assertEqual(job.status, 'completed')
+        self.assertEqual([item['id'] for item in json.loads(job.result)], ['r0', 'r1', 'r2'])
+
+    def test_expired_batch_fails_the_job(self):
+        job = self.submit()
+        self.server.finish(job.batch.batch_id, status='expired')
+        poll_batch_jobs(poll_interval=0)
+
+        job.refresh_from_db()
+        self.assertEqual(job.status, 'failed')
+        self.assertIn('expired', job.error)
+
+    def test_recently_polled_batches_are_skipped(self):
+        self.submit()
+        self.assertEqual(poll_batch_jobs(poll_interval=0), 1)
+        self.assertEqual(poll_batch_jobs(poll_interval=3600), 0)
+
+    def test_batch_file_uses_task_temperature_and_chunk_ids(self):
+        lines = build_batch_file(self.service, {1: '甲', 3: '乙'}, '提示词', 'labeling').decode('utf-8').splitlines()
+        requests = [json.loads(line) for line in lines]
+        self.assertEqual([r['custom_id'] for r in requests], ['chunk-1', 'chunk-3'])
+        self.assertEqual(requests[0]['body']['temperature'], self.service.task_temperatures['labeling'])
+        self.assertEqual(requests[0]['body']['messages'][0], {'role': 'system', 'content': '提示词'})
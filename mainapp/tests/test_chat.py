@@ -0,0 +1,161 @@
+import importlib
+import json
+from unittest import mock
+from django.apps import apps as django_apps
+from django.contrib.auth.models import User
+from mainapp import ai_services
+from mainapp.models import APIConfig, ChatMessage, ChatSession
+from mainapp.services import is_probe_message, recent_history
+from .helpers import AsyncFakeService, FakeService, IsolatedTestCase, user_content
+
+
+class AsyncChatViewTests(IsolatedTestCase):
+    def setUp(self):
+        super().setUp()
+        APIConfig.objects.create(service_type='openai', api_key='test-key')
+        self.service = AsyncFakeService(lambda messages: f"回复：{user_content(messages)}")
+        patcher = mock.patch.object(ai_services, '_build_async_ai_service', return_value=self.service)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def post(self, payload):
+        return self.client.post('/async/chat/', json.dumps(payload), content_type='application/json')
+
+    def test_async_chat_returns_reply_and_saves_both_messages(self):
+        response = self.post({'message': '你好', 'session_id': 's1'})
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['reply'], '回复：你好')
+        messages = ChatMessage.objects.filter(session_id='s1').order_by('id')
+        self.assertEqual([(m.role, m.content) for m in messages], [('user', '你好'), ('assistant', '回复：你好')])
+
+    def test_async_chat_history_excludes_current_message(self):
+        self.post({'message': '第一句', 'session_id': 's2'})
+        self.post({'message': '第二句', 'session_id': 's2'})
+
+        contents = [m['content'] for m in self.service.calls[-1]]
+        self.assertEqual(contents.count('第二句'), 1)
+        self.assertIn('第一句', contents)
+
+    def test_async_chat_rejects_empty_message(self):
+        self.assertEqual(self.post({'message': ''}).status_code, 400)
+
+
+def read_ndjson(response):
+    body = b''.join(response.streaming_content).decode()
+    return [json.loads(line) for line in body.splitlines() if line]
+
+
+class StreamingChatTests(IsolatedTestCase):
+    def setUp(self):
+        super().setUp()
+        APIConfig.objects.create(service_type='openai', api_key='test-key')
+        self.reply = lambda messages: '你好，我在听你说。'
+        self.service = FakeService(lambda messages: self.reply(messages))
+        patcher = mock.patch.object(ai_services, '_build_ai_service', return_value=self.service)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def post(self, url, payload):
+        return self.client.post(url, json.dumps({**payload, 'stream': True}), content_type='application/json')
+
+    def test_reply_is_streamed_and_saved_once_complete(self):
+        response = self.post('/chat/', {'message': '你好', 'session_id': 's1'})
+
+        self.assertEqual(response['Content-Type'], 'application/x-ndjson')
+        lines = read_ndjson(response)
+        self.assertGreater(len(lines), 2)
+        self.assertEqual(''.join(line['delta'] for line in lines[:-1]), '你好，我在听你说。')
+        self.assertTrue(lines[-1]['done'])
+        self.assertEqual(ChatMessage.objects.get(session_id='s1', role='assistant').content, '你好，我在听你说。')
+
+    def test_failed_stream_reports_error_and_saves_no_reply(self):
+        self.reply = lambda messages: None
+        lines = read_ndjson(self.post('/chat/', {'message': '你好', 'session_id': 's2'}))
+
+        self.assertIn('error', lines[-1])
+        self.assertFalse(ChatMessage.objects.filter(session_id='s2', role='assistant').exists())
+        self.assertTrue(ChatMessage.objects.filter(session_id='s2', role='user').exists())
+
+    async def test_async_view_streams_reply(self):
+        service = AsyncFakeService(lambda messages: '异步回复')
+        with mock.patch.object(ai_services, '_build_async_ai_service', return_value=service):
+            response = await self.async_client.post(
+                '/async/chat/', {'message': '你好', 'session_id': 's3', 'stream': True}, content_type='application/json'
+            )
+            body = b''.join([part async for part in response.streaming_content]).decode()
+
+        lines = [json.loads(line) for line in body.splitlines() if line]
+        self.assertEqual(''.join(line.get('delta', '') for line in lines), '异步回复')
+        self.assertTrue(lines[-1]['done'])
+        reply = await ChatMessage.objects.aget(session_id='s3', role='assistant')
+        self.assertEqual(reply.content, '异步回复')
+
+
+backfill = importlib.import_module('mainapp.migrations.0016_chatsession')
+
+
+class ChatSessionTests(IsolatedTestCase):
+    def add(self, session_id, content, role='user', **fields):
+        fields.setdefault('is_probe', is_probe_message(content))
+        return ChatMessage.objects.create(role=role, content=content, session_id=session_id, **fields)
+
+    def test_migration_uses_the_runtime_probe_rule(self):
+        contents = ['test', '  TEST\n', 'latest news', 'testing the API', 'API验证请求', '你好']
+        for content in contents:
+            self.add('s1', content, is_probe=False)
+        ChatSession.objects.all().delete()
+
+        backfill.backfill_chat_sessions(django_apps, None)
+
+        flagged = dict(ChatMessage.objects.values_list('content', 'is_probe'))
+        self.assertEqual(flagged, {content: is_probe_message(content) for content in contents})
+        self.assertEqual(ChatSession.objects.get(session_id='s1').message_count, 3)
+
+    def test_session_counts_exclude_probes(self):
+        self.add('s1', '你好')
+        self.add('s1', 'test')
+        self.add('s1', '回复', role='assistant')
+        session = ChatSession.objects.get(session_id='s1')
+        self.assertEqual(session.message_count, 2)
+        self.assertEqual(session.last_activity, ChatMessage.objects.filter(session_id='s1').last().timestamp)
+
+    def test_recent_history_is_the_newest_window_without_probes(self):
+        for i in range(15):
+            self.add('s1', f'消息{i}')
+        self.add('s1', 'API验证')
+        current = self.add('s1', '当前消息')
+
+        history = [m.content for m in recent_history('s1', before_id=current.id)]
+        self.assertEqual(history, [f'消息{i}' for i in range(14, 4, -1)])
+
+    def test_listing_requires_staff(self):
+        self.add('s1', '你好')
+        self.add('s1', 'test')
+        requests = [('/api/chat/sessions/', {}), ('/api/chat/sessions/s1/messages/', {'include_probes': '1'})]
+        for url, params in requests:
+            self.assertEqual(self.client.get(url, params).status_code, 403)
+        self.client.force_login(User.objects.create_user('member', password='x'))
+        for url, params in requests:
+            self.assertEqual(self.client.get(url, params).status_code, 403)
+
+    def test_session_and_message_listing_use_keyset_cursors(self):
+        self.client.force_login(User.objects.create_user('admin', password='x', is_staff=True))
+        for i in range(3):
+            self.add(f's{i}', '你好')
+        first = self.client.get('/api/chat/sessions/', {'limit': 2}).json()
+        self.assertEqual([s['session_id'] for s in first['sessions']], ['s2', 's1'])
+        second = self.client.get('/api/chat/sessions/', {'limit': 2, 'cursor': first['next_cursor']}).json()
+        self.assertEqual([s['session_id'] for s in second['sessions']], ['s0'])
+        self.assertIsNone(second['next_cursor'])
+
+        for i in range(3):
+            self.add('s0', f'消息{i}')
+        self.add('s0', 'test')
+        url = '/api/chat/sessions/s0/messages/'
+        page = self.client.get(url, {'limit': 2}).json()
+        self.assertEqual([m['content'] for m in page['messages']], ['消息2', '消息1'])
+        rest = self.client.get(url, {'limit': 2, 'before': page['next_cursor']}).json()
+        self.assertEqual([m['content'] for m in rest['messages']], ['消息0', '你好'])
+        self.assertEqual(len(self.client.get(url, {'include_probes': '1'}).json()['messages']), 5)
+        self.assertEqual(self.client.get(url, {'before': 'x'}).status_code, 400)
@@ -0,0 +1,61 @@
+from django.test import SimpleTestCase
+from mainapp.chunking import DialogueChunker, chunk_token_budget
+from mainapp.tokens import count_text_tokens
+from .test_processing import dialogue
+
+
+class DialogueChunkerTests(SimpleTestCase):
+    def assert_within_budget(self, chunks, max_tokens):
+        for chunk in chunks:
+            self.assertLessEqual(count_text_tokens(chunk), max_tokens)
+
+    def test_chunks_are_lossless_and_within_budget(self):
+        content = dialogue(60)
+        chunks = DialogueChunker(max_tokens=150).split(content)
+
+        self.assertGreater(len(chunks), 1)
+        self.assertEqual(''.join(chunks), content)
+        self.assert_within_budget(chunks, 150)
+
+    def test_question_and_answer_stay_in_the_same_chunk(self):
+        chunks = DialogueChunker(max_tokens=150).split(dialogue(60))
+        for chunk in chunks:
+            self.assertTrue(chunk.startswith('来访者：'))
+            self.assertTrue(chunk.rstrip().split('\n')[-1].startswith('咨询师：'))
+
+    def test_overlong_turn_falls_back_to_sentences(self):
+        turn = '来访者：' + '我今天很难过。' * 80 + '\n'
+        chunks = DialogueChunker(max_tokens=100).split(turn + '咨询师：我在听。\n')
+
+        self.assertGreater(len(chunks), 1)
+        self.assertEqual(''.join(chunks), turn + '咨询师：我在听。\n')
+        self.assert_within_budget(chunks, 100)
+        self.assertTrue(all(c.endswith(('。', '\n')) for c in chunks))
+
+    def test_text_without_boundaries_is_hard_split(self):
+        content = '字' * 1000
+        chunks = DialogueChunker(max_tokens=64).split(content)
+
+        self.assertEqual(''.join(chunks), content)
+        self.assert_within_budget(chunks, 64)
+
+    def test_plain_lines_without_speakers(self):
+        content = ''.join(f"第{i}行普通文本\n" for i in range(50))
+        chunks = DialogueChunker(max_tokens=40).split(content)
+        self.assertEqual(''.join(chunks), content)
+        self.assertTrue(all(c.endswith('\n') for c in chunks))
+
+    def test_empty_content(self):
+        self.assertEqual(DialogueChunker(max_tokens=100).split(''), [])
+        self.assertEqual(DialogueChunker(max_tokens=100).split('  \n'), [])
+
+
+class ChunkTokenBudgetTests(SimpleTestCase):
+    def test_budget_reserves_prompt_and_output(self):
+        self.assertEqual(chunk_token_budget(8000, 3000, 1000, 0.6, safety_margin=200), 1800)
+        self.assertEqual(chunk_token_budget(8000, 3000, 3000, 0.6, safety_margin=200), 1800)
+        self.assertEqual(chunk_token_budget(8000, 3000, 4500, 0.6, safety_margin=200), 300)
+
+    def test_budget_has_a_floor_when_prompt_is_too_long(self):
+        self.assertEqual(chunk_token_budget(8000, 3000, 9000, 0.6), 450)
+        self.assertEqual(chunk_token_budget(8000, 1000, 9000, 0.6), 256)
@@ -0,0 +1,79 @@
+from mainapp import config_cache
+from mainapp.config_cache import ConfigCache
+from mainapp.models import APIConfig, LabelingDimension, SystemPrompt
+from .helpers import IsolatedTestCase
+
+
+class ConfigCacheTests(IsolatedTestCase):
+    def test_loader_runs_once_until_invalidated(self):
+        cache = ConfigCache(f'{self.tmpdir}/version')
+        calls = []
+
+        def loader():
+            calls.append(1)
+            return len(calls)
+
+        self.assertEqual(cache.get('k', loader), 1)
+        self.assertEqual(cache.get('k', loader), 1)
+        cache.invalidate()
+        self.assertEqual(cache.get('k', loader), 2)
+
+    def test_invalidation_in_another_process_is_seen(self):
+        path = f'{self.tmpdir}/version'
+        local, other = ConfigCache(path), ConfigCache(path)
+        local.get('k', lambda: 'old')
+        other.invalidate()
+        self.assertEqual(local.get('k', lambda: 'new'), 'new')
+
+    def test_value_loaded_during_a_change_is_not_kept(self):
+        cache = ConfigCache(f'{self.tmpdir}/version')
+
+        def loader():
+            ConfigCache(cache.version_path).invalidate()
+            return 'stale'
+
+        self.assertEqual(cache.get('k', loader), 'stale')
+        self.assertEqual(cache.get('k', lambda: 'fresh'), 'fresh')
+
+
+class ConfigLookupTests(IsolatedTestCase):
+    def setUp(self):
+        super().setUp()
+        APIConfig.objects.create(service_type='openai', api_key='key-1')
+        self.dimensions = self.dimension_ids('labeling')[:2]
+
+    def warm(self):
+        return (config_cache.get_api_config(), config_cache.get_default_prompt('chat'),
+                config_cache.get_dimension_catalog(), config_cache.get_system_prompt('labeling', self.dimensions))
+
+    def test_hot_paths_do_no_queries_once_warm(self):
+        self.warm()
+        with self.assertNumQueries(0):
+            self.warm()
+            self.assertEqual(self.client.get('/api/dimensions/').status_code, 200)
+
+    def test_system_prompt_combines_prompt_dimensions_and_schema(self):
+        prompt = SystemPrompt.objects.get(type='labeling', is_default=True)
+        names = LabelingDimension.objects.filter(id__in=self.dimensions).order_by('id').values_list('name', flat=True)
+
+        system_prompt = config_cache.get_system_prompt('labeling', [str(d) for d in self.dimensions])
+        self.assertTrue(system_prompt.startswith(prompt.content))
+        self.assertIn(f"提供的维度: {', '.join(names)}", system_prompt)
+
+    def test_model_changes_invalidate_cached_values(self):
+        self.warm()
+        APIConfig.objects.create(service_type='deepseek', api_key='key-2')
+        self.assertEqual(config_cache.get_api_config().service_type, 'deepseek')
+
+        prompt = SystemPrompt.objects.get(type='labeling', is_default=True)
+        prompt.content = '新的标注提示词'
+        prompt.save()
+        self.assertTrue(config_cache.get_system_prompt('labeling', self.dimensions).startswith('新的标注提示词'))
+
+        LabelingDimension.objects.create(name='新维度', description='说明', order=99)
+        self.assertIn('新维度', [d['name'] for d in config_cache.get_dimension_catalog()['labeling']])
+
+    def test_inactive_configs_are_skipped(self):
+        APIConfig.objects.create(service_type='zhipu', api_key='key-3', is_active=False)
+        self.assertEqual(config_cache.get_api_config().service_type, 'openai')
+        self.assertEqual([c.service_type for c in config_cache.get_api_configs()], ['openai'])
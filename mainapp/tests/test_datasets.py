@@ -0,0 +1,136 @@
+import json
+from unittest import mock
+from django.test import override_settings
+from mainapp import ai_services, jobs
+from mainapp.datasets import create_dataset, dimensions_key, import_records
+from mainapp.models import APIConfig, Dataset, RecordResult
+from .helpers import FakeService, IsolatedTestCase, user_content
+
+
+def records(start: int, stop: int) -> str:
+    return json.dumps([{'text': f'第{i}条记录：来访者提到工作{i}带来的压力'} for i in range(start, stop)],
+                      ensure_ascii=False)
+
+
+def requested_ids(messages) -> list:
+    return [r['id'] for r in json.loads(user_content(messages))['records']]
+
+
+@override_settings(NEAR_DUPLICATE_DETECTION={'ENABLED': False, 'MAX_DISTANCE': 0, 'NGRAM': 3},
+                   REQUEST_PACKING={'ENABLED': True, 'MAX_RECORDS': 50, 'MAX_RETRIES': 0},
+                   DATASETS={'TEXT_RECORD_TOKENS': 1000, 'RECORDS_PER_ROUND': 4, 'MAX_FAILED_ROUNDS': 2})
+class DatasetTests(IsolatedTestCase):
+    def setUp(self):
+        super().setUp()
+        APIConfig.objects.create(service_type='openai', api_key='test-key')
+        self.skip = set()
+        self.service = FakeService(lambda messages: json.dumps([
+            {'id': i, 'label': f'标签-{i}'} for i in requested_ids(messages) if i not in self.skip
+        ]))
+        patcher = mock.patch.object(ai_services, '_build_ai_service', return_value=self.service)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.dimensions = self.dimension_ids('labeling')[:2]
+
+    def run_dataset(self, dataset: Dataset):
+        job = jobs.enqueue_job('', 'labeling', self.dimensions, dataset=dataset)
+        jobs.run_job(jobs.claim_next_job('w1'))
+        job.refresh_from_db()
+        return job
+
+    def test_import_skips_records_already_in_the_dataset(self):
+        dataset, added = create_dataset('测试', records(0, 5))
+        self.assertEqual(added, 5)
+        self.assertEqual(import_records(dataset, records(3, 8)), 3)
+        self.assertEqual(dataset.record_count, 8)
+        # 新记录排在已有记录之后，导入顺序不变（跳过的重复记录会留下序号空缺）
+        texts = [r['text'] for r in dataset.records.order_by('position').values_list('content', flat=True)]
+        self.assertEqual(texts, [item['text'] for item in json.loads(records(0, 8))])
+
+    def test_dimensions_key_ignores_order_and_duplicates(self):
+        self.assertEqual(dimensions_key([10, '2', 2, 'x']), '2,10,x')
+
+    def test_records_are_processed_in_rounds_and_saved_per_record(self):
+        dataset, _ = create_dataset('测试', records(0, 10))
+        job = self.run_dataset(dataset)
+
+        self.assertEqual(job.status, 'completed')
+        self.assertEqual(len(self.service.calls), 3)
+        self.assertEqual(job.results.count(), 3)
+        summary = json.loads(job.result)
+        self.assertEqual((summary['processed'], summary['done'], summary['failed']), (10, 10, 0))
+        result = RecordResult.objects.get(record=dataset.records.first())
+        self.assertEqual(result.status, 'done')
+        self.assertEqual(result.dimensions_key, dimensions_key(self.dimensions))
+
+    def test_rerun_only_processes_records_that_are_not_done(self):
+        dataset, _ = create_dataset('测试', records(0, 6))
+        missing = str(dataset.records.order_by('position')[2].id)
+        self.skip = {missing}
+        job = self.run_dataset(dataset)
+        self.assertEqual(json.loads(job.result)['failed'], 1)
+        self.assertEqual(RecordResult.objects.get(record_id=missing).status, 'failed')
+
+        self.skip = set()
+        self.service.calls.clear()
+        import_records(dataset, records(6, 8))
+        summary = json.loads(self.run_dataset(dataset).result)
+        self.assertEqual((summary['skipped'], summary['processed'], summary['done']), (5, 3, 3))
+        self.assertEqual(sorted(i for m in self.service.calls for i in requested_ids(m)),
+                         sorted([missing] + [str(r.id) for r in dataset.records.order_by('position')[6:]]))
+
+    @override_settings(REQUEST_PACKING={'ENABLED': True, 'MAX_RECORDS': 2, 'MAX_RETRIES': 0},
+                       DATASETS={'TEXT_RECORD_TOKENS': 1000, 'RECORDS_PER_ROUND': 6, 'MAX_FAILED_ROUNDS': 2})
+    def test_records_of_a_failed_pack_are_retried_on_rerun(self):
+        dataset, _ = create_dataset('测试', records(0, 6))
+        lost = [str(r.id) for r in dataset.records.order_by('position')[2:4]]
+        reply = self.service.reply
+        self.service.reply = lambda messages: None if requested_ids(messages) == lost else reply(messages)
+
+        summary = json.loads(self.run_dataset(dataset).result)
+        self.assertEqual((summary['done'], summary['failed']), (4, 2))
+        self.assertEqual(set(RecordResult.objects.filter(status='failed').values_list('record_id', flat=True)),
+                         {int(i) for i in lost})
+        self.assertFalse(RecordResult.objects.filter(status='done', result__has_key='error').exists())
+
+        self.service.reply = reply
+        self.service.calls.clear()
+        summary = json.loads(self.run_dataset(dataset).result)
+        self.assertEqual((summary['processed'], summary['done']), (2, 2))
+        self.assertEqual([requested_ids(m) for m in self.service.calls], [lost])
+
+    def test_consecutive_failed_rounds_stop_the_job(self):
+        dataset, _ = create_dataset('测试', records(0, 12))
+        self.service.reply = lambda messages: None
+        job = self.run_dataset(dataset)
+
+        self.assertEqual(job.status, 'failed')
+        self.assertIn('连续 2 轮', job.error)
+        self.assertEqual(RecordResult.objects.filter(status='failed').count(), 8)
+
+    def test_status_and_export_views(self):
+        dataset, _ = create_dataset('测试', records(0, 3))
+        self.run_dataset(dataset)
+
+        status = self.client.get(f'/api/datasets/{dataset.id}/').json()
+        self.assertEqual(status['record_count'], 3)
+        self.assertEqual(status['runs'][0]['done'], 3)
+        self.assertEqual(status['runs'][0]['remaining'], 0)
+
+        response = self.client.get(f'/api/datasets/{dataset.id}/export/', {
+            'process_type': 'labeling', 'dimensions': ','.join(map(str, reversed(self.dimensions)))
+        })
+        rows = [json.loads(line) for line in b''.join(response.streaming_content).decode('utf-8').splitlines()]
+        self.assertEqual([row['position'] for row in rows], [1, 2, 3])
+        self.assertEqual(rows[0]['status'], 'done')
+        self.assertEqual(self.client.get('/api/datasets/999/').status_code, 404)
+
+    def test_create_view_appends_to_an_existing_dataset(self):
+        created = self.client.post('/api/datasets/', {'name': '测试', 'content': records(0, 2)},
+                                   content_type='application/json').json()
+        appended = self.client.post('/api/datasets/', {'dataset_id': created['dataset_id'], 'content': records(1, 4)},
+                                    content_type='application/json').json()
+        self.assertEqual((appended['record_count'], appended['added']), (4, 2))
+        missing = self.client.post('/api/datasets/', {'dataset_id': 999, 'content': records(0, 1)},
+                                   content_type='application/json')
+        self.assertEqual(missing.status_code, 404)
@@ -0,0 +1,73 @@
+import json
+from django.conf import settings
+from django.test import SimpleTestCase, override_settings
+from mainapp.data_services import TextProcessor
+from mainapp.dedup import find_near_duplicates, hamming_distance, simhash
+from .helpers import FakeService, IsolatedTestCase, user_content
+
+DIALOGUE = ('来访者：我最近在工作和家庭之间感到压力很大，晚上经常失眠，白天也没有精神，'
+            '周末也很难真正休息下来，和同事的关系也变得紧张，{}和家人好好谈一谈。')
+
+
+class DuplicateDetectionTests(SimpleTestCase):
+    def test_default_only_merges_texts_equal_after_normalisation(self):
+        self.assertEqual(settings.NEAR_DUPLICATE_DETECTION['MAX_DISTANCE'], 0)
+        texts = [DIALOGUE.format('想'), ' ' + DIALOGUE.format('想').replace('，', ', '), DIALOGUE.format('不想')]
+        self.assertEqual(find_near_duplicates(texts), {1: 0})
+
+    def test_same_fingerprint_is_not_enough_without_a_distance(self):
+        # “很难休息”和“不难休息”指纹相同，但含义相反，默认设置下不合并
+        sentence = DIALOGUE.format('想')
+        text = sentence * 3
+        flipped = sentence * 2 + sentence.replace('很难', '不难')
+        self.assertEqual(simhash(text), simhash(flipped))
+        self.assertEqual(find_near_duplicates([text, flipped], max_distance=0), {})
+
+    def test_near_duplicate_merging_is_opt_in(self):
+        texts = [DIALOGUE.format('想'), DIALOGUE.format('不想')]
+        distance = hamming_distance(simhash(texts[0]), simhash(texts[1]))
+        self.assertGreater(distance, 0)
+        self.assertEqual(find_near_duplicates(texts, max_distance=distance), {1: 0})
+        self.assertEqual(find_near_duplicates(texts, max_distance=distance - 1), {})
+
+
+@override_settings(REQUEST_PACKING={'ENABLED': True, 'MAX_RECORDS': 10, 'MAX_RETRIES': 0})
+class DuplicateRequestTests(IsolatedTestCase):
+    def test_exact_duplicate_records_are_requested_once_and_copied(self):
+        content = json.dumps([
+            {'id': 'a', 'text': DIALOGUE.format('想')},
+            {'id': 'b', 'text': DIALOGUE.format('不想')},
+            {'id': 'c', 'text': DIALOGUE.format('想') + ' '},
+        ], ensure_ascii=False)
+
+        def reply(messages):
+            return json.dumps([{'id': r['id'], 'label': r['id']} for r in json.loads(user_content(messages))['records']])
+
+        service = FakeService(reply)
+        result = json.loads(TextProcessor(service).process_content(
+            content, 'labeling', self.dimension_ids('labeling')[:1], 'key-dedup'))
+
+        self.assertEqual([r['id'] for r in json.loads(user_content(service.calls[0]))['records']], ['a', 'b'])
+        self.assertEqual(result, [
+            {'id': 'a', 'label': 'a'},
+            {'id': 'c', 'label': 'a', 'duplicate_of': 'a'},
+            {'id': 'b', 'label': 'b'},
+        ])
+
+    def test_cleaning_keeps_records_that_differ_only_in_punctuation(self):
+        # 清洗结果取决于标点，只差标点的记录要各自请求
+        content = json.dumps([
+            {'id': 'a', 'text': DIALOGUE.format('想')},
+            {'id': 'b', 'text': DIALOGUE.format('想').replace('，', ',')},
+            {'id': 'c', 'text': DIALOGUE.format('想')},
+        ], ensure_ascii=False)
+
+        def reply(messages):
+            return json.dumps([{'id': r['id'], 'text': r['id']} for r in json.loads(user_content(messages))['records']])
+
+        service = FakeService(reply)
+        result = json.loads(TextProcessor(service).process_content(
+            content, 'cleaning', self.dimension_ids('cleaning', ['语法规范']), 'key-dedup-cleaning'))
+
+        self.assertEqual([r['id'] for r in json.loads(user_content(service.calls[0]))['records']], ['a', 'b'])
+        self.assertEqual({r['id']: r.get('duplicate_of') for r in result}, {'a': None, 'b': None, 'c': 'a'})
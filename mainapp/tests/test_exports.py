@@ -0,0 +1,132 @@
+import csv
+import gzip
+import io
+import json
+from datetime import timedelta
+from django.contrib.auth.models import User
+from django.utils import timezone
+from mainapp.models import ChatMessage, ProcessingChunk, ProcessingJob, ProcessingResult
+from mainapp.packing import store_pack
+from .helpers import IsolatedTestCase
+
+
+class ProcessedDataExportTests(IsolatedTestCase):
+    def setUp(self):
+        super().setUp()
+        self.job = ProcessingJob.objects.create(key='job-export', process_type='labeling', dimensions=[1, 2],
+                                                status='completed')
+        # 结果按块序号导出，与写入顺序无关；一个块可以包含多条记录
+        ProcessingResult.objects.create(job=self.job, index=2, result={'id': '3', 'label': '抑郁', 'score': 2})
+        ProcessingResult.objects.create(job=self.job, index=1, result=[
+            {'id': '1', 'label': '焦虑'}, {'id': '2', 'label': '平静', 'note': '多出的字段'}
+        ])
+
+    def export(self, export_format=None, key='job-export'):
+        params = {'format': export_format} if export_format else {}
+        return self.client.get(f'/export-processed-data/{key}/', params)
+
+    def body(self, response) -> str:
+        self.assertTrue(response.streaming)
+        return b''.join(response.streaming_content).decode('utf-8')
+
+    def test_ndjson(self):
+        response = self.export('ndjson')
+        self.assertEqual(response['Content-Type'], 'application/x-ndjson; charset=utf-8')
+        self.assertIn('processed_job-export.jsonl', response['Content-Disposition'])
+        records = [json.loads(line) for line in self.body(response).splitlines()]
+        self.assertEqual([r['id'] for r in records], ['1', '2', '3'])
+
+    def test_csv_uses_first_record_columns_and_extra(self):
+        rows = list(csv.reader(io.StringIO(self.body(self.export('csv')).lstrip('﻿'))))
+        self.assertEqual(rows[0], ['chunk', 'id', 'label', 'extra'])
+        self.assertEqual(rows[1], ['1', '1', '焦虑', ''])
+        self.assertEqual(json.loads(rows[2][3]), {'note': '多出的字段'})
+        self.assertEqual(json.loads(rows[3][3]), {'score': 2})
+
+    def test_pretty_json_is_a_valid_document(self):
+        document = json.loads(self.body(self.export()))
+        self.assertEqual(document['processing_key'], 'job-export')
+        self.assertEqual(document['dimensions'], [1, 2])
+        self.assertEqual([r['id'] for r in document['records']], ['1', '2', '3'])
+
+    def test_empty_job_exports_valid_json(self):
+        ProcessingJob.objects.create(key='job-empty', process_type='labeling')
+        self.assertEqual(json.loads(self.body(self.export(key='job-empty')))['records'], [])
+
+    def test_scalar_results_are_exported_as_output(self):
+        ProcessingResult.objects.create(job=self.job, index=3, result='纯文本结果')
+        rows = list(csv.reader(io.StringIO(self.body(self.export('csv')).lstrip('﻿'))))
+        self.assertEqual(rows[-1][-1], json.dumps({'output': '纯文本结果'}, ensure_ascii=False))
+
+    def test_failed_chunks_are_exported_as_error_rows(self):
+        ProcessingChunk.objects.create(job=self.job, index=3, content='失败的文本', status='failed', error='超时')
+        ProcessingResult.objects.create(job=self.job, index=4, result={'id': '4', 'label': '平静'})
+        marker = {'chunk': 3, 'error': '超时'}
+
+        records = [json.loads(line) for line in self.body(self.export('ndjson')).splitlines()]
+        self.assertEqual(records[2:], [{'id': '3', 'label': '抑郁', 'score': 2}, marker, {'id': '4', 'label': '平静'}])
+        self.assertEqual(json.loads(self.body(self.export()))['records'][3], marker)
+        rows = list(csv.reader(io.StringIO(self.body(self.export('csv')).lstrip('﻿'))))
+        self.assertEqual(rows[4][0], '3')
+        self.assertEqual(json.loads(rows[4][3]), marker)
+
+    def test_failed_pack_is_exported_per_record(self):
+        self.job.packed = True
+        self.job.save(update_fields=['packed'])
+        pack = store_pack([{'id': '5', 'content': '记录五', 'duplicates': ['6']}])
+        ProcessingChunk.objects.create(job=self.job, index=3, content=pack, status='failed', error='超时')
+        records = [json.loads(line) for line in self.body(self.export('ndjson')).splitlines()]
+        self.assertEqual(records[3:], [{'id': '5', 'error': '超时'}, {'id': '6', 'error': '超时'}])
+
+    def test_unknown_format_and_job(self):
+        self.assertEqual(self.export('xml').status_code, 400)
+        self.assertEqual(self.export(key='missing').status_code, 404)
+
+
+class ChatHistoryExportTests(IsolatedTestCase):
+    def setUp(self):
+        super().setUp()
+        for session_id in ('s1', 's2'):
+            ChatMessage.objects.create(role='user', content=f'{session_id} 提问', session_id=session_id)
+            ChatMessage.objects.create(role='assistant', content=f'{session_id} 回答', session_id=session_id)
+        ChatMessage.objects.create(role='assistant', content='s1 失败', session_id='s1', status='error')
+
+    def export(self, **params):
+        return self.client.get('/export-chat-history/', params)
+
+    def records(self, response):
+        return [json.loads(line) for line in b''.join(response.streaming_content).decode().splitlines()]
+
+    def test_exporting_every_session_requires_staff(self):
+        response = self.export()
+        self.assertEqual(response.status_code, 403)
+
+        self.client.force_login(User.objects.create_user('member', password='x'))
+        self.assertEqual(self.export().status_code, 403)
+
+        self.client.force_login(User.objects.create_user('admin', password='x', is_staff=True))
+        self.assertEqual(len(self.records(self.export())), 5)
+
+    def test_explicit_sessions_are_exported_without_staff(self):
+        records = self.records(self.export(session_ids='s2'))
+        self.assertEqual([(r['session_id'], r['role']) for r in records], [('s2', 'user'), ('s2', 'assistant')])
+
+        response = self.client.post('/export-chat-history/', json.dumps({'session_ids': ['s1'], 'status': 'error'}),
+                                    content_type='application/json')
+        self.assertEqual([r['content'] for r in self.records(response)], ['s1 失败'])
+
+    def test_role_and_time_filters(self):
+        records = self.records(self.export(session_ids='s1,s2', role='assistant'))
+        self.assertEqual({r['role'] for r in records}, {'assistant'})
+
+        future = (timezone.now() + timedelta(days=1)).date().isoformat()
+        self.assertEqual(self.records(self.export(session_ids='s1', start=future)), [])
+        self.assertEqual(len(self.records(self.export(session_ids='s1', end=future))), 3)
+        self.assertEqual(self.export(session_ids='s1', start='昨天').status_code, 400)
+
+    def test_gzip_output(self):
+        response = self.export(session_ids='s1', gzip='1')
+        self.assertEqual(response['Content-Type'], 'application/gzip')
+        self.assertTrue(response['Content-Disposition'].endswith('.jsonl.gz"'))
+        lines = gzip.decompress(b''.join(response.streaming_content)).decode().splitlines()
+        self.assertEqual(len(lines), 3)
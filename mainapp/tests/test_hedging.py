@@ -0,0 +1,122 @@
+import asyncio
+import threading
+from unittest import mock
+from django.test import SimpleTestCase, override_settings
+from mainapp import hedging, routing
+from mainapp.hedging import HedgeBudget, get_hedge_budget, hedge_delay, should_hedge
+from mainapp.routing import AsyncProviderRouter, ProviderRouter
+from .helpers import AsyncFakeService, FakeService, IsolatedTestCase
+from .test_routing import provider, record
+
+HEDGING = {'ENABLED': True, 'TASK_TYPES': ('labeling',), 'PERCENTILE': 95, 'MIN_SAMPLES': 5,
+           'MIN_DELAY': 0.05, 'MAX_EXTRA_RATIO': 0.5, 'BURST': 2}
+MESSAGES = [{'role': 'user', 'content': '你好'}]
+
+
+class HedgeBudgetTests(SimpleTestCase):
+    def test_tokens_accrue_per_request_up_to_the_burst(self):
+        budget = HedgeBudget(ratio=0.5, burst=1)
+        self.assertTrue(budget.try_spend())
+        self.assertFalse(budget.try_spend())
+        budget.on_request()
+        self.assertFalse(budget.try_spend())
+        budget.on_request()
+        self.assertTrue(budget.try_spend())
+        for _ in range(10):
+            budget.on_request()
+        self.assertTrue(budget.try_spend())
+        self.assertFalse(budget.try_spend())
+        self.assertEqual(budget.stats(), {'requests': 12, 'hedged': 3, 'hedge_wins': 0, 'extra_ratio': 0.25})
+
+
+@override_settings(REQUEST_HEDGING=HEDGING)
+class HedgeDelayTests(IsolatedTestCase):
+    def test_delay_needs_enough_samples_and_has_a_floor(self):
+        record(1, 0.01, 4)
+        self.assertIsNone(hedge_delay('key-1'))
+        record(1, 0.01, 1)
+        self.assertEqual(hedge_delay('key-1'), 0.05)
+        record(1, 1.0, 1)
+        self.assertEqual(hedge_delay('key-1'), 1.0)
+
+    def test_only_configured_task_types_are_hedged(self):
+        self.assertTrue(should_hedge('labeling'))
+        self.assertFalse(should_hedge('chat'))
+        with override_settings(REQUEST_HEDGING={**HEDGING, 'ENABLED': False}):
+            self.assertFalse(should_hedge('labeling'))
+
+
+@override_settings(REQUEST_HEDGING=HEDGING)
+class HedgedRequestTests(IsolatedTestCase):
+    def setUp(self):
+        super().setUp()
+        patcher = mock.patch.object(routing.random, 'uniform', return_value=0)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.release = threading.Event()
+        self.addCleanup(self.release.set)
+        record(1, 0.01, 5)
+
+    def slow(self, messages):
+        self.release.wait(2)
+        return '"慢"'
+
+    def test_slow_primary_is_hedged_to_the_next_provider(self):
+        primary, secondary = FakeService(self.slow), FakeService(lambda m: '"快"')
+        router = ProviderRouter([provider(1, primary), provider(2, secondary)])
+
+        self.assertEqual(router.chat_completion(MESSAGES, task_type='labeling'), '"快"')
+        self.assertEqual(get_hedge_budget().stats()['hedge_wins'], 1)
+        self.assertEqual(len(secondary.calls), 1)
+
+    def test_fast_primary_is_not_hedged(self):
+        secondary = FakeService()
+        router = ProviderRouter([provider(1, FakeService(lambda m: '"快"')), provider(2, secondary)])
+
+        self.assertEqual(router.chat_completion(MESSAGES, task_type='labeling'), '"快"')
+        self.assertEqual(secondary.calls, [])
+        self.assertEqual(get_hedge_budget().stats()['hedged'], 0)
+
+    def test_untracked_task_types_and_exhausted_budget_wait_for_the_primary(self):
+        secondary = FakeService()
+        router = ProviderRouter([provider(1, FakeService(self.slow)), provider(2, secondary)])
+        self.release.set()
+        self.assertEqual(router.chat_completion(MESSAGES, task_type='chat'), '"慢"')
+
+        with override_settings(REQUEST_HEDGING={**HEDGING, 'MAX_EXTRA_RATIO': 0, 'BURST': 0}):
+            hedging._hedge_budget = None
+            self.assertEqual(router.chat_completion(MESSAGES, task_type='labeling'), '"慢"')
+        self.assertEqual(secondary.calls, [])
+
+    def test_single_provider_hedges_to_itself(self):
+        calls = []
+
+        def reply(messages):
+            calls.append(messages)
+            return self.slow(messages) if len(calls) == 1 else '"快"'
+
+        router = ProviderRouter([provider(1, FakeService(reply))])
+        self.assertEqual(router.chat_completion(MESSAGES, task_type='labeling'), '"快"')
+        self.assertEqual(len(calls), 2)
+
+    def test_failed_hedged_request_fails_over_to_untried_providers(self):
+        services = [FakeService(lambda m: None), FakeService(lambda m: None), FakeService(lambda m: '"备用"')]
+        router = ProviderRouter([provider(i, s) for i, s in enumerate(services, 1)])
+
+        self.assertEqual(router.chat_completion(MESSAGES, task_type='labeling'), '"备用"')
+        self.assertEqual([len(s.calls) for s in services], [1, 1, 1])
+
+    async def test_async_hedge_cancels_the_slower_request(self):
+        cancelled = asyncio.Event()
+
+        async def slow(messages):
+            try:
+                await asyncio.sleep(2)
+            except asyncio.CancelledError:
+                cancelled.set()
+                raise
+            return '"慢"'
+
+        router = AsyncProviderRouter([provider(1, AsyncFakeService(slow)), provider(2, AsyncFakeService(lambda m: '"快"'))])
+        self.assertEqual(await router.chat_completion(MESSAGES, task_type='labeling'), '"快"')
+        await asyncio.wait_for(cancelled.wait(), 1)
@@ -0,0 +1,174 @@
+import json
+import time
+from datetime import timedelta
+from unittest import mock
+from django.test import TransactionTestCase, override_settings
+from django.utils import timezone
+from mainapp import ai_services, jobs
+from mainapp.data_services import TextProcessor
+from mainapp.exceptions import JobLeaseLost
+from mainapp.models import APIConfig, ProcessingChunk, ProcessingJob, ProcessingResult
+from .helpers import FakeService, IsolatedTestCase
+from .test_processing import dialogue
+
+
+def make_job(**fields) -> ProcessingJob:
+    fields.setdefault('key', f"job-{time.monotonic_ns()}")
+    fields.setdefault('process_type', 'labeling')
+    return ProcessingJob.objects.create(**fields)
+
+
+@override_settings(NEAR_DUPLICATE_DETECTION={'ENABLED': False, 'MAX_DISTANCE': 0, 'NGRAM': 3})
+class JobQueueTests(IsolatedTestCase):
+    def setUp(self):
+        super().setUp()
+        APIConfig.objects.create(service_type='openai', api_key='test-key')
+        self.service = FakeService(lambda messages: '{"ok": true}')
+        self.service.max_tokens = 200
+        patcher = mock.patch.object(ai_services, '_build_ai_service', return_value=self.service)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def enqueue(self, turns: int = 20) -> ProcessingJob:
+        return jobs.enqueue_job(dialogue(turns), 'labeling', self.dimension_ids('labeling')[:2])
+
+    def test_job_is_claimed_once_and_runs_to_completion(self):
+        job = self.enqueue()
+        claimed = jobs.claim_next_job('w1')
+        self.assertEqual(claimed.pk, job.pk)
+        self.assertIsNone(jobs.claim_next_job('w2'))
+
+        self.assertTrue(jobs.run_job(claimed))
+        job.refresh_from_db()
+        self.assertEqual(job.status, 'completed')
+        self.assertEqual(job.progress, 100)
+        self.assertEqual(job.results.count(), job.total_chunks)
+
+    def test_stale_running_job_is_requeued(self):
+        job = make_job(status='running', worker_id='w1')
+        ProcessingJob.objects.filter(pk=job.pk).update(updated_at=timezone.now() - timedelta(seconds=120))
+        fresh = make_job(status='running', worker_id='w2')
+
+        self.assertEqual(jobs.requeue_stale_jobs(60), 1)
+        job.refresh_from_db()
+        fresh.refresh_from_db()
+        self.assertEqual((job.status, job.worker_id), ('queued', None))
+        self.assertEqual(fresh.status, 'running')
+
+    def test_writes_are_rejected_after_job_is_taken_over(self):
+        job = make_job(status='running', worker_id='w1')
+        ProcessingJob.objects.filter(pk=job.pk).update(worker_id='w2')
+
+        job.progress = 50
+        with self.assertRaises(JobLeaseLost):
+            job.save_owned(['progress'])
+        self.assertEqual(ProcessingJob.objects.get(pk=job.pk).progress, 0)
+
+    def test_old_worker_stops_writing_when_job_is_taken_over_mid_run(self):
+        job = self.enqueue()
+        claimed = jobs.claim_next_job('w1')
+        real_record = TextProcessor._record_job_chunk
+
+        def take_over_then_record(processor, job, *args, **kwargs):
+            # 第一个块完成时任务已超时，被重新排队后由 w2 领取
+            ProcessingJob.objects.filter(pk=job.pk).update(worker_id='w2')
+            return real_record(processor, job, *args, **kwargs)
+
+        with mock.patch.object(TextProcessor, '_record_job_chunk', take_over_then_record):
+            self.assertFalse(jobs.run_job(claimed))
+
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.worker_id), ('running', 'w2'))
+        self.assertEqual(job.results.count(), 0)
+        self.assertFalse(job.chunks.exclude(status='pending').exists())
+        self.assertIsNone(job.result)
+
+
+def read_events(job: ProcessingJob):
+    events = []
+    for message in jobs.iter_job_events(job.id, poll_interval=0.01):
+        if message.startswith('event: '):
+            event, data = message.split('\n')[:2]
+            events.append((event[len('event: '):], json.loads(data[len('data: '):])))
+    return events
+
+
+class JobEventsTests(IsolatedTestCase):
+    def test_completed_job_streams_chunks_then_finished(self):
+        job = make_job(status='completed', result='[]', total_chunks=2, completed_chunks=2, progress=100)
+        ProcessingChunk.objects.create(job=job, index=1, content='a', status='completed')
+        ProcessingChunk.objects.create(job=job, index=2, content='b', status='failed', error='超时')
+        ProcessingResult.objects.create(job=job, index=1, result={'ok': True})
+
+        events = read_events(job)
+        self.assertEqual([name for name, _ in events], ['chunk', 'chunk', 'progress', 'finished'])
+        self.assertEqual(events[0][1], {'index': 1, 'status': 'completed', 'result': {'ok': True}})
+        self.assertEqual(events[1][1]['error'], '超时')
+        self.assertEqual(events[-1][1]['status'], 'completed')
+        self.assertEqual(events[-1][1]['results'], [])
+
+    def test_waiting_batch_job_ends_stream_with_poll_event(self):
+        job = make_job(status='waiting', execution_mode='batch')
+        events = read_events(job)
+        self.assertEqual(events[-1], ('poll', {'reason': 'waiting', 'cursor': 0}))
+
+    @override_settings(PROCESSING_EVENTS_MAX_SECONDS=0)
+    def test_stream_duration_is_capped(self):
+        job = make_job(status='running', worker_id='w1')
+        ProcessingResult.objects.create(job=job, index=1, result={'ok': True})
+
+        events = read_events(job)
+        self.assertEqual([name for name, _ in events], ['chunk', 'progress', 'poll'])
+        self.assertEqual(events[-1][1]['reason'], 'timeout')
+        self.assertEqual(events[-1][1]['cursor'], job.results.get().id)
+
+    def test_events_view_streams_server_sent_events(self):
+        job = make_job(status='waiting')
+        response = self.client.get(f'/processing-events/{job.key}/')
+        self.assertEqual(response['Content-Type'], 'text/event-stream')
+        self.assertIn('event: poll', b''.join(response.streaming_content).decode())
+        self.assertEqual(self.client.get('/processing-events/missing/').status_code, 404)
+
+
+class JobHeartbeatTests(TransactionTestCase):
+    def test_heartbeat_refreshes_running_job_and_stops_after_takeover(self):
+        job = make_job(status='running', worker_id='w1')
+        stale = timezone.now() - timedelta(seconds=300)
+        ProcessingJob.objects.filter(pk=job.pk).update(updated_at=stale)
+
+        with jobs.JobHeartbeat(job, interval=0.02) as heartbeat:
+            time.sleep(0.1)
+            self.assertGreater(ProcessingJob.objects.get(pk=job.pk).updated_at, stale)
+            self.assertEqual(jobs.requeue_stale_jobs(60), 0)
+
+            ProcessingJob.objects.filter(pk=job.pk).update(worker_id='w2', updated_at=stale)
+            heartbeat._thread.join(timeout=1)
+            self.assertFalse(heartbeat._thread.is_alive())
+        self.assertEqual(ProcessingJob.objects.get(pk=job.pk).updated_at, stale)
+
+
+class ProcessingStatusViewTests(IsolatedTestCase):
+    def status(self, key, **params):
+        return self.client.get(f'/check-processing-status/{key}/', params)
+
+    def test_results_are_returned_incrementally_by_cursor(self):
+        job = make_job(status='running', total_chunks=3)
+        ProcessingResult.objects.create(job=job, index=1, result={'n': 1})
+        first = self.status(job.key).json()
+        self.assertEqual(first['status'], 'processing')
+        self.assertEqual(first['results'], [{'index': 1, 'result': {'n': 1}}])
+
+        ProcessingResult.objects.create(job=job, index=2, result={'n': 2})
+        second = self.status(job.key, since=first['cursor']).json()
+        self.assertEqual(second['results'], [{'index': 2, 'result': {'n': 2}}])
+        self.assertEqual(self.status(job.key, since=second['cursor']).json()['results'], [])
+
+    def test_invalid_cursor_is_rejected(self):
+        job = make_job()
+        for since in ('abc', '-1', '1.5'):
+            response = self.status(job.key, since=since)
+            self.assertEqual(response.status_code, 400)
+            self.assertIn('since', response.json()['error'])
+
+    def test_unknown_key_is_still_processing(self):
+        self.assertEqual(self.status('missing').json(), {'status': 'processing'})
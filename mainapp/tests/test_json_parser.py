@@ -0,0 +1,71 @@
+from django.test import SimpleTestCase
+from mainapp.data_services import TextProcessor
+from mainapp.json_parser import IncrementalJSONParser, parse_json_response
+from .helpers import FakeService
+
+
+class ParseJsonResponseTests(SimpleTestCase):
+    def test_plain_object_and_array(self):
+        self.assertEqual(parse_json_response('{"a": 1}').data, {'a': 1})
+        self.assertEqual(parse_json_response('[1, 2]').data, [1, 2])
+
+    def test_code_fence_and_surrounding_text_are_skipped(self):
+        text = '下面是结果：\n```json\n{"label": "焦虑"}\n```\n以上。'
+        self.assertEqual(parse_json_response(text).data, {'label': '焦虑'})
+
+    def test_trailing_commas_are_removed(self):
+        result = parse_json_response('{"a": [1, 2,], "b": 3,}')
+        self.assertEqual(result.data, {'a': [1, 2], 'b': 3})
+        self.assertEqual(len(result.diagnostics), 2)
+
+    def test_concatenated_values_become_a_list(self):
+        self.assertEqual(parse_json_response('{"a": 1}\n{"a": 2}').data, [{'a': 1}, {'a': 2}])
+
+    def test_brackets_and_quotes_inside_strings(self):
+        text = '{"text": "他说：\\"[不要]\\" {}", "ok": true}'
+        self.assertEqual(parse_json_response(text).data, {'text': '他说："[不要]" {}', 'ok': True})
+
+    def test_truncated_output_keeps_complete_members(self):
+        result = parse_json_response('[{"a": 1}, {"a": 2}, {"a": 3')
+        self.assertTrue(result.truncated)
+        self.assertEqual(result.data, [{'a': 1}, {'a': 2}])
+
+    def test_truncated_output_without_complete_member(self):
+        result = parse_json_response('{"a": "未完')
+        self.assertTrue(result.truncated)
+        self.assertIsNone(result.data)
+
+    def test_top_level_scalars_are_preserved(self):
+        self.assertEqual(parse_json_response('42').data, 42)
+        self.assertEqual(parse_json_response('"焦虑"').data, '焦虑')
+        self.assertIs(parse_json_response('```json\ntrue\n```').data, True)
+
+    def test_plain_text_is_not_json(self):
+        self.assertIsNone(parse_json_response('好的，我明白了').data)
+
+
+class IncrementalFeedTests(SimpleTestCase):
+    def test_feeding_pieces_matches_parsing_whole_text(self):
+        text = '```json\n[{"a": "x,]"}, {"b": [1, 2,]},]\n```\n{"c": 3}'
+        parser = IncrementalJSONParser()
+        completed = []
+        for i in range(0, len(text), 3):
+            completed.extend(parser.feed(text[i:i + 3]))
+        result = parser.close()
+
+        self.assertEqual(completed, result.values)
+        self.assertEqual(result.data, parse_json_response(text).data)
+
+    def test_closed_parser_rejects_input(self):
+        parser = IncrementalJSONParser()
+        parser.close()
+        with self.assertRaises(ValueError):
+            parser.feed('{}')
+
+
+class ProcessorResponseParsingTests(SimpleTestCase):
+    def test_unparseable_response_is_returned_as_text(self):
+        processor = TextProcessor(FakeService(), max_workers=1)
+        self.assertEqual(processor._parse_json_response('无法解析'), '无法解析')
+        self.assertEqual(processor._parse_json_response('7'), 7)
+        self.assertEqual(processor._parse_json_response('{"a": 1,}'), {'a': 1})
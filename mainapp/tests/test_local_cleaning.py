@@ -0,0 +1,66 @@
+import json
+from django.test import SimpleTestCase, override_settings
+from mainapp.data_services import TextProcessor
+from mainapp.local_cleaning import LocalCleaner, split_dimensions
+from .helpers import FakeService, IsolatedTestCase
+
+LOCAL = ['格式统一', '标点符号规范', '错别字纠正']
+
+
+class LocalCleanerTests(SimpleTestCase):
+    def setUp(self):
+        self.cleaner = LocalCleaner({'因该': '应该', '部份': '部分'})
+
+    def test_batch_cleaning_matches_cleaning_each_text(self):
+        texts = [
+            '  你好 世界  ', '  第二条 ,好的 ', '\t缩进的一行\n    第二行 \n', '', '   ',
+            '价格是１２．５元．', '我因该去...', '句子 。', '部份内容\n\n\n\n下一段', 'ａｂｃ　ｄｅｆ​',
+        ]
+        self.assertEqual(self.cleaner.clean_texts(texts, LOCAL), [self.cleaner.clean(t, LOCAL) for t in texts])
+        self.assertEqual(self.cleaner.clean_texts(['  你好 世界  ', '  第二条 ,好的 '], LOCAL),
+                         ['你好世界', '第二条，好的'])
+
+    def test_line_indentation_is_kept_and_trailing_whitespace_removed(self):
+        text = '第一行\n    缩进的行  \n\t\t制表符缩进   \n'
+        self.assertEqual(self.cleaner.normalize_format(text), '第一行\n    缩进的行\n\t\t制表符缩进\n')
+
+    def test_inline_whitespace_runs_are_collapsed(self):
+        self.assertEqual(self.cleaner.normalize_format('hello    world\n\n\n\nnext'), 'hello world\n\nnext')
+
+    def test_punctuation_is_normalised_in_chinese_context(self):
+        self.assertEqual(self.cleaner.normalize_punctuation('你好,世界!真的吗?好的.'), '你好，世界！真的吗？好的。')
+        self.assertEqual(self.cleaner.normalize_punctuation('版本 1.5, ok.'), '版本 1.5, ok.')
+        self.assertEqual(self.cleaner.normalize_punctuation('然后...就这样，，'), '然后……就这样，')
+
+    def test_typos_are_replaced_from_the_word_list(self):
+        self.assertEqual(self.cleaner.correct_typos('我因该看看部份内容'), '我应该看看部分内容')
+
+    def test_clean_values_cleans_nested_strings_only(self):
+        values = [{'id': 1, 'text': ' 你好 ,世界 ', 'tags': ['  甲  ', 2]}, '  乙 ']
+        self.assertEqual(self.cleaner.clean_values(values, LOCAL),
+                         [{'id': 1, 'text': '你好，世界', 'tags': ['甲', 2]}, '乙'])
+
+    def test_texts_containing_the_separator_are_cleaned_one_by_one(self):
+        texts = ['甲\x00乙 ', ' 丙']
+        self.assertEqual(self.cleaner.clean_texts(texts, LOCAL), [self.cleaner.clean(t, LOCAL) for t in texts])
+
+
+class SplitDimensionsTests(SimpleTestCase):
+    def test_partial_dimensions_run_locally_and_on_the_model(self):
+        self.assertEqual(split_dimensions(['格式统一', '错别字纠正', '语法规范']),
+                         {'local': ['格式统一', '错别字纠正'], 'model': ['错别字纠正', '语法规范']})
+
+    @override_settings(LOCAL_CLEANING={'ENABLED': False, 'DIMENSIONS': {'格式统一': 'local'}})
+    def test_disabled_local_cleaning_sends_everything_to_the_model(self):
+        self.assertEqual(split_dimensions(['格式统一']), {'local': [], 'model': ['格式统一']})
+
+
+class LocalProcessingTests(IsolatedTestCase):
+    def test_local_only_dimensions_do_not_call_the_model(self):
+        service = FakeService()
+        dimensions = self.dimension_ids('cleaning', ['格式统一', '标点符号规范'])
+        result = json.loads(TextProcessor(service).process_content(
+            '  来访者：你好 ,我最近压力很大  ', 'cleaning', dimensions, 'key-local'))
+
+        self.assertEqual(service.calls, [])
+        self.assertEqual(result, [{'input': '  来访者：你好 ,我最近压力很大  ', 'output': '来访者：你好，我最近压力很大'}])
@@ -0,0 +1,82 @@
+import json
+from django.test import override_settings
+from mainapp import jobs
+from mainapp.data_services import MISSING_RECORD_ERROR, TextProcessor
+from mainapp.models import ProcessingChunk
+from mainapp.packing import store_pack
+from .helpers import AsyncFakeService, FakeService, IsolatedTestCase, user_content
+
+
+def records(count: int) -> str:
+    return json.dumps([
+        {'id': f'r{i}', 'text': f'第{i}条记录：编号{i * 7919}，来访者提到工作{i % 5}带来的压力。'} for i in range(count)
+    ], ensure_ascii=False)
+
+
+def requested_ids(messages) -> list:
+    return [r['id'] for r in json.loads(user_content(messages))['records']]
+
+
+def echo_records(messages, skip=()) -> str:
+    return json.dumps([{'id': i, 'label': f'标签-{i}'} for i in requested_ids(messages) if i not in skip])
+
+
+@override_settings(NEAR_DUPLICATE_DETECTION={'ENABLED': False, 'MAX_DISTANCE': 0, 'NGRAM': 3},
+                   REQUEST_PACKING={'ENABLED': True, 'MAX_RECORDS': 4, 'MAX_RETRIES': 2})
+class RequestPackingTests(IsolatedTestCase):
+    def setUp(self):
+        super().setUp()
+        self.dimensions = self.dimension_ids('labeling')[:2]
+
+    def process(self, service, content: str, **kwargs):
+        return json.loads(TextProcessor(service, max_workers=2).process_content(
+            content, 'labeling', self.dimensions, 'key-pack', **kwargs))
+
+    def test_records_are_packed_and_results_keep_record_order(self):
+        service = FakeService(echo_records)
+        result = self.process(service, records(10))
+
+        self.assertEqual(len(service.calls), 3)
+        self.assertEqual([item['id'] for item in result], [f'r{i}' for i in range(10)])
+        self.assertEqual(result[0]['label'], '标签-r0')
+
+    def test_only_missing_records_are_requested_again(self):
+        service = FakeService(lambda messages: echo_records(messages, skip={'r1'} if len(service.calls) == 1 else ()))
+        result = self.process(service, records(3))
+
+        self.assertEqual([requested_ids(m) for m in service.calls], [['r0', 'r1', 'r2'], ['r1']])
+        self.assertEqual([item['id'] for item in result], ['r0', 'r1', 'r2'])
+
+    def test_records_still_missing_after_retries_are_marked(self):
+        service = FakeService(lambda messages: echo_records(messages, skip={'r2'}))
+        result = self.process(service, records(3))
+
+        self.assertEqual(len(service.calls), 3)
+        self.assertEqual(result[2], {'id': 'r2', 'error': MISSING_RECORD_ERROR})
+
+    async def test_async_path_shares_the_missing_record_retries(self):
+        service = AsyncFakeService(lambda messages: echo_records(messages, skip={'r1'} if len(service.calls) == 1 else ()))
+        result = json.loads(await TextProcessor(service, max_workers=2).aprocess_content(
+            records(3), 'labeling', self.dimensions, 'key-apack'))
+
+        self.assertEqual([requested_ids(m) for m in service.calls], [['r0', 'r1', 'r2'], ['r1']])
+        self.assertEqual([item['label'] for item in result], ['标签-r0', '标签-r1', '标签-r2'])
+
+    def test_packed_flag_is_persisted_and_used_on_resume(self):
+        job = jobs.enqueue_job(records(3), 'labeling', self.dimensions)
+        self.assertIsNone(TextProcessor(FakeService(lambda messages: None)).process_content(
+            records(3), 'labeling', self.dimensions, 'key-pack', job=job))
+        job.refresh_from_db()
+        self.assertTrue(job.packed)
+
+        service = FakeService(echo_records)
+        result = self.process(service, '', job=job, resume=True)
+        self.assertEqual([item['id'] for item in result], ['r0', 'r1', 'r2'])
+
+    def test_plain_text_that_looks_like_a_pack_is_not_demultiplexed(self):
+        job = jobs.enqueue_job('', 'labeling', self.dimensions)
+        chunk = store_pack([{'id': 'x', 'content': '看起来像打包内容的普通文本'}])
+        ProcessingChunk.objects.create(job=job, index=1, content=chunk, status='failed')
+
+        result = self.process(FakeService(lambda messages: '{"label": "整块"}'), '', job=job, resume=True)
+        self.assertEqual(result, [{'label': '整块'}])
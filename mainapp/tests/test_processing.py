@@ -0,0 +1,144 @@
+import asyncio
+import json
+import re
+import threading
+import time
+from unittest import mock
+from django.core.cache import cache
+from django.test import override_settings
+from mainapp import data_services
+from mainapp.data_services import TextProcessor
+from .helpers import AsyncFakeService, FakeService, IsolatedTestCase, user_content
+
+
+def dialogue(turns: int) -> str:
+    return ''.join(
+        f"来访者：第{i}段，编号{i * 7919}，我最近在工作{i % 5}和家庭之间感到压力很大。\n"
+        f"咨询师：能具体说说第{i}段里让你困扰的事情吗？\n"
+        for i in range(turns)
+    )
+
+
+def first_turn(messages) -> str:
+    return re.search(r'第(\d+)段', user_content(messages)).group(1)
+
+
+@override_settings(NEAR_DUPLICATE_DETECTION={'ENABLED': False, 'MAX_DISTANCE': 0, 'NGRAM': 3})
+class ConcurrentProcessingTests(IsolatedTestCase):
+    def setUp(self):
+        super().setUp()
+        self.dimensions = self.dimension_ids('labeling')[:2]
+
+    def make_service(self, reply) -> FakeService:
+        service = FakeService(reply)
+        service.max_tokens = 200  # 小预算，得到多个文本块
+        return service
+
+    def test_results_keep_source_order_when_chunks_finish_out_of_order(self):
+        def reply(messages):
+            turn = int(first_turn(messages))
+            time.sleep(0.02 if turn < 10 else 0)  # 前面的块更慢
+            return json.dumps({'first': turn})
+
+        service = self.make_service(reply)
+        result = TextProcessor(service, max_workers=4).process_content(
+            dialogue(40), 'labeling', self.dimensions, 'key-order'
+        )
+
+        firsts = [item['first'] for item in json.loads(result)]
+        self.assertGreater(len(firsts), 3)
+        self.assertEqual(firsts, sorted(firsts))
+        self.assertEqual(len(service.calls), len(firsts))
+
+    def test_worker_count_bounds_in_flight_requests(self):
+        lock = threading.Lock()
+        state = {'active': 0, 'peak': 0}
+
+        def reply(messages):
+            with lock:
+                state['active'] += 1
+                state['peak'] = max(state['peak'], state['active'])
+            time.sleep(0.01)
+            with lock:
+                state['active'] -= 1
+            return '{"ok": true}'
+
+        TextProcessor(self.make_service(reply), max_workers=2).process_content(
+            dialogue(40), 'labeling', self.dimensions, 'key-bound'
+        )
+        self.assertEqual(state['peak'], 2)
+
+    @override_settings(AI_SERVICE_CONCURRENCY={'openai': 3})
+    def test_default_worker_count_comes_from_provider_setting(self):
+        self.assertEqual(TextProcessor(FakeService()).max_workers, 3)
+
+    def test_progress_is_published_to_processing_cache(self):
+        states = []
+        real_set = cache.set
+
+        def record(key, value, *args, **kwargs):
+            if key == 'key-progress':
+                states.append(dict(value))
+            return real_set(key, value, *args, **kwargs)
+
+        with mock.patch.object(data_services.cache, 'set', side_effect=record):
+            result = TextProcessor(self.make_service(lambda m: '{"ok": true}'), max_workers=2).process_content(
+                dialogue(30), 'labeling', self.dimensions, 'key-progress'
+            )
+
+        progress = [s for s in states if s['status'] == 'processing']
+        self.assertTrue(progress)
+        self.assertEqual([s['completed_chunks'] for s in progress], list(range(1, len(progress) + 1)))
+        self.assertEqual(states[-1]['status'], 'completed')
+        self.assertEqual(states[-1]['result'], result)
+
+
+@override_settings(NEAR_DUPLICATE_DETECTION={'ENABLED': False, 'MAX_DISTANCE': 0, 'NGRAM': 3})
+class AsyncProcessingTests(IsolatedTestCase):
+    def setUp(self):
+        super().setUp()
+        self.dimensions = self.dimension_ids('labeling')[:2]
+
+    def make_service(self, reply) -> AsyncFakeService:
+        service = AsyncFakeService(reply)
+        service.max_tokens = 200
+        return service
+
+    async def test_async_results_keep_source_order_and_bound_concurrency(self):
+        state = {'active': 0, 'peak': 0}
+
+        async def reply(messages):
+            state['active'] += 1
+            state['peak'] = max(state['peak'], state['active'])
+            turn = int(first_turn(messages))
+            await asyncio.sleep(0.02 if turn < 10 else 0.001)
+            state['active'] -= 1
+            return json.dumps({'first': turn})
+
+        service = self.make_service(reply)
+        result = await TextProcessor(service, max_workers=3).aprocess_content(
+            dialogue(40), 'labeling', self.dimensions, 'key-async'
+        )
+
+        firsts = [item['first'] for item in json.loads(result)]
+        self.assertGreater(len(firsts), 3)
+        self.assertEqual(firsts, sorted(firsts))
+        self.assertEqual(state['peak'], 3)
+
+    async def test_async_failed_chunks_are_retried(self):
+        failures = set()
+
+        def reply(messages):
+            turn = first_turn(messages)
+            if turn not in failures:
+                failures.add(turn)
+                return None
+            return json.dumps({'first': int(turn)})
+
+        result = await TextProcessor(self.make_service(reply), max_workers=2).aprocess_content(
+            dialogue(20), 'labeling', self.dimensions, 'key-async-retry'
+        )
+
+        firsts = [item['first'] for item in json.loads(result)]
+        self.assertEqual(firsts, sorted(firsts))
+        self.assertEqual(len(firsts), len(failures))
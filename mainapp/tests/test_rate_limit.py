@@ -0,0 +1,150 @@
+import asyncio
+import threading
+from types import SimpleNamespace
+from unittest import mock
+from django.conf import settings
+from django.test import override_settings
+from mainapp import rate_limit
+from mainapp.ai_services import AsyncAIServiceBase
+from mainapp.rate_limit import RateLimiter, get_rate_limiter
+from .helpers import AsyncFakeService, FakeService, IsolatedTestCase
+
+
+class FakeClock:
+    """替换 rate_limit 模块中的 time.time/time.sleep，sleep 直接推进时间"""
+
+    def __init__(self, now: float = 1000.0):
+        self.now = now
+
+    def time(self) -> float:
+        return self.now
+
+    def sleep(self, seconds: float) -> None:
+        self.now += seconds
+
+
+class RateLimiterTests(IsolatedTestCase):
+    def setUp(self):
+        super().setUp()
+        self.clock = FakeClock()
+        patcher = mock.patch.object(rate_limit, 'time', self.clock)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.limiter = RateLimiter(f'{self.tmpdir}/limits.sqlite3')
+
+    def test_requests_per_minute(self):
+        self.assertEqual(self.limiter.try_acquire('k', 2, 1000, 1), 0)
+        self.assertEqual(self.limiter.try_acquire('k', 2, 1000, 1), 0)
+        self.assertAlmostEqual(self.limiter.try_acquire('k', 2, 1000, 1), 30)
+
+        self.clock.now += 30
+        self.assertEqual(self.limiter.try_acquire('k', 2, 1000, 1), 0)
+
+    def test_tokens_per_minute(self):
+        self.assertEqual(self.limiter.try_acquire('k', 100, 600, 500), 0)
+        self.assertAlmostEqual(self.limiter.try_acquire('k', 100, 600, 200), 10)
+        # 超过整桶容量的请求按整桶计算，等桶满后可以发出
+        self.clock.now += 60
+        self.assertEqual(self.limiter.try_acquire('k', 100, 600, 5000), 0)
+
+    def test_keys_are_independent(self):
+        self.limiter.try_acquire('a', 1, 1000, 1)
+        self.assertGreater(self.limiter.try_acquire('a', 1, 1000, 1), 0)
+        self.assertEqual(self.limiter.try_acquire('b', 1, 1000, 1), 0)
+
+    def test_state_is_shared_between_limiters_on_the_same_file(self):
+        other = RateLimiter(f'{self.tmpdir}/limits.sqlite3')
+        self.limiter.try_acquire('k', 1, 1000, 1)
+        self.assertGreater(other.try_acquire('k', 1, 1000, 1), 0)
+
+    def test_concurrent_callers_never_exceed_the_bucket(self):
+        results = []
+        lock = threading.Lock()
+
+        def worker():
+            wait = self.limiter.try_acquire('k', 5, 1000, 1)
+            with lock:
+                results.append(wait)
+
+        threads = [threading.Thread(target=worker) for _ in range(20)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(results.count(0), 5)
+
+    def test_acquire_queues_until_capacity_returns(self):
+        self.limiter.try_acquire('k', 1, 1000, 1)
+        self.assertAlmostEqual(self.limiter.acquire('k', 1, 1000, 1), 60)
+
+    def test_refund_returns_unused_tokens(self):
+        self.limiter.try_acquire('k', 100, 600, 600)
+        self.limiter.refund('k', 600, 400)
+        self.assertEqual(self.limiter.try_acquire('k', 100, 600, 400), 0)
+
+    def test_block_pauses_the_bucket(self):
+        self.limiter.try_acquire('k', 100, 1000, 1)
+        self.limiter.block('k', 15)
+        self.assertAlmostEqual(self.limiter.try_acquire('k', 100, 1000, 1), 15)
+        self.clock.now += 15
+        self.assertEqual(self.limiter.try_acquire('k', 100, 1000, 1), 0)
+
+
+class ServiceRateLimitTests(IsolatedTestCase):
+    def setUp(self):
+        super().setUp()
+        overrides = override_settings(AI_RATE_LIMITS={**settings.AI_RATE_LIMITS, 'ENABLED': True})
+        overrides.enable()
+        self.addCleanup(overrides.disable)
+
+    def test_calls_reserve_prompt_plus_max_tokens_and_refund_the_rest(self):
+        service = FakeService(lambda messages: '好')
+        limiter = get_rate_limiter()
+        with mock.patch.object(limiter, 'acquire', wraps=limiter.acquire) as acquire, \
+                mock.patch.object(limiter, 'refund', wraps=limiter.refund) as refund:
+            service.chat_completion([{'role': 'user', 'content': '你好'}], task_type='chat')
+
+        key, rpm, tpm, tokens = acquire.call_args.args
+        self.assertEqual(key, RateLimiter.make_key('openai', 'test-key'))
+        self.assertEqual((rpm, tpm), (settings.AI_RATE_LIMITS['LIMITS']['openai']['rpm'],
+                                      settings.AI_RATE_LIMITS['LIMITS']['openai']['tpm']))
+        self.assertGreater(tokens, service.max_tokens)
+        self.assertEqual(refund.call_args.args[2], service.max_tokens - 1)
+        self.assertNotIn('test-key', key)
+
+    def test_429_blocks_the_key_for_retry_after(self):
+        service = FakeService()
+        error = Exception('too many requests')
+        error.status_code = 429
+        error.response = SimpleNamespace(headers={'Retry-After': '7'})
+        with mock.patch.object(get_rate_limiter(), 'block') as block:
+            service._handle_rate_limit(error)
+        block.assert_called_once_with(RateLimiter.make_key('openai', 'test-key'), 7.0)
+
+    def test_async_stream_refunds_outside_the_event_loop(self):
+        async def stream():
+            for text in ('你', '好'):
+                yield SimpleNamespace(choices=[SimpleNamespace(delta=SimpleNamespace(content=text))])
+
+        async def create(**kwargs):
+            return stream()
+
+        service = AsyncFakeService()
+        service.client = SimpleNamespace(chat=SimpleNamespace(completions=SimpleNamespace(create=create)))
+        refund_threads = []
+        limiter = get_rate_limiter()
+        original_refund = limiter.refund
+
+        def refund(*args):
+            refund_threads.append(threading.current_thread())
+            return original_refund(*args)
+
+        async def consume():
+            # 流式基类实现被 AsyncFakeService 覆盖，这里直接调用
+            return [part async for part in AsyncAIServiceBase.stream_chat_completion(
+                service, [{'role': 'user', 'content': '你好'}])]
+
+        with mock.patch.object(limiter, 'refund', side_effect=refund):
+            self.assertEqual(asyncio.run(consume()), ['你', '好'])
+        self.assertEqual(len(refund_threads), 1)
+        self.assertIsNot(refund_threads[0], threading.current_thread())
@@ -0,0 +1,98 @@
+from unittest import mock
+from django.conf import settings
+from django.test import override_settings
+from mainapp import response_cache
+from mainapp.response_cache import ResponseCache
+from .helpers import FakeService, IsolatedTestCase
+
+MESSAGES = [{'role': 'system', 'content': '标注提示词'}, {'role': 'user', 'content': '文本块'}]
+
+
+class ResponseCacheTests(IsolatedTestCase):
+    def make_cache(self, **kwargs) -> ResponseCache:
+        return ResponseCache(f'{self.tmpdir}/responses.sqlite3', **kwargs)
+
+    def test_key_covers_provider_model_temperature_and_messages(self):
+        key = ResponseCache.make_key('openai', 'gpt', 0.2, MESSAGES)
+        self.assertEqual(key, ResponseCache.make_key('openai', 'gpt', 0.2, [dict(m) for m in MESSAGES]))
+        other_prompt = [{'role': 'system', 'content': '清洗提示词'}, MESSAGES[1]]
+        for other in (('zhipu', 'gpt', 0.2, MESSAGES), ('openai', 'gpt-4', 0.2, MESSAGES),
+                      ('openai', 'gpt', 0.8, MESSAGES), ('openai', 'gpt', 0.2, other_prompt)):
+            self.assertNotEqual(key, ResponseCache.make_key(*other))
+
+    def test_hits_and_misses_are_counted(self):
+        cache = self.make_cache()
+        self.assertIsNone(cache.get('k'))
+        cache.set('k', '结果')
+        self.assertEqual(cache.get('k'), '结果')
+
+        stats = cache.stats()
+        self.assertEqual((stats['hits'], stats['misses'], stats['entries']), (1, 1, 1))
+        self.assertEqual(stats['hit_rate'], 0.5)
+
+    def test_expired_entry_is_a_miss_and_removed(self):
+        cache = self.make_cache(ttl=60)
+        with mock.patch.object(response_cache.time, 'time', return_value=1000.0):
+            cache.set('k', '结果')
+        with mock.patch.object(response_cache.time, 'time', return_value=1061.0):
+            self.assertIsNone(cache.get('k'))
+        self.assertEqual(cache.stats()['entries'], 0)
+
+    def test_eviction_keeps_recently_accessed_entries(self):
+        cache = self.make_cache(max_entries=2)
+        for n, key in enumerate(['a', 'b', 'c']):
+            with mock.patch.object(response_cache.time, 'time', return_value=1000.0 + n):
+                cache.set(key, key)
+        with mock.patch.object(response_cache.time, 'time', return_value=1010.0):
+            cache.get('a')
+            self.assertEqual(cache.evict(), 1)
+            self.assertIsNone(cache.get('b'))
+            self.assertEqual((cache.get('a'), cache.get('c')), ('a', 'c'))
+
+    def test_eviction_respects_byte_budget(self):
+        cache = self.make_cache(max_bytes=10)
+        for n, key in enumerate(['a', 'b', 'c']):
+            with mock.patch.object(response_cache.time, 'time', return_value=1000.0 + n):
+                cache.set(key, 'x' * 4)
+        with mock.patch.object(response_cache.time, 'time', return_value=1010.0):
+            cache.evict()
+            self.assertEqual(cache.stats()['bytes'], 8)
+            self.assertIsNone(cache.get('a'))
+
+
+class ServiceResponseCacheTests(IsolatedTestCase):
+    def setUp(self):
+        super().setUp()
+        overrides = override_settings(LLM_RESPONSE_CACHE={**settings.LLM_RESPONSE_CACHE, 'ENABLED': True})
+        overrides.enable()
+        self.addCleanup(overrides.disable)
+        self.service = FakeService(lambda messages: f"回复{len(self.service.calls)}")
+
+    def test_repeated_labeling_request_is_served_from_cache(self):
+        first = self.service.chat_completion(MESSAGES, task_type='labeling')
+        second = self.service.chat_completion(MESSAGES, task_type='labeling')
+
+        self.assertEqual(first, second)
+        self.assertEqual(len(self.service.calls), 1)
+        self.assertEqual(self.client.get('/api/response-cache/stats/').json()['hits'], 1)
+
+    def test_use_cache_false_bypasses_cache(self):
+        self.service.chat_completion(MESSAGES, task_type='labeling')
+        self.service.chat_completion(MESSAGES, task_type='labeling', use_cache=False)
+        self.assertEqual(len(self.service.calls), 2)
+
+    def test_chat_replies_and_failures_are_not_cached(self):
+        self.service.chat_completion(MESSAGES, task_type='chat')
+        self.service.chat_completion(MESSAGES, task_type='chat')
+        self.assertEqual(len(self.service.calls), 2)
+
+        failing = FakeService(lambda messages: None)
+        failing.chat_completion(MESSAGES, task_type='cleaning')
+        failing.chat_completion(MESSAGES, task_type='cleaning')
+        self.assertEqual(len(failing.calls), 2)
+
+    def test_replies_rejected_by_cacheable_are_not_cached(self):
+        self.service.chat_completion(MESSAGES, task_type='labeling', cacheable=lambda reply: False)
+        self.service.chat_completion(MESSAGES, task_type='labeling', cacheable=lambda reply: True)
+        self.service.chat_completion(MESSAGES, task_type='labeling')
+        self.assertEqual(len(self.service.calls), 2)
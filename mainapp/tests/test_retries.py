@@ -0,0 +1,131 @@
+import json
+from unittest import mock
+from django.conf import settings
+from django.test import override_settings
+from mainapp import ai_services, data_services, jobs
+from mainapp.data_services import TextProcessor
+from mainapp.models import APIConfig
+from .helpers import FakeService, IsolatedTestCase, user_content
+from .test_processing import dialogue, first_turn
+
+
+@override_settings(NEAR_DUPLICATE_DETECTION={'ENABLED': False, 'MAX_DISTANCE': 0, 'NGRAM': 3})
+class ChunkRetryTests(IsolatedTestCase):
+    def setUp(self):
+        super().setUp()
+        APIConfig.objects.create(service_type='openai', api_key='test-key')
+        self.failing = {'0'}
+        self.service = FakeService(self.reply)
+        self.service.max_tokens = 200
+        patcher = mock.patch.object(ai_services, '_build_ai_service', return_value=self.service)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def reply(self, messages):
+        turn = first_turn(messages)
+        return None if turn in self.failing else json.dumps({'first': int(turn)})
+
+    def run_job(self):
+        job = jobs.enqueue_job(dialogue(30), 'labeling', self.dimension_ids('labeling')[:2])
+        jobs.run_job(jobs.claim_next_job('w1'))
+        job.refresh_from_db()
+        return job
+
+    @override_settings(CHUNK_RETRIES={'MAX_ATTEMPTS': 4, 'BACKOFF_BASE': 2, 'BACKOFF_MAX': 5})
+    def test_failed_chunks_are_retried_with_capped_backoff(self):
+        attempts = {}
+
+        def reply(messages):
+            turn = first_turn(messages)
+            attempts[turn] = attempts.get(turn, 0) + 1
+            return None if turn == '0' and attempts[turn] < 4 else json.dumps({'first': int(turn)})
+
+        self.service.reply = reply
+        with mock.patch.object(data_services.time, 'sleep') as sleep:
+            job = self.run_job()
+
+        self.assertEqual([c.args[0] for c in sleep.call_args_list], [2, 4, 5])
+        self.assertEqual(job.status, 'completed')
+        self.assertIsNone(job.error)
+        self.assertEqual(job.chunks.get(index=1).attempts, 4)
+        self.assertEqual(set(job.chunks.exclude(index=1).values_list('attempts', flat=True)), {1})
+
+    def test_chunks_failing_every_attempt_are_marked_in_the_result(self):
+        job = self.run_job()
+
+        self.assertEqual(job.status, 'completed')
+        self.assertEqual(job.error, '1 个文本块处理失败: [1]')
+        failed = job.chunks.get(index=1)
+        self.assertEqual((failed.status, failed.attempts), ('failed', 3))
+        result = json.loads(job.result)
+        self.assertEqual(result[0], {'chunk': 1, 'error': '未获得AI响应'})
+        self.assertEqual(len(result), job.total_chunks)
+
+    def test_resume_only_requests_unfinished_chunks(self):
+        job = self.run_job()
+        self.service.calls.clear()
+        self.failing = set()
+
+        response = self.client.post(f'/resume-job/{job.key}/')
+        self.assertEqual(response.json()['status'], 'queued')
+        self.assertTrue(jobs.run_job(jobs.claim_next_job('w2')))
+        job.refresh_from_db()
+
+        self.assertEqual([first_turn(m) for m in self.service.calls], ['0'])
+        self.assertEqual(job.status, 'completed')
+        self.assertIsNone(job.error)
+        firsts = [item['first'] for item in json.loads(job.result)]
+        self.assertEqual(len(firsts), job.total_chunks)
+        self.assertEqual(firsts, sorted(firsts))
+
+    def test_resume_rejects_active_and_unknown_jobs(self):
+        job = jobs.enqueue_job(dialogue(5), 'labeling', self.dimension_ids('labeling')[:2])
+        self.assertEqual(self.client.post(f'/resume-job/{job.key}/').status_code, 400)
+        self.assertEqual(self.client.post('/resume-job/missing/').status_code, 404)
+
+    def test_processor_without_job_retries_in_memory(self):
+        result = TextProcessor(self.service, max_workers=2).process_content(
+            dialogue(30), 'labeling', self.dimension_ids('labeling')[:2], 'key-retry')
+        self.assertEqual(json.loads(result)[0], {'chunk': 1, 'error': '未获得AI响应'})
+        self.assertEqual(sum(first_turn(m) == '0' for m in self.service.calls), 3)
+
+
+@override_settings(NEAR_DUPLICATE_DETECTION={'ENABLED': False, 'MAX_DISTANCE': 0, 'NGRAM': 3},
+                   REQUEST_PACKING={'ENABLED': True, 'MAX_RECORDS': 10, 'MAX_RETRIES': 1})
+class RetryCacheTests(IsolatedTestCase):
+    def setUp(self):
+        super().setUp()
+        overrides = override_settings(LLM_RESPONSE_CACHE={**settings.LLM_RESPONSE_CACHE, 'ENABLED': True})
+        overrides.enable()
+        self.addCleanup(overrides.disable)
+        self.replies = ['模型输出了无法解析的文本']
+        self.service = FakeService(self.reply)
+        self.content = json.dumps([{'id': f'r{i}', 'text': f'第{i}条记录'} for i in range(3)], ensure_ascii=False)
+
+    def reply(self, messages):
+        if self.replies:
+            return self.replies.pop(0)
+        ids = [r['id'] for r in json.loads(user_content(messages))['records']]
+        return json.dumps([{'id': i, 'label': '好'} for i in ids])
+
+    def process(self):
+        return TextProcessor(self.service).process_content(
+            self.content, 'labeling', self.dimension_ids('labeling')[:2], 'key-cache')
+
+    def test_unparseable_reply_is_neither_cached_nor_reused_by_the_retry(self):
+        result = json.loads(self.process())
+        self.assertEqual([item['id'] for item in result], ['r0', 'r1', 'r2'])
+        self.assertEqual(len(self.service.calls), 2)
+
+        # 重试成功的响应不写入缓存，下次处理重新请求并缓存可解析的响应
+        self.process()
+        self.process()
+        self.assertEqual(len(self.service.calls), 3)
+
+    def test_missing_record_retries_skip_the_cache(self):
+        self.replies = [json.dumps([{'id': 'r0', 'label': '好'}, {'id': 'r1', 'label': '好'}])]
+        self.process()
+        result = json.loads(self.process())
+
+        self.assertEqual(len(self.service.calls), 3)  # 第二次处理命中整包响应，遗漏的记录仍重新请求
+        self.assertNotIn('error', result[2])
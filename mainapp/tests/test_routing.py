@@ -0,0 +1,158 @@
+from unittest import mock
+from django.test import override_settings
+from mainapp import ai_services, routing
+from mainapp.models import APIConfig
+from mainapp.provider_stats import record_call
+from mainapp.routing import AsyncProviderRouter, Provider, ProviderRouter, create_routed_service, effective_weights
+from .helpers import AsyncFakeService, FakeService, IsolatedTestCase
+
+
+def provider(config_id: int, service=None, weight: int = 1) -> Provider:
+    return Provider(config_id, f"openai#{config_id}", weight, f"key-{config_id}", service or FakeService())
+
+
+def record(config_id: int, latency: float, count: int, ok: bool = True, status_code=None) -> None:
+    for _ in range(count):
+        record_call(f"key-{config_id}", latency, ok, status_code)
+
+
+class FailingStream(FakeService):
+    def __init__(self, after: int = 0):
+        super().__init__()
+        self.after = after
+
+    def stream_chat_completion(self, messages, task_type='chat'):
+        for i in range(self.after):
+            yield f"片段{i}"
+        raise RuntimeError('stream failed')
+
+
+@override_settings(REQUEST_HEDGING={'ENABLED': False, 'TASK_TYPES': (), 'PERCENTILE': 95, 'MIN_SAMPLES': 20,
+                                    'MIN_DELAY': 2, 'MAX_EXTRA_RATIO': 0.05, 'BURST': 5})
+class ProviderRoutingTests(IsolatedTestCase):
+    def setUp(self):
+        super().setUp()
+        # 按列表顺序选择，便于断言故障转移顺序
+        patcher = mock.patch.object(routing.random, 'uniform', return_value=0)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_configured_weights_are_used_until_enough_samples(self):
+        record(1, 5.0, 3, ok=False)
+        self.assertEqual(effective_weights([provider(1, weight=3), provider(2, weight=1)]), {1: 3.0, 2: 1.0})
+
+    def test_weights_follow_health_and_latency(self):
+        record(1, 1.0, 10)
+        record(2, 2.0, 8)
+        record(2, 0.1, 2, ok=False, status_code=429)
+        weights = effective_weights([provider(1), provider(2)])
+        self.assertAlmostEqual(weights[1], 1.0)
+        self.assertAlmostEqual(weights[2], 0.8 * 0.5)
+
+    def test_slow_providers_keep_a_minimum_share_and_failing_ones_are_ejected(self):
+        record(1, 0.1, 10)
+        record(2, 100.0, 10)
+        record(3, 1.0, 10, ok=False)
+        weights = effective_weights([provider(1, weight=2), provider(2, weight=2), provider(3)])
+        self.assertAlmostEqual(weights[2], 2 * 0.05)
+        self.assertEqual(weights[3], 0.0)
+
+    def test_failed_requests_fail_over_to_the_next_provider(self):
+        services = [FakeService(lambda m: None), FakeService(lambda m: None), FakeService(), FakeService()]
+        router = ProviderRouter([provider(i, s) for i, s in enumerate(services, 1)])
+
+        self.assertEqual(router.chat_completion([{'role': 'user', 'content': '你好'}]), '{"output": "ok"}')
+        self.assertEqual([len(s.calls) for s in services], [1, 1, 1, 0])
+
+    @override_settings(PROVIDER_ROUTING={'ENABLED': True, 'WINDOW_SIZE': 200, 'WINDOW_SECONDS': 300,
+                                         'MIN_SAMPLES': 10, 'EJECT_ERROR_RATE': 0.5, 'EJECT_SECONDS': 30,
+                                         'MIN_WEIGHT_RATIO': 0.05, 'MAX_FAILOVER': 1})
+    def test_failover_is_bounded(self):
+        services = [FakeService(lambda m: None) for _ in range(3)]
+        router = ProviderRouter([provider(i, s) for i, s in enumerate(services, 1)])
+
+        self.assertIsNone(router.chat_completion([{'role': 'user', 'content': '你好'}]))
+        self.assertEqual([len(s.calls) for s in services], [1, 1, 0])
+
+    def test_ejected_providers_are_skipped(self):
+        record(1, 1.0, 10, ok=False)
+        services = [FakeService(), FakeService()]
+        ProviderRouter([provider(1, services[0]), provider(2, services[1])]).chat_completion(
+            [{'role': 'user', 'content': '你好'}])
+        self.assertEqual([len(s.calls) for s in services], [0, 1])
+
+    def test_streams_switch_provider_only_before_the_first_delta(self):
+        fallback = FakeService(lambda m: '你好世界')
+        router = ProviderRouter([provider(1, FailingStream()), provider(2, fallback)])
+        self.assertEqual(''.join(router.stream_chat_completion([{'role': 'user', 'content': '你好'}])), '你好世界')
+
+        router = ProviderRouter([provider(1, FailingStream(after=1)), provider(2, fallback)])
+        stream = router.stream_chat_completion([{'role': 'user', 'content': '你好'}])
+        self.assertEqual(next(stream), '片段0')
+        with self.assertRaises(RuntimeError):
+            next(stream)
+
+    def test_router_uses_the_narrowest_budget_and_combined_concurrency(self):
+        small = FakeService()
+        small.max_tokens = 1000
+        with override_settings(AI_SERVICE_CONCURRENCY={'openai': 3}):
+            router = ProviderRouter([provider(1, small), provider(2)])
+        self.assertEqual(router.max_tokens, 1000)
+        self.assertEqual(router.concurrency, 6)
+
+    async def test_async_router_fails_over(self):
+        services = [AsyncFakeService(lambda m: None), AsyncFakeService()]
+        router = AsyncProviderRouter([provider(i, s) for i, s in enumerate(services, 1)])
+        self.assertEqual(await router.chat_completion([{'role': 'user', 'content': '你好'}]), '{"output": "ok"}')
+        self.assertEqual([len(s.calls) for s in services], [1, 1])
+
+
+class RoutedServiceTests(IsolatedTestCase):
+    def setUp(self):
+        super().setUp()
+        patcher = mock.patch.object(ai_services, '_build_ai_service',
+                                    side_effect=lambda service_type, api_key, base_url=None: FakeService(api_key=api_key))
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.primary = APIConfig.objects.create(service_type='openai', api_key='key-a', weight=3)
+
+    def test_single_config_uses_the_service_directly(self):
+        service = create_routed_service(routing.routed_configs(self.primary))
+        self.assertIsInstance(service, FakeService)
+
+    def test_other_active_configs_join_the_router(self):
+        APIConfig.objects.create(service_type='openai', api_key='key-b')
+        APIConfig.objects.create(service_type='openai', api_key='key-c', is_active=False)
+
+        router = create_routed_service(routing.routed_configs(self.primary))
+        self.assertIsInstance(router, ProviderRouter)
+        self.assertEqual([(p.service.api_key, p.weight) for p in router.providers], [('key-a', 3), ('key-b', 1)])
+
+        with override_settings(PROVIDER_ROUTING={**routing.settings.PROVIDER_ROUTING, 'ENABLED': False}):
+            self.assertEqual(routing.routed_configs(self.primary), [self.primary])
+
+    def test_stats_view_reports_each_active_config(self):
+        record_call(routing.RateLimiter.make_key('openai', 'key-a'), 0.5, True)
+        data = self.client.get('/api/providers/stats/').json()
+        self.assertEqual(len(data['providers']), 1)
+        self.assertEqual(data['providers'][0]['weight'], 3)
+        self.assertEqual(data['providers'][0]['count'], 1)
+        self.assertIn('hedged', data['hedging'])
+
+    def test_saving_a_config_only_updates_the_matching_provider(self):
+        APIConfig.objects.create(service_type='zhipu', api_key='key-z', weight=2)
+
+        def save(service_type, api_key, base_url=None):
+            return self.client.post('/set-api-config/', {'service_type': service_type, 'api_key': api_key,
+                                                         'base_url': base_url}, content_type='application/json')
+
+        self.assertEqual(save('openai', 'key-a2').status_code, 200)
+        self.assertEqual(save('openai', 'key-proxy', 'https://proxy.example.com/v1').status_code, 200)
+        self.assertEqual(save('zhipu', 'key-z2', 'ignored').status_code, 200)
+
+        configs = {(c.service_type, c.base_url): (c.api_key, c.weight) for c in APIConfig.objects.all()}
+        self.assertEqual(configs, {
+            ('openai', None): ('key-a2', 3),
+            ('openai', 'https://proxy.example.com/v1'): ('key-proxy', 1),
+            ('zhipu', None): ('key-z2', 2),
+        })
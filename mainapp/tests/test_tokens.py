@@ -0,0 +1,72 @@
+from unittest import mock
+from django.test import SimpleTestCase
+from mainapp import tokens
+from mainapp.tokens import (MESSAGE_OVERHEAD, REPLY_OVERHEAD, MessageTokenCounter, count_text_tokens,
+                            count_text_tokens_batch, get_token_counter)
+from mainapp.utils import count_tokens, truncate_messages
+
+
+def history(turns: int):
+    messages = [{'role': 'system', 'content': '你是一名心理咨询师'}]
+    for i in range(turns):
+        messages.append({'role': 'user', 'content': f'第{i}个问题，最近压力很大'})
+        messages.append({'role': 'assistant', 'content': f'第{i}个回答，能具体说说吗'})
+    return messages
+
+
+class TokenCountTests(SimpleTestCase):
+    def test_batch_matches_single_counts(self):
+        texts = ['你好', 'hello world', '', '来访者：我最近睡不好。' * 10]
+        self.assertEqual(count_text_tokens_batch(texts), [count_text_tokens(t) for t in texts])
+
+    def test_message_count_includes_overheads(self):
+        message = {'role': 'user', 'content': '你好'}
+        expected = MESSAGE_OVERHEAD + count_text_tokens('user') + count_text_tokens('你好')
+        self.assertEqual(MessageTokenCounter().count_message(message), expected)
+        self.assertEqual(MessageTokenCounter().count_messages([message, message]), expected * 2 + REPLY_OVERHEAD)
+
+    def test_repeated_messages_are_encoded_once(self):
+        counter = MessageTokenCounter()
+        messages = history(5)
+        counter.count_messages(messages)
+
+        with mock.patch.object(tokens, 'count_text_tokens_batch', wraps=count_text_tokens_batch) as batch:
+            counter.count_messages(messages + [{'role': 'user', 'content': '新的问题'}])
+        batch.assert_called_once()
+        self.assertEqual(sorted(batch.call_args.args[0]), sorted(['user', '新的问题']))
+
+    def test_memo_is_bounded(self):
+        counter = MessageTokenCounter(max_entries=3)
+        counter.count_each(history(5))
+        self.assertEqual(len(counter._memo), 3)
+
+    def test_shared_counter_per_model(self):
+        self.assertIs(get_token_counter('gpt-4'), get_token_counter('gpt-4'))
+        self.assertIsNot(get_token_counter('gpt-4'), get_token_counter('gpt-3.5-turbo'))
+
+
+class TruncateTests(SimpleTestCase):
+    def test_keeps_system_message_and_most_recent_messages_within_budget(self):
+        counter = MessageTokenCounter()
+        messages = history(20)
+        budget = counter.count_messages(messages[:1] + messages[-6:])
+
+        kept = counter.truncate(messages, budget)
+        self.assertEqual(kept, messages[:1] + messages[-6:])
+        self.assertLessEqual(counter.count_messages(kept), budget)
+        self.assertEqual(counter.truncate(messages, budget - 1), messages[:1] + messages[-5:])
+
+    def test_everything_fits(self):
+        messages = history(3)
+        self.assertEqual(MessageTokenCounter().truncate(messages, 10000), messages)
+
+    def test_budget_smaller_than_system_message(self):
+        self.assertEqual(MessageTokenCounter().truncate(history(3), 1), [])
+
+    def test_utils_helpers_use_the_shared_counter(self):
+        messages = history(20)
+        self.assertEqual(count_tokens(messages), get_token_counter().count_messages(messages))
+        budget = count_tokens(messages[:1] + messages[-4:])
+        truncated = truncate_messages(messages, budget)
+        self.assertIs(truncated, messages)
+        self.assertEqual(len(messages), 5)
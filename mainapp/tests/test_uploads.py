@@ -0,0 +1,97 @@
+import io
+import json
+import os
+from django.core.files.uploadedfile import SimpleUploadedFile
+from datetime import timedelta
+from django.core.management import call_command
+from django.test import override_settings
+from django.utils import timezone
+from mainapp.models import APIConfig, ProcessingJob, UploadedFile
+from mainapp.uploads import CharsetDetector, cleanup_uploads, read_upload
+from .helpers import IsolatedTestCase
+
+
+class CharsetDetectorTests(IsolatedTestCase):
+    def detect(self, data: bytes, piece: int = 3):
+        detector = CharsetDetector(preview_chars=5)
+        for i in range(0, len(data), piece):
+            detector.feed(data[i:i + piece])
+        return detector, detector.finish()
+
+    def test_utf8_split_across_chunks(self):
+        detector, encoding = self.detect('来访者：你好，最近怎么样'.encode('utf-8'))
+        self.assertEqual(encoding, 'utf-8-sig')
+        self.assertEqual(detector.preview(encoding), '来访者：你')
+
+    def test_gbk_falls_back_to_gb18030(self):
+        _, encoding = self.detect('来访者：你好'.encode('gbk'))
+        self.assertEqual(encoding, 'gb18030')
+
+
+@override_settings(UPLOAD_PREVIEW_CHARS=20)
+class UploadViewTests(IsolatedTestCase):
+    def upload(self, name: str, data: bytes):
+        return self.client.post('/upload-file/', {'file': SimpleUploadedFile(name, data)})
+
+    def test_upload_is_saved_with_a_bounded_preview(self):
+        text = '来访者：我最近睡不好。\n' * 100
+        response = self.upload('对话.txt', text.encode('utf-8'))
+
+        data = response.json()
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(data['preview']), 20)
+        self.assertTrue(data['truncated'])
+        upload = UploadedFile.objects.get(file_id=data['file_id'])
+        self.assertTrue(os.path.exists(upload.path))
+        self.assertEqual(read_upload(upload), text)
+
+    def test_gbk_upload_is_decoded(self):
+        response = self.upload('对话.txt', '来访者：你好'.encode('gbk'))
+        self.assertIn('GBK', response.json()['message'])
+        self.assertFalse(response.json()['truncated'])
+        self.assertEqual(read_upload(UploadedFile.objects.get()), '来访者：你好')
+
+    def test_json_upload_is_checked_from_the_preview_only(self):
+        records = json.dumps([{'id': i, 'text': '内容' * 50} for i in range(100)], ensure_ascii=False)
+        self.assertEqual(self.upload('data.json', records.encode('utf-8')).json()['message'], '文件上传成功')
+
+        invalid = self.upload('data.json', '这不是JSON'.encode('utf-8')).json()
+        self.assertIn('JSON格式无效', invalid['message'])
+        self.assertIn('file_id', invalid)
+
+    def test_unsupported_extension_and_encoding_are_rejected(self):
+        self.assertEqual(self.upload('a.exe', b'data').status_code, 400)
+        self.assertEqual(self.upload('a.txt', b'\xff\xfe\x00\xd8\x81').status_code, 400)
+        self.assertFalse(UploadedFile.objects.exists())
+
+    def test_process_file_by_file_id_uses_the_full_upload(self):
+        APIConfig.objects.create(service_type='openai', api_key='test-key')
+        file_id = self.upload('对话.txt', ('来访者：你好\n' * 50).encode('utf-8')).json()['file_id']
+
+        response = self.client.post('/process-file/', json.dumps({
+            'file_id': file_id, 'process_type': 'labeling', 'dimensions': self.dimension_ids('labeling')[:1]
+        }), content_type='application/json')
+
+        job = ProcessingJob.objects.get(key=response.json()['processing_key'])
+        self.assertEqual(job.upload.file_id, file_id)
+        self.assertEqual(job.content, '')
+
+    def test_expired_uploads_are_removed_unless_a_job_still_needs_them(self):
+        file_ids = [self.upload(f'{name}.txt', '来访者：你好'.encode('utf-8')).json()['file_id']
+                    for name in ('旧', '排队', '完成', '新')]
+        uploads = [UploadedFile.objects.get(file_id=file_id) for file_id in file_ids]
+        UploadedFile.objects.filter(pk__in=[u.pk for u in uploads[:3]]).update(
+            created_at=timezone.now() - timedelta(days=8))
+        ProcessingJob.objects.create(key='job-queued', process_type='labeling', upload=uploads[1])
+        done = ProcessingJob.objects.create(key='job-done', process_type='labeling', upload=uploads[2],
+                                            status='completed')
+
+        self.assertEqual(cleanup_uploads(7), 2)
+        self.assertEqual(list(UploadedFile.objects.order_by('pk').values_list('filename', flat=True)),
+                         ['排队.txt', '新.txt'])
+        self.assertEqual([os.path.exists(u.path) for u in uploads], [False, True, False, True])
+        done.refresh_from_db()
+        self.assertIsNone(done.upload)
+
+        call_command('cleanup_uploads', days=0, stdout=io.StringIO())
+        self.assertEqual(list(UploadedFile.objects.values_list('filename', flat=True)), ['排队.txt'])
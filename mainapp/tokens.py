@@ -0,0 +1,138 @@
+import logging
+import re
+import threading
+from collections import OrderedDict
+from functools import lru_cache
+from typing import List, Dict, Optional
+import tiktoken
+
+logger = logging.getLogger(__name__)
+
+# 无法加载 tiktoken 编码（例如离线环境）时按字符估算
+_CJK_PATTERN = re.compile(r'[\u3000-\u303f\u3400-\u9fff\uf900-\ufaff\uff00-\uffef]')
+
+MESSAGE_OVERHEAD = 4  # 每条消息的基础token
+REPLY_OVERHEAD = 2  # 对话的开始和结束token
+
+
+@lru_cache(maxsize=None)
+def get_encoding(model: str = "gpt-4") -> Optional[tiktoken.Encoding]:
+    """加载并缓存 tiktoken 编码，加载失败时返回 None"""
+    try:
+        try:
+            return tiktoken.encoding_for_model(model)
+        except KeyError:
+            return tiktoken.get_encoding("cl100k_base")
+    except Exception as e:
+        logger.warning(f"加载 tiktoken 编码失败，改为估算 token 数: {str(e)}")
+        return None
+
+
+def estimate_tokens(text: str) -> int:
+    """粗略估算 token 数：中文字符按 1 个，其余字符按 4 个字符 1 个"""
+    cjk = len(_CJK_PATTERN.findall(text))
+    return cjk + (len(text) - cjk + 3) // 4
+
+
+def count_text_tokens(text: str, model: str = "gpt-4") -> int:
+    """计算单段文本的 token 数"""
+    if not text:
+        return 0
+    encoding = get_encoding(model)
+    if encoding is None:
+        return estimate_tokens(text)
+    return len(encoding.encode_ordinary(text))
+
+
+def count_text_tokens_batch(texts: List[str], model: str = "gpt-4") -> List[int]:
+    """批量计算文本的 token 数，tiktoken 内部用线程池并行编码"""
+    encoding = get_encoding(model)
+    if encoding is None:
+        return [estimate_tokens(text) for text in texts]
+    return [len(tokens) for tokens in encoding.encode_ordinary_batch(texts)]
+
+
+class MessageTokenCounter:
+    """
+    带缓存的消息 token 计数
+    对话历史在每轮请求中都会重复出现，按 (role, content, name) 缓存每条消息的 token 数，只编码新消息
+    """
+
+    def __init__(self, model: str = "gpt-4", max_entries: int = 10000):
+        self.model = model
+        self.max_entries = max_entries
+        self._memo = OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _key(message: Dict) -> tuple:
+        return tuple(sorted((k, str(v)) for k, v in message.items()))
+
+    def count_message(self, message: Dict) -> int:
+        """单条消息的 token 数（含消息开销）"""
+        return self.count_each([message])[0]
+
+    def count_each(self, messages: List[Dict]) -> List[int]:
+        """逐条返回消息的 token 数，未缓存的消息合并为一次批量编码"""
+        keys = [self._key(m) for m in messages]
+        counts = [None] * len(messages)
+        with self._lock:
+            for i, key in enumerate(keys):
+                if key in self._memo:
+                    self._memo.move_to_end(key)
+                    counts[i] = self._memo[key]
+
+        missing = [i for i, c in enumerate(counts) if c is None]
+        if missing:
+            values = [v for i in missing for _, v in keys[i]]
+            encoded = iter(count_text_tokens_batch(values, self.model))
+            with self._lock:
+                for i in missing:
+                    count = MESSAGE_OVERHEAD
+                    for name, _ in keys[i]:
+                        count += next(encoded)
+                        if name == "name":  # 如果消息中包含name字段
+                            count -= 1  # role是必需的，所以减去1个token
+                    counts[i] = count
+                    self._memo[keys[i]] = count
+                while len(self._memo) > self.max_entries:
+                    self._memo.popitem(last=False)
+        return counts
+
+    def count_messages(self, messages: List[Dict]) -> int:
+        """整个消息列表的 token 数"""
+        return sum(self.count_each(messages)) + REPLY_OVERHEAD
+
+    def truncate(self, messages: List[Dict], max_tokens: int) -> List[Dict]:
+        """
+        截断消息历史，保留开头的系统消息和尽可能多的最近消息
+        每条消息只计数一次，用后缀和一遍找出保留的起点
+        """
+        if not messages:
+            return []
+        counts = self.count_each(messages)
+        head = 1 if messages[0].get("role") == "system" else 0
+        budget = max_tokens - REPLY_OVERHEAD - sum(counts[:head])
+        if budget < 0:
+            return []
+
+        start = len(messages)
+        used = 0
+        # 从最新的消息向前累加，直到超出预算
+        while start > head and used + counts[start - 1] <= budget:
+            start -= 1
+            used += counts[start]
+        return messages[:head] + messages[start:]
+
+
+_counters = {}
+_counters_lock = threading.Lock()
+
+
+def get_token_counter(model: str = "gpt-4") -> MessageTokenCounter:
+    """获取指定模型的共享计数器"""
+    counter = _counters.get(model)
+    if counter is None:
+        with _counters_lock:
+            counter = _counters.setdefault(model, MessageTokenCounter(model))
+    return counter
@@ -0,0 +1,126 @@
+import codecs
+import logging
+import os
+import uuid
+from datetime import timedelta
+from typing import Optional, TextIO, Tuple
+from django.conf import settings
+from django.utils import timezone
+from .models import UploadedFile
+
+logger = logging.getLogger(__name__)
+
+
+class CharsetDetector:
+    """
+    单遍增量字符集检测
+    每个候选编码各用一个增量解码器解码同一份数据，出错即淘汰，最后按优先级取第一个存活的编码
+    """
+
+    CANDIDATES = ('utf-8-sig', 'gb18030')
+
+    def __init__(self, preview_chars: int = 2000):
+        self.preview_chars = preview_chars
+        self.decoders = {name: codecs.getincrementaldecoder(name)() for name in self.CANDIDATES}
+        self.previews = {name: [] for name in self.CANDIDATES}
+        self.preview_lengths = {name: 0 for name in self.CANDIDATES}
+
+    def feed(self, data: bytes, final: bool = False) -> None:
+        for name in list(self.decoders):
+            try:
+                text = self.decoders[name].decode(data, final=final)
+            except UnicodeDecodeError:
+                del self.decoders[name]
+                continue
+            # 只保留预览所需的前若干字符
+            if text and self.preview_lengths[name] < self.preview_chars:
+                self.previews[name].append(text)
+                self.preview_lengths[name] += len(text)
+
+    def finish(self) -> Optional[str]:
+        """结束检测，返回识别出的编码，全部失败时返回 None"""
+        self.feed(b'', final=True)
+        for name in self.CANDIDATES:
+            if name in self.decoders:
+                return name
+        return None
+
+    def preview(self, encoding: str) -> str:
+        return ''.join(self.previews[encoding])[:self.preview_chars]
+
+
+def save_upload(uploaded) -> Tuple[UploadedFile, str]:
+    """
+    将上传文件流式写入磁盘，同时检测编码
+    :param uploaded: request.FILES 中的文件对象
+    :return: (UploadedFile 记录, 内容预览)
+    """
+    upload_dir = os.path.join(settings.MEDIA_ROOT, 'uploads')
+    os.makedirs(upload_dir, exist_ok=True)
+
+    file_id = uuid.uuid4().hex
+    ext = os.path.splitext(uploaded.name)[1].lower()
+    path = os.path.join(upload_dir, f"{file_id}{ext}")
+
+    detector = CharsetDetector(settings.UPLOAD_PREVIEW_CHARS)
+    size = 0
+    with open(path, 'wb') as destination:
+        for chunk in uploaded.chunks():
+            destination.write(chunk)
+            detector.feed(chunk)
+            size += len(chunk)
+
+    encoding = detector.finish()
+    if not encoding:
+        os.remove(path)
+        raise ValueError('不支持的文件编码，请使用UTF-8或GBK编码')
+
+    upload = UploadedFile.objects.create(
+        file_id=file_id,
+        filename=uploaded.name,
+        path=path,
+        encoding=encoding,
+        size=size
+    )
+    logger.info(f"文件已保存: {uploaded.name} -> {file_id}, 编码 {encoding}, 大小 {size} 字节")
+    return upload, detector.preview(encoding)
+
+
+def open_upload(upload: UploadedFile) -> TextIO:
+    """以检测到的编码打开上传文件"""
+    return open(upload.path, 'r', encoding=upload.encoding, newline='')
+
+
+def read_upload(upload: UploadedFile) -> str:
+    """读取上传文件的完整文本"""
+    with open_upload(upload) as f:
+        return f.read()
+
+
+def cleanup_uploads(retention_days: Optional[int] = None) -> int:
+    """
+    删除超过保留期的上传文件（磁盘文件和记录）
+    排队、运行或等待批处理结果的任务仍需读取文件，这些文件保留到任务结束后再删除
+    数据集导入后记录已保存在数据库中，删除来源文件不影响数据集
+    :return: 删除的文件数
+    """
+    if retention_days is None:
+        retention_days = settings.UPLOAD_RETENTION_DAYS
+    cutoff = timezone.now() - timedelta(days=retention_days)
+    expired = UploadedFile.objects.filter(created_at__lt=cutoff).exclude(
+        jobs__status__in=('queued', 'running', 'waiting')
+    ).distinct()
+    removed = 0
+    for upload in expired:
+        try:
+            os.remove(upload.path)
+        except FileNotFoundError:
+            pass
+        except OSError as e:
+            logger.warning(f"删除上传文件失败: {upload.path}, {str(e)}")
+            continue
+        upload.delete()
+        removed += 1
+    if removed:
+        logger.info(f"已删除 {removed} 个过期上传文件")
+    return removed
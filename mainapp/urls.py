@@ -8,16 +8,30 @@ urlpatterns = [
     path('check-processing-status/<str:processing_key>/', 
          views.check_processing_status, 
          name='check_processing_status'),
+    path('processing-events/<str:processing_key>/', 
+         views.processing_events, 
+         name='processing_events'),
+    path('resume-job/<str:processing_key>/', views.resume_processing_job, name='resume_processing_job'),
     path('upload-file/', views.upload_file, name='upload_file'),
     path('process-file/', views.process_file, name='process_file'),
-    path('export-processed-data/', views.export_processed_data, name='export_processed_data'),
+    path('async/process-file/', views.async_process_file, name='async_process_file'),
+    path('api/response-cache/stats/', views.response_cache_stats, name='response_cache_stats'),
+    path('api/providers/stats/', views.provider_stats, name='provider_stats'),
+    path('export-processed-data/<str:processing_key>/', views.export_processed_data, name='export_processed_data'),
+    # 数据集
+    path('api/datasets/', views.create_dataset, name='create_dataset'),
+    path('api/datasets/<int:dataset_id>/', views.dataset_status, name='dataset_status'),
+    path('api/datasets/<int:dataset_id>/export/', views.export_dataset_results, name='export_dataset_results'),
     # 保存API配置
     path('set-api-config/', views.save_api_config, name='save_api_config'),
     path('get-api-config/', views.get_api_config, name='get_api_config'),
     # 聊天
     path('chat/', views.chat, name='chat'),
+    path('async/chat/', views.async_chat, name='async_chat'),
     path('clear-chat-history/', views.clear_chat_history, name='clear_chat_history'),
     path('export-chat-history/', views.export_chat_history, name='export_chat_history'),
+    path('api/chat/sessions/', views.list_chat_sessions, name='list_chat_sessions'),
+    path('api/chat/sessions/<str:session_id>/messages/', views.list_chat_messages, name='list_chat_messages'),
     # API endpoints for dimensions
     path('api/dimensions/', views.get_dimensions, name='get_dimensions'),
     path('api/dimensions/add/', views.add_dimension, name='add_dimension'),
@@ -1,36 +1,45 @@
 import json
 import logging
-import os
-import tiktoken
 import traceback
 from django.conf import settings
-from django.http import JsonResponse, HttpResponse
+from django.http import JsonResponse, HttpResponse, StreamingHttpResponse
 from django.shortcuts import render
 from django.views.decorators.csrf import csrf_exempt
 from django.views.decorators.http import require_POST,require_GET,require_http_methods
 from .ai_services import AIServiceFactory, AIServiceBase, create_ai_service
-from .utils import count_tokens, truncate_messages
+from .tokens import count_text_tokens, count_text_tokens_batch
 import time
-from datetime import datetime
-from .models import APIConfig, ChatMessage, SystemPrompt, CleaningDimension, LabelingDimension
-from .services import ChatService
+from datetime import datetime, timedelta, timezone as dt_timezone
+from django.db.models import Q
+from typing import Optional
+from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
+from .models import APIConfig, ChatMessage, ChatSession, SystemPrompt, CleaningDimension, LabelingDimension, UploadedFile, ProcessingJob, Dataset
+from .services import ChatService, AsyncChatService, is_probe_message
 from .exceptions import AIWebException
 from django.views.decorators.http import require_http_methods
 from cryptography.fernet import Fernet
 from django.views.decorators.csrf import ensure_csrf_cookie
 from django.core.cache import cache  # 添加这个导入
-import uuid
+from asgiref.sync import sync_to_async
 from .data_services import TextProcessor
+from .response_cache import get_response_cache
+from . import config_cache
+from .uploads import save_upload, read_upload
+from .batch import supports_batch
+from .exports import EXPORT_FORMATS, iter_job_export, chat_export_queryset, iter_chat_ndjson, gzip_stream, iter_dataset_ndjson
+from .datasets import create_dataset as create_dataset_records, import_records, dataset_status as get_dataset_status, dimensions_key
+from .jobs import enqueue_job, get_job_state, new_processing_key, iter_job_events, resume_job
+from .routing import create_routed_service, routed_configs, provider_status
+from .hedging import get_hedge_budget
 
 
 logger = logging.getLogger(__name__)
 
 
 # 使用tiktoken计算token数量
-def num_tokens_from_string(string: str, encoding_name: str = "cl100k_base") -> int:
-    encoding = tiktoken.get_encoding(encoding_name)
-    num_tokens = len(encoding.encode(string))
-    return num_tokens
+def num_tokens_from_string(string: str, model: str = "gpt-4") -> int:
+    return count_text_tokens(string, model)
 
 
 @ensure_csrf_cookie
@@ -38,21 +47,9 @@ def index(request):
     """主页视图"""
     try:
         # 分别获取清洗和标注维度
-        cleaning_dimensions = list(CleaningDimension.objects.all().order_by('order').values(
-            'id', 
-            'name', 
-            'description', 
-            'is_default', 
-            'order'
-        ))
-        
-        labeling_dimensions = list(LabelingDimension.objects.all().order_by('order').values(
-            'id', 
-            'name', 
-            'description', 
-            'is_default', 
-            'order'
-        ))
+        catalog = config_cache.get_dimension_catalog()
+        cleaning_dimensions = catalog['cleaning']
+        labeling_dimensions = catalog['labeling']
         
         context = {
             'cleaning_dimensions': json.dumps(cleaning_dimensions),
@@ -69,54 +66,90 @@ def index(request):
         })
 
 
-def handle_uploaded_file(f):
-    upload_dir = os.path.join(settings.MEDIA_ROOT, 'uploads')
-    os.makedirs(upload_dir, exist_ok=True)
-    file_path = os.path.join(upload_dir, f.name)
-
-    with open(file_path, 'wb+') as destination:
-        for chunk in f.chunks():
-            destination.write(chunk)
-
-    return file_path
-
-
 @csrf_exempt
 @require_POST
 def process_file(request):
-    """处理文件内容"""
+    """创建文件处理任务，由 run_workers 在后台执行"""
     try:
         logger.info("收到文件处理请求")
         data = json.loads(request.body)
         content = data.get('content', '')
+        file_id = data.get('file_id')
         process_type = data.get('process_type', '')
         dimension_ids = data.get('dimensions', [])
-        
-        if not content or not process_type or not dimension_ids:
+        execution_mode = data.get('execution_mode', 'realtime')
+        dataset_id = data.get('dataset_id')
+        
+        # 优先使用已上传的文件，避免大文件随请求体回传
+        upload = UploadedFile.objects.filter(file_id=file_id).first() if file_id else None
+        if file_id and not upload:
+            raise ValueError("上传文件不存在")
+        dataset = Dataset.objects.filter(pk=dataset_id).first() if dataset_id else None
+        if dataset_id and not dataset:
+            raise ValueError("数据集不存在")
+        
+        if not (content or upload or dataset) or not process_type or not dimension_ids:
             raise ValueError("缺少必要参数")
             
         logger.info(f"处理类型: {process_type}")
         logger.info(f"选择的维度IDs: {dimension_ids}")
         
-        # 生成处理标识
-        processing_key = f"process_{int(time.time())}_{uuid.uuid4().hex[:8]}"
+        api_config = config_cache.get_api_config()
+        if not api_config:
+            raise ValueError("未找到API配置")
+        if execution_mode not in ('realtime', 'batch'):
+            raise ValueError(f"不支持的执行方式: {execution_mode}")
+        if execution_mode == 'batch' and not supports_batch(api_config.service_type):
+            raise ValueError(f"{api_config.service_type} 不支持批处理接口")
+        if execution_mode == 'batch' and dataset:
+            raise ValueError("数据集任务只支持实时处理")
+        
+        job = enqueue_job(content, process_type, dimension_ids, upload=upload,
+                          use_cache=data.get('use_cache', True), execution_mode=execution_mode,
+                          dataset=dataset)
+        return JsonResponse({
+            'processing_key': job.key,
+            'job_id': job.id,
+            'status': job.status
+        })
+            
+    except Exception as e:
+        logger.error(f"处理文件失败: {str(e)}")
+        return JsonResponse({'error': str(e)}, status=500)
+
+
+@csrf_exempt
+@require_POST
+async def async_process_file(request):
+    """处理文件内容（异步版本，需通过 aiweb/asgi.py 部署）"""
+    try:
+        data = json.loads(request.body)
+        content = data.get('content', '')
+        file_id = data.get('file_id')
+        process_type = data.get('process_type', '')
+        dimension_ids = data.get('dimensions', [])
+        
+        if file_id:
+            upload = await UploadedFile.objects.filter(file_id=file_id).afirst()
+            if not upload:
+                raise ValueError("上传文件不存在")
+            content = await sync_to_async(read_upload)(upload)
+        
+        if not content or not process_type or not dimension_ids:
+            raise ValueError("缺少必要参数")
+            
+        processing_key = new_processing_key()
         logger.info(f"开始异步处理: {processing_key}")
         
-        # 获取最新的API配置
-        api_config = APIConfig.objects.latest('updated_at')
+        api_config = await sync_to_async(config_cache.get_api_config)()
         if not api_config:
             raise ValueError("未找到API配置")
             
-        # 创建AI服务实例
-        service = create_ai_service(
-            api_config.service_type,
-            api_config.api_key,
-            api_config.base_url
-        )
+        configs = await sync_to_async(routed_configs)(api_config)
+        service = create_routed_service(configs, async_service=True)
         
-        # 创建文本处理器并处理
-        processor = TextProcessor(service)
-        result = processor.process_content(
+        processor = TextProcessor(service, use_cache=data.get('use_cache', True))
+        result = await processor.aprocess_content(
             content=content,
             process_type=process_type,
             dimensions=dimension_ids,
@@ -124,7 +157,7 @@ def process_file(request):
         )
         
         if result:
-            cache.set(processing_key, {
+            await cache.aset(processing_key, {
                 'status': 'completed',
                 'result': result,
                 'process_type': process_type,
@@ -135,15 +168,25 @@ def process_file(request):
             raise Exception("处理失败")
             
     except Exception as e:
-        logger.error(f"处理文件失败: {str(e)}")
+        logger.error(f"异步处理文件失败: {str(e)}")
         return JsonResponse({'error': str(e)}, status=500)
 
 
 @require_GET
 def check_processing_status(request, processing_key):
-    """检查处理状态"""
+    """
+    检查处理状态
+    查询参数 since 为上次返回的 cursor，传入时只返回之后新增的结果
+    """
+    since = request.GET.get('since')
+    if since and not since.isdecimal():
+        return JsonResponse({'error': 'since 必须是非负整数'}, status=400)
     try:
-        # 从缓存获取结果
+        # 后台任务以数据库中的状态为准
+        state = get_job_state(processing_key, since=int(since) if since else None)
+        if state:
+            return JsonResponse(state)
+        # 异步视图在进程内处理，结果在缓存中
         result = cache.get(processing_key)
         if result:
             return JsonResponse(result)
@@ -156,6 +199,54 @@ def check_processing_status(request, processing_key):
         }, status=500)
 
 
+@require_GET
+def response_cache_stats(request):
+    """LLM 响应缓存命中统计"""
+    response_cache = get_response_cache()
+    if not response_cache:
+        return JsonResponse({'enabled': False})
+    return JsonResponse({'enabled': True, **response_cache.stats()})
+
+
+@require_GET
+def provider_stats(request):
+    """各 API 配置的路由权重、最近请求的延迟和错误率统计，以及请求对冲的次数（本进程）"""
+    return JsonResponse({
+        'enabled': settings.PROVIDER_ROUTING['ENABLED'],
+        'providers': provider_status(),
+        'hedging': {'enabled': settings.REQUEST_HEDGING['ENABLED'], **get_hedge_budget().stats()}
+    })
+
+
+@require_GET
+def processing_events(request, processing_key):
+    """以 Server-Sent Events 推送处理进度，check_processing_status 作为轮询备用"""
+    job = ProcessingJob.objects.filter(key=processing_key).only('id').first()
+    if not job:
+        return JsonResponse({'error': '任务不存在'}, status=404)
+    
+    response = StreamingHttpResponse(iter_job_events(job.id), content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    response['X-Accel-Buffering'] = 'no'  # 关闭 nginx 缓冲
+    return response
+
+
+@csrf_exempt
+@require_POST
+def resume_processing_job(request, processing_key):
+    """重新运行已结束的任务，从检查点继续，只处理未完成或失败的块"""
+    job = ProcessingJob.objects.filter(key=processing_key).first()
+    if not job:
+        return JsonResponse({'error': '任务不存在'}, status=404)
+    if not resume_job(job):
+        return JsonResponse({'error': '任务仍在排队或运行中'}, status=400)
+    return JsonResponse({
+        'processing_key': job.key,
+        'job_id': job.id,
+        'status': job.status
+    })
+
+
 @csrf_exempt
 @require_POST
 def set_api_config(request):
@@ -196,6 +287,73 @@ def handle_api_errors(view_func):
     return wrapper
 
 
+def _ndjson(data: dict) -> str:
+    return json.dumps(data, ensure_ascii=False) + '\n'
+
+
+def stream_chat_reply(chunks, message: str, session_id: str, max_tokens: int,
+                      is_probe: bool = False):
+    """
+    将流式回复转为 NDJSON：{"delta": ...} 逐段输出，最后输出 {"done": true, ...}
+    回复完整生成后才保存 AI 消息
+    """
+    parts = []
+    try:
+        for delta in chunks:
+            parts.append(delta)
+            yield _ndjson({'delta': delta})
+    except Exception as e:
+        logger.error(f"流式回复失败: {str(e)}", exc_info=True)
+        yield _ndjson({'error': f'处理失败: {str(e)}'})
+        return
+    
+    reply = ''.join(parts)
+    if reply:
+        ChatMessage.objects.create(
+            role='assistant',
+            content=reply,
+            session_id=session_id,
+            status='success',
+            is_probe=is_probe
+        )
+    yield _ndjson({
+        'done': True,
+        'status': 'success',
+        'tokens_used': sum(count_text_tokens_batch([message, reply])),
+        'max_tokens': max_tokens
+    })
+
+
+async def astream_chat_reply(chunks, message: str, session_id: str, max_tokens: int,
+                             is_probe: bool = False):
+    """stream_chat_reply 的异步版本"""
+    parts = []
+    try:
+        async for delta in chunks:
+            parts.append(delta)
+            yield _ndjson({'delta': delta})
+    except Exception as e:
+        logger.error(f"异步流式回复失败: {str(e)}", exc_info=True)
+        yield _ndjson({'error': f'处理失败: {str(e)}'})
+        return
+    
+    reply = ''.join(parts)
+    if reply:
+        await ChatMessage.objects.acreate(
+            role='assistant',
+            content=reply,
+            session_id=session_id,
+            status='success',
+            is_probe=is_probe
+        )
+    yield _ndjson({
+        'done': True,
+        'status': 'success',
+        'tokens_used': sum(count_text_tokens_batch([message, reply])),
+        'max_tokens': max_tokens
+    })
+
+
 @csrf_exempt
 @require_POST
 @handle_api_errors
@@ -210,24 +368,39 @@ def chat(request):
             return JsonResponse({'error': '消息不能为空'}, status=400)
             
         # 获取最新的API配置
-        api_config = APIConfig.objects.order_by('-updated_at').first()
+        api_config = config_cache.get_api_config()
         if not api_config:
             return JsonResponse({'error': '请先配置API'}, status=400)
             
         chat_service = ChatService(api_config)
+        is_probe = bool(data.get('probe')) or is_probe_message(message)
         
-        # 保存用户消息
-        ChatMessage.objects.create(
+        # 保存用户消息，上下文只取这条消息之前的历史
+        user_message = ChatMessage.objects.create(
             role='user',
             content=message,
             session_id=session_id,
-            status='success'
+            status='success',
+            is_probe=is_probe
         )
         
+        if data.get('stream'):
+            chunks = chat_service.process_message(
+                message=message,
+                session_id=session_id,
+                stream=True,
+                before_id=user_message.id
+            )
+            return StreamingHttpResponse(
+                stream_chat_reply(chunks, message, session_id, chat_service.service.max_tokens, is_probe),
+                content_type='application/x-ndjson'
+            )
+        
         # 处理消息
         result = chat_service.process_message(
             message=message,
-            session_id=session_id
+            session_id=session_id,
+            before_id=user_message.id
         )
         
         # 保存并处理 AI 回复
@@ -238,7 +411,8 @@ def chat(request):
                 role='assistant',
                 content=processed_reply,
                 session_id=session_id,
-                status='success'
+                status='success',
+                is_probe=is_probe
             )
             
             result['reply'] = processed_reply
@@ -250,6 +424,71 @@ def chat(request):
         return JsonResponse({'error': f'处理失败: {str(e)}'}, status=500)
 
 
+@csrf_exempt
+@require_POST
+async def async_chat(request):
+    """处理聊天请求（异步版本，需通过 aiweb/asgi.py 部署）"""
+    try:
+        data = json.loads(request.body)
+        message = data.get('message')
+        session_id = data.get('session_id', 'default')
+        
+        if not message:
+            return JsonResponse({'error': '消息不能为空'}, status=400)
+            
+        api_config = await sync_to_async(config_cache.get_api_config)()
+        if not api_config:
+            return JsonResponse({'error': '请先配置API'}, status=400)
+            
+        chat_service = await AsyncChatService.create(api_config)
+        is_probe = bool(data.get('probe')) or is_probe_message(message)
+        
+        # 保存用户消息，上下文只取这条消息之前的历史
+        user_message = await ChatMessage.objects.acreate(
+            role='user',
+            content=message,
+            session_id=session_id,
+            status='success',
+            is_probe=is_probe
+        )
+        
+        if data.get('stream'):
+            chunks = await chat_service.process_message(
+                message=message,
+                session_id=session_id,
+                stream=True,
+                before_id=user_message.id
+            )
+            return StreamingHttpResponse(
+                astream_chat_reply(chunks, message, session_id, chat_service.service.max_tokens, is_probe),
+                content_type='application/x-ndjson'
+            )
+        
+        result = await chat_service.process_message(
+            message=message,
+            session_id=session_id,
+            before_id=user_message.id
+        )
+        
+        if result.get('reply'):
+            await ChatMessage.objects.acreate(
+                role='assistant',
+                content=result['reply'],
+                session_id=session_id,
+                status='success',
+                is_probe=is_probe
+            )
+
+        return JsonResponse(result)
+        
+    except AIWebException as e:
+        logger.error(f"业务错误: {str(e)}")
+        return JsonResponse({'error': str(e)}, status=400)
+    except Exception as e:
+        logger.error(f"异步处理聊天消息失败: {str(e)}", exc_info=True)
+        return JsonResponse({'error': f'处理失败: {str(e)}'}, status=500)
+
+
 @csrf_exempt
 def clear_chat_history(request):
     """清除聊天历史"""
@@ -259,34 +498,63 @@ def clear_chat_history(request):
     return JsonResponse({'error': '无效的请求方'}, status=405)
 
 
-@csrf_exempt
-@require_POST
+@require_http_methods(["GET", "POST"])
 def export_chat_history(request):
-    """导出聊天历史"""
+    """
+    流式导出聊天记录（NDJSON，可选 gzip 压缩）
+    筛选参数（GET 查询参数或 POST JSON）：session_ids、role、status、start、end、gzip
+    不指定 session_ids 时导出全部会话，只允许管理员（is_staff）调用
+    """
     try:
-        session_id = request.session.session_key
-        messages = ChatMessage.objects.filter(session_id=session_id).order_by('created_at')
-        
-        # 构建导数据
-        export_data = []
-        for msg in messages:
-            export_data.append({
-                'role': msg.role,
-                'content': msg.content,
-                'timestamp': msg.created_at.strftime('%Y-%m-%d %H:%M:%S')
-            })
-        
-        response = HttpResponse(
-            json.dumps(export_data, ensure_ascii=False, indent=2),
-            content_type='application/json'
+        params = request.GET.dict() if request.method == 'GET' else json.loads(request.body or '{}')
+        session_ids = params.get('session_ids') or []
+        if isinstance(session_ids, str):
+            session_ids = [s for s in session_ids.split(',') if s]
+        if not session_ids and not request.user.is_staff:
+            return JsonResponse({'error': '请指定要导出的 session_ids，导出全部会话需要管理员权限'}, status=403)
+        
+        start = _parse_export_time(params.get('start'))
+        end = _parse_export_time(params.get('end'))
+        use_gzip = str(params.get('gzip', '')).lower() in ('1', 'true')
+        
+        messages = chat_export_queryset(
+            session_ids=session_ids,
+            role=params.get('role'),
+            status=params.get('status'),
+            start=start,
+            end=end
         )
-        response['Content-Disposition'] = 'attachment; filename="chat_history.json"'
+        filename = f"chat_history_{datetime.now().strftime('%Y%m%d_%H%M%S')}.jsonl"
+        if use_gzip:
+            response = StreamingHttpResponse(gzip_stream(iter_chat_ndjson(messages)), content_type='application/gzip')
+            filename += '.gz'
+        else:
+            response = StreamingHttpResponse(iter_chat_ndjson(messages),
+                                             content_type='application/x-ndjson; charset=utf-8')
+        response['Content-Disposition'] = f'attachment; filename="{filename}"'
         return response
+    except ValueError as e:
+        return JsonResponse({'error': str(e)}, status=400)
     except Exception as e:
         logger.error(f"导出聊天历史错误: {str(e)}")
         return JsonResponse({'error': str(e)}, status=500)
 
 
+def _parse_export_time(value: Optional[str]) -> Optional[datetime]:
+    """解析 ISO 格式的日期或时间，未带时区时按当前时区处理"""
+    if not value:
+        return None
+    parsed = parse_datetime(value)
+    if parsed is None:
+        day = parse_date(value)
+        if day is None:
+            raise ValueError(f"无效的时间: {value}")
+        parsed = datetime(day.year, day.month, day.day)
+    if timezone.is_naive(parsed):
+        parsed = timezone.make_aware(parsed)
+    return parsed
+
+
 @require_POST
 def save_api_config(request):
     try:
@@ -298,22 +566,18 @@ def save_api_config(request):
         if not service_type or not api_key:
             return JsonResponse({'error': '缺少必要参数'}, status=400)
         
-        # 更新或创建 API 配置
-        config, created = APIConfig.objects.update_or_create(
-            defaults={
-                'service_type': service_type,
-                'api_key': api_key,
-                'base_url': base_url if service_type == 'openai' else None
-            }
-        )
+        # 按服务类型和 API 地址定位配置：同一服务只更新密钥，其他服务的配置（参与多服务路由）保持不变
+        base_url = (base_url or None) if service_type == 'openai' else None
+        config = APIConfig.objects.filter(service_type=service_type, base_url=base_url).order_by('-updated_at').first()
+        if config:
+            config.api_key = api_key
+            config.save(update_fields=['api_key', 'updated_at'])
+        else:
+            config = APIConfig.objects.create(service_type=service_type, api_key=api_key, base_url=base_url)
         
         # 验证 API key
         try:
-            service = AIServiceFactory.create_service(
-                service_type, 
-                api_key,
-                base_url if service_type == 'openai' else None
-            )
+            service = AIServiceFactory.create_service(service_type, api_key, base_url)
             
             if not service or not service.validate_api_key():
                 return JsonResponse({'error': 'API密钥验证失败'}, status=400)
@@ -328,7 +592,7 @@ def save_api_config(request):
 
 @require_POST
 def upload_file(request):
-    """处理文件上传"""
+    """处理文件上传：保存到服务端，返回 file_id 和内容预览"""
     try:
         if 'file' not in request.FILES:
             return JsonResponse({'error': '没有上传文件'}, status=400)
@@ -343,37 +607,27 @@ def upload_file(request):
             }, status=400)
         
         try:
-            content = file.read().decode('utf-8')
-            
-            # 如果是JSON文件，验证JSON格式
-            if file.name.lower().endswith('.json'):
-                try:
-                    json.loads(content)
-                except json.JSONDecodeError:
-                    # JSON格式无效时，仍然返回内容，只是给出警告
-                    return JsonResponse({
-                        'message': '文件上传成功（JSON格式无效，将作为普通文本处理）',
-                        'content': content,
-                        'filename': file.name
-                    })
-            
-            return JsonResponse({
-                'message': '文件上传成功',
-                'content': content,
-                'filename': file.name
-            })
-            
-        except UnicodeDecodeError:
-            # 尝试其他编码
-            try:
-                content = file.read().decode('gbk')
-                return JsonResponse({
-                    'message': '文件上传成功使用GBK编码）',
-                    'content': content,
-                    'filename': file.name
-                })
-            except:
-                return JsonResponse({'error': '不支持的文件编码，请使用UTF-8或GBK编码'}, status=400)
+            upload, preview = save_upload(file)
+        except ValueError as e:
+            return JsonResponse({'error': str(e)}, status=400)
+        
+        message = '文件上传成功'
+        if upload.encoding != 'utf-8-sig':
+            message = '文件上传成功（使用GBK编码）'
+        
+        # JSON文件只根据预览检查是否以对象或数组开头，不把整个文件读入内存；
+        # 完整解析在处理时由 split_records 完成，解析失败时按普通文本处理
+        if file.name.lower().endswith('.json') and not preview.lstrip('\ufeff \t\r\n').startswith(('[', '{')):
+            message = '文件上传成功（JSON格式无效，将作为普通文本处理）'
+        
+        return JsonResponse({
+            'message': message,
+            'file_id': upload.file_id,
+            'filename': upload.filename,
+            'size': upload.size,
+            'preview': preview,
+            'truncated': len(preview) >= settings.UPLOAD_PREVIEW_CHARS
+        })
             
     except Exception as e:
         logger.error(f"文件上传错误: {str(e)}")
@@ -386,16 +640,101 @@ def clear_chat_history(request):
         session_id = request.POST.get('session_id')
         if session_id:
             ChatMessage.objects.filter(session_id=session_id).delete()
+            ChatSession.objects.filter(session_id=session_id).delete()
         return JsonResponse({'message': '聊天历史已清除'})
     except Exception as e:
         logger.error(f"清除聊天历史错误: {str(e)}")
         return JsonResponse({'error': str(e)}, status=500)
 
+def _page_limit(request, default: int, maximum: int) -> int:
+    try:
+        return max(1, min(int(request.GET.get('limit', default)), maximum))
+    except ValueError:
+        return default
+
+
+@require_GET
+def list_chat_sessions(request):
+    """
+    按最后活动时间倒序列出会话（键集分页），只允许管理员（is_staff）调用
+    查询参数 cursor 为上一页返回的 next_cursor
+    """
+    if not request.user.is_staff:
+        return JsonResponse({'error': '查看会话列表需要管理员权限'}, status=403)
+    try:
+        limit = _page_limit(request, 20, 100)
+        sessions = ChatSession.objects.order_by('-last_activity', '-id')
+        cursor = request.GET.get('cursor')
+        if cursor:
+            micros, _, last_id = cursor.partition('_')
+            last_activity = datetime(1970, 1, 1, tzinfo=dt_timezone.utc) + timedelta(microseconds=int(micros))
+            sessions = sessions.filter(
+                Q(last_activity__lt=last_activity) | Q(last_activity=last_activity, id__lt=int(last_id))
+            )
+        
+        page = list(sessions.values('id', 'session_id', 'message_count', 'created_at', 'last_activity')[:limit + 1])
+        next_cursor = None
+        if len(page) > limit:
+            page = page[:limit]
+            last = page[-1]
+            delta = last['last_activity'] - datetime(1970, 1, 1, tzinfo=dt_timezone.utc)
+            next_cursor = f"{delta // timedelta(microseconds=1)}_{last['id']}"
+        
+        return JsonResponse({
+            'sessions': [{
+                'session_id': item['session_id'],
+                'message_count': item['message_count'],
+                'created_at': item['created_at'].isoformat(),
+                'last_activity': item['last_activity'].isoformat()
+            } for item in page],
+            'next_cursor': next_cursor
+        })
+    except ValueError:
+        return JsonResponse({'error': '无效的分页游标'}, status=400)
+    except Exception as e:
+        logger.error(f"获取会话列表失败: {str(e)}")
+        return JsonResponse({'error': str(e)}, status=500)
+
+
+@require_GET
+def list_chat_messages(request, session_id):
+    """
+    会话消息，从新到旧（键集分页），只允许管理员（is_staff）调用
+    查询参数 before 为上一页返回的 next_cursor；include_probes=1 时包含验证/测试消息
+    """
+    if not request.user.is_staff:
+        return JsonResponse({'error': '查看会话消息需要管理员权限'}, status=403)
+    try:
+        limit = _page_limit(request, 50, 200)
+        messages = ChatMessage.objects.filter(session_id=session_id)
+        if request.GET.get('include_probes') not in ('1', 'true'):
+            messages = messages.filter(is_probe=False)
+        before = request.GET.get('before')
+        if before:
+            messages = messages.filter(id__lt=int(before))
+        
+        page = list(messages.order_by('-id').values(
+            'id', 'role', 'content', 'status', 'is_probe', 'timestamp'
+        )[:limit + 1])
+        next_cursor = None
+        if len(page) > limit:
+            page = page[:limit]
+            next_cursor = page[-1]['id']
+        for item in page:
+            item['timestamp'] = item['timestamp'].isoformat()
+        
+        return JsonResponse({'messages': page, 'next_cursor': next_cursor})
+    except ValueError:
+        return JsonResponse({'error': '无效的分页游标'}, status=400)
+    except Exception as e:
+        logger.error(f"获取会话消息失败: {str(e)}")
+        return JsonResponse({'error': str(e)}, status=500)
+
 @require_http_methods(["GET"])
 def get_api_config(request):
     """获取API配置"""
     try:
-        config = APIConfig.objects.order_by('-updated_at').first()
+        config = config_cache.get_api_config()
         if not config:
             return JsonResponse({
                 'service_type': '',
@@ -416,21 +755,9 @@ def get_api_config(request):
 def get_dimensions(request):
     """获取所有维度"""
     try:
-        cleaning_dimensions = list(CleaningDimension.objects.all().order_by('order').values(
-            'id', 
-            'name', 
-            'description', 
-            'is_default', 
-            'order'
-        ))
-        
-        labeling_dimensions = list(LabelingDimension.objects.all().order_by('order').values(
-            'id', 
-            'name', 
-            'description', 
-            'is_default', 
-            'order'
-        ))
+        catalog = config_cache.get_dimension_catalog()
+        cleaning_dimensions = catalog['cleaning']
+        labeling_dimensions = catalog['labeling']
         
         return JsonResponse({
             'cleaning_dimensions': cleaning_dimensions,
@@ -499,48 +826,102 @@ def delete_dimension(request, dimension_type, dimension_id):  # 注意参数顺
         return JsonResponse({'error': f'删除维度失败: {str(e)}'}, status=500)
 
 
+@require_GET
+def export_processed_data(request, processing_key):
+    """
+    流式导出任务结果，直接从结果记录逐条读取，不生成临时文件
+    查询参数 format: ndjson / csv / json（默认）
+    """
+    try:
+        export_format = request.GET.get('format', 'json')
+        if export_format not in EXPORT_FORMATS:
+            return JsonResponse({'error': f'不支持的导出格式: {export_format}'}, status=400)
+        
+        job = ProcessingJob.objects.filter(key=processing_key).first()
+        if not job:
+            return JsonResponse({'error': '任务不存在'}, status=404)
+        
+        content_type, ext = EXPORT_FORMATS[export_format]
+        response = StreamingHttpResponse(iter_job_export(job, export_format),
+                                         content_type=f'{content_type}; charset=utf-8')
+        response['Content-Disposition'] = f'attachment; filename="processed_{job.key}.{ext}"'
+        return response
+
+    except Exception as e:
+        logger.error(f"导出数据失败: {str(e)}")
+        return JsonResponse({'error': str(e)}, status=500)
+
+
+@csrf_exempt
 @require_POST
-def export_processed_data(request):
-    """导出处理后的数据"""
+def create_dataset(request):
+    """
+    从上传文件或文本创建数据集；传入 dataset_id 时向已有数据集追加记录
+    内容相同的记录只保存一次
+    """
     try:
         data = json.loads(request.body)
+        content = data.get('content', '')
+        file_id = data.get('file_id')
+        upload = UploadedFile.objects.filter(file_id=file_id).first() if file_id else None
+        if file_id and not upload:
+            raise ValueError("上传文件不存在")
+        if upload:
+            content = read_upload(upload)
+        if not content:
+            raise ValueError("缺少必要参数")
         
-        # 构建导出数据
-        export_data = {
-            'timestamp': datetime.now().isoformat(),
-            'process_type': data.get('process_type'),
-            'dimensions': data.get('dimensions', []),
-            'original_data': data.get('original_data', ''),
-            'processed_result': data.get('processed_result', '')
-        }
-
-        # 创建临时文件
-        temp_dir = os.path.join(settings.BASE_DIR, 'temp')
-        os.makedirs(temp_dir, exist_ok=True)
+        dataset_id = data.get('dataset_id')
+        if dataset_id:
+            dataset = Dataset.objects.filter(pk=dataset_id).first()
+            if not dataset:
+                return JsonResponse({'error': '数据集不存在'}, status=404)
+            added = import_records(dataset, content)
+        else:
+            name = data.get('name') or (upload.filename if upload else f"dataset_{datetime.now():%Y%m%d_%H%M%S}")
+            dataset, added = create_dataset_records(name, content, upload)
         
-        temp_file = os.path.join(
-            temp_dir, 
-            f"export_{datetime.now().strftime('%Y%m%d_%H%M%S')}_{uuid.uuid4().hex[:8]}.json"
-        )
+        return JsonResponse({
+            'dataset_id': dataset.id,
+            'record_count': dataset.record_count,
+            'added': added
+        })
+    except ValueError as e:
+        return JsonResponse({'error': str(e)}, status=400)
+    except Exception as e:
+        logger.error(f"创建数据集失败: {str(e)}")
+        return JsonResponse({'error': str(e)}, status=500)
 
-        # 写入数据
-        with open(temp_file, 'w', encoding='utf-8') as f:
-            json.dump(export_data, f, ensure_ascii=False, indent=2)
 
-        # 读取文件并返回
-        with open(temp_file, 'rb') as f:
-            response = HttpResponse(f.read(), content_type='application/json')
-            response['Content-Disposition'] = f'attachment; filename="{os.path.basename(temp_file)}"'
+@require_GET
+def dataset_status(request, dataset_id):
+    """数据集记录数以及各处理类型/维度组合的完成情况"""
+    dataset = Dataset.objects.filter(pk=dataset_id).first()
+    if not dataset:
+        return JsonResponse({'error': '数据集不存在'}, status=404)
+    return JsonResponse(get_dataset_status(dataset))
 
-        # 清理临时文件
-        os.remove(temp_file)
 
+@require_GET
+def export_dataset_results(request, dataset_id):
+    """
+    流式导出数据集的记录结果（NDJSON）
+    查询参数 process_type 和 dimensions（以逗号分隔的维度 ID）
+    """
+    try:
+        dataset = Dataset.objects.filter(pk=dataset_id).first()
+        if not dataset:
+            return JsonResponse({'error': '数据集不存在'}, status=404)
+        process_type = request.GET.get('process_type')
+        dimensions = [d for d in request.GET.get('dimensions', '').split(',') if d]
+        if not process_type or not dimensions:
+            return JsonResponse({'error': '缺少 process_type 或 dimensions 参数'}, status=400)
+        
+        key = dimensions_key(dimensions)
+        response = StreamingHttpResponse(iter_dataset_ndjson(dataset, process_type, key),
+                                         content_type='application/x-ndjson; charset=utf-8')
+        response['Content-Disposition'] = f'attachment; filename="dataset_{dataset.id}_{process_type}.jsonl"'
         return response
-
     except Exception as e:
-        logger.error(f"导出数据失败: {str(e)}")
+        logger.error(f"导出数据集结果失败: {str(e)}")
         return JsonResponse({'error': str(e)}, status=500)
-
-
-
-
@@ -347,6 +347,9 @@ class FileProcessor {
         this.originalData = document.getElementById('originalData');
         this.processedData = document.getElementById('processedData');
         this.isProcessing = false;
+        this.fileId = null;  // 服务端保存的上传文件
+        this.uploadedPreview = null;
+        this.previewTruncated = false;  // 预览不是完整文件时文本框只读
         
         this.exportBtn = document.getElementById('exportBtn');
         
@@ -399,9 +402,15 @@ class FileProcessor {
             const data = await response.json();
             console.log('上传响应:', data);  // 添加日志
             
-            if (response.ok && data.content) {
-                this.originalData.value = data.content;
-                showSuccess('文件上传成功');
+            if (response.ok && data.file_id) {
+                // 文件保存在服务端，这里只显示预览
+                this.fileId = data.file_id;
+                this.originalData.value = data.preview + (data.truncated ? '\n...' : '');
+                this.uploadedPreview = this.originalData.value;
+                this.previewTruncated = Boolean(data.truncated);
+                this.originalData.readOnly = this.previewTruncated;
+                this.originalData.title = this.previewTruncated ? '文件较大，这里只显示预览，处理时使用完整文件' : '';
+                showSuccess(data.message || '文件上传成功');
             } else {
                 throw new Error(data.error || '文件上传失败');
             }
@@ -424,6 +433,9 @@ class FileProcessor {
             showError('请先上传文件');
             return;
         }
+        // 预览被截断时文本框只读，始终按 file_id 处理服务端保存的完整文件；
+        // 完整显示的文件被修改后提交修改后的内容
+        const useFile = this.fileId && (this.previewTruncated || content === this.uploadedPreview);
 
         try {
             this.isProcessing = true;
@@ -445,13 +457,16 @@ class FileProcessor {
                 throw new Error('请先配置API');
             }
 
-            console.log('处理请求参数:', {
-                content: content,
+            const payload = {
                 process_type: this.getProcessType(),
-                service_type: apiConfig.service_type,
-                api_key: apiConfig.api_key,
                 dimensions: selectedDimensions
-            });
+            };
+            if (useFile) {
+                payload.file_id = this.fileId;
+            } else {
+                payload.content = content;
+            }
+            console.log('处理请求参数:', payload);
 
             const response = await fetch('/process-file/', {
                 method: 'POST',
@@ -459,13 +474,7 @@ class FileProcessor {
                     'Content-Type': 'application/json',
                     'X-CSRFToken': getCookie('csrftoken')
                 },
-                body: JSON.stringify({
-                    content: content,
-                    process_type: this.getProcessType(),
-                    service_type: apiConfig.service_type,
-                    api_key: apiConfig.api_key,
-                    dimensions: selectedDimensions
-                })
+                body: JSON.stringify(payload)
             });
 
             const data = await response.json();
@@ -476,7 +485,7 @@ class FileProcessor {
             }
 
             if (data.processing_key) {
-                this.startPolling(data.processing_key);
+                this.watchProcessing(data.processing_key);
             } else {
                 throw new Error('未获取到处理标识');
             }
@@ -503,72 +512,109 @@ class FileProcessor {
         }
     }
 
-    getProcessType() {
-        const radioBtn = document.querySelector('input[name="processType"]:checked');
-        return radioBtn ? radioBtn.value : 'cleaning';
-    }
-
-    async handleFileUpload(e) {
-        const file = e.target.files[0];
-        if (!file) {
-            showError('请选择文件');
+    // 通过 SSE 接收处理进度，不支持或连接中断时退回轮询
+    watchProcessing(processingKey) {
+        this.processingKey = processingKey;
+        if (!window.EventSource) {
+            this.startPolling(processingKey);
             return;
         }
 
-        try {
-            showLoading('正在上传文件...');
-            const formData = new FormData();
-            formData.append('file', file);
-
-            const response = await fetch('/upload-file/', {
-                method: 'POST',
-                headers: {
-                    'X-CSRFToken': getCookie('csrftoken')
-                },
-                body: formData
-            });
+        const source = new EventSource(`/processing-events/${processingKey}/`);
+        const partialResults = new Map();
+        let finished = false;
 
-            const data = await response.json();
-            console.log('上传响应:', data);  // 添加日志
-            
-            if (response.ok && data.content) {
-                this.originalData.value = data.content;
-                showSuccess('文件上传成功');
-            } else {
-                throw new Error(data.error || '文件上传失败');
+        source.addEventListener('chunk', (e) => {
+            const chunk = JSON.parse(e.data);
+            if (chunk.status === 'completed') {
+                partialResults.set(chunk.index, chunk.result);
+                const ordered = [...partialResults.keys()].sort((a, b) => a - b).map(k => partialResults.get(k));
+                this.displayResult(ordered);
             }
-        } catch (e) {
-            console.error('文件上传错误:', e);
-            showError(e.message);
-        } finally {
+        });
+
+        source.addEventListener('progress', (e) => {
+            const data = JSON.parse(e.data);
+            showLoading(`正在处理... ${data.completed_chunks}/${data.total_chunks} (${Math.round(data.progress)}%)`);
+        });
+
+        source.addEventListener('finished', (e) => {
+            finished = true;
+            source.close();
             hideLoading();
+            try {
+                this.handleFinalStatus(JSON.parse(e.data));
+            } catch (err) {
+                console.error('处理错误:', err);
+                showError(err.message);
+            }
+        });
+
+        // 任务进入批处理等待或事件流达到时长上限，服务端结束推送，改为轮询
+        source.addEventListener('poll', (e) => {
+            finished = true;
+            source.close();
+            console.info('进度事件流结束，改为轮询:', JSON.parse(e.data).reason);
+            this.startPolling(processingKey);
+        });
+
+        source.onerror = () => {
+            if (finished) return;
+            source.close();
+            console.warn('进度事件流中断，改为轮询');
+            this.startPolling(processingKey);
+        };
+    }
+
+    // 处理结束状态，返回是否已结束
+    handleFinalStatus(data) {
+        if (data.status === 'completed') {
+            console.log('处理完成，结果:', data);
+            this.currentResult = data;  // 保存结果
+            this.displayResult(data.result);
+            showSuccess('处理完成！');
+            this.exportBtn.disabled = false;
+            return true;
+        } else if (data.status === 'failed') {
+            throw new Error(data.error || '处理失败');
         }
+        return false;
     }
 
+    // 轮询处理状态，通过 cursor 只获取新增的结果
     async startPolling(processingKey) {
         let attempts = 0;
         const maxAttempts = 180;
+        let cursor = 0;
+        const partialResults = new Map();
         
         while (attempts < maxAttempts) {
             try {
-                const response = await fetch(`/check-processing-status/${processingKey}/`);
+                const response = await fetch(`/check-processing-status/${processingKey}/?since=${cursor}`);
                 const data = await response.json();
                 
-                if (data.status === 'completed') {
-                    console.log('处理完成，结果:', data);
-                    this.currentResult = data;  // 保存结果
-                    this.displayResult(data.result);
-                    showSuccess('处理完成！');
-                    this.exportBtn.disabled = false;
+                if (data.results && data.results.length) {
+                    data.results.forEach(item => partialResults.set(item.index, item.result));
+                    cursor = data.cursor;
+                    if (data.status === 'processing') {
+                        const ordered = [...partialResults.keys()].sort((a, b) => a - b).map(k => partialResults.get(k));
+                        this.displayResult(ordered);
+                    }
+                }
+                if (data.status === 'processing' && data.total_chunks) {
+                    showLoading(`正在处理... ${data.completed_chunks}/${data.total_chunks} (${Math.round(data.progress)}%)`);
+                }
+                
+                if (this.handleFinalStatus(data)) {
+                    hideLoading();
                     break;
-                } else if (data.status === 'failed') {
-                    throw new Error(data.error || '处理失败');
                 }
                 
                 attempts++;
                 await new Promise(resolve => setTimeout(resolve, 10000));
             } catch (e) {
                 console.error('轮询错误:', e);
+                hideLoading();
                 showError(e.message);
                 break;
             }
@@ -624,44 +670,18 @@ class FileProcessor {
         }
     }
 
-    async exportProcessedData() {
-        if (!this.currentResult) {
+    // 由服务端流式导出任务结果，format 可选 json / ndjson / csv
+    exportProcessedData(format = 'json') {
+        if (!this.currentResult || !this.processingKey) {
             showError('没有可导出的结果');
             return;
         }
 
-        try {
-            const response = await fetch('/export-processed-data/', {
-                method: 'POST',
-                headers: {
-                    'Content-Type': 'application/json',
-                    'X-CSRFToken': getCookie('csrftoken')
-                },
-                body: JSON.stringify({
-                    process_type: this.currentResult.process_type,
-                    original_data: this.originalData.value,
-                    processed_result: this.currentResult.result,
-                    timestamp: this.currentResult.timestamp
-                })
-            });
-
-            if (response.ok) {
-                const blob = await response.blob();
-                const url = window.URL.createObjectURL(blob);
-                const a = document.createElement('a');
-                a.href = url;
-                a.download = `processed_data_${new Date().toISOString().slice(0,19).replace(/[:]/g, '')}.json`;
-                document.body.appendChild(a);
-                a.click();
-                window.URL.revokeObjectURL(url);
-                a.remove();
-            } else {
-                throw new Error('导出失败');
-            }
-        } catch (e) {
-            console.error('导出错误:', e);
-            showError('导出失败: ' + e.message);
-        }
+        const a = document.createElement('a');
+        a.href = `/export-processed-data/${this.processingKey}/?format=${format}`;
+        document.body.appendChild(a);
+        a.click();
+        a.remove();
     }
 }
 
@@ -825,7 +845,7 @@ class ChatManager {
             // 显示用户消息
             this.appendMessage('user', message);
     
-            // 发送到服务器
+            // 发送到服务器，回复以 NDJSON 流式返回
             const response = await fetch('/chat/', {
                 method: 'POST',
                 headers: {
@@ -834,32 +854,25 @@ class ChatManager {
                 },
                 body: JSON.stringify({
                     message: message,
-                    session_id: this.sessionId
+                    session_id: this.sessionId,
+                    stream: true
                 })
             });
     
-            const data = await response.json();
-    
             if (!response.ok) {
+                const data = await response.json();
                 throw new Error(data.error || '发送失败');
             }
     
-            if (data.reply) {
-                this.appendMessage('ai', data.reply);
-                if (data.tokens_used && data.max_tokens) {
-                    updateTokenCount(data.tokens_used, data.max_tokens);
-                }
-            }
+            await this.renderStream(response);
         } catch (error) {
             console.error('发送消息失败:', error);
             showError(error.message || '发送消息失败，请重试');
         }
     }
 
-    // 统一的消息添加方法
-    async appendMessage(role, content) {
-        if (!content || !this.chatMessages) return;
-
+    // 创建消息元素，返回内容容器
+    createMessageElement(role) {
         const messageDiv = document.createElement('div');
         messageDiv.className = `message ${role}-message`;
         
@@ -875,6 +888,14 @@ class ChatManager {
         messageDiv.appendChild(iconDiv);
         messageDiv.appendChild(contentDiv);
         this.chatMessages.appendChild(messageDiv);
+        return contentDiv;
+    }
+
+    // 统一的消息添加方法
+    async appendMessage(role, content) {
+        if (!content || !this.chatMessages) return;
+
+        const contentDiv = this.createMessageElement(role);
 
         if (role === 'user') {
             // 用户消息直接显示，不需要特殊渲染
@@ -887,6 +908,53 @@ class ChatManager {
         this.chatMessages.scrollTop = this.chatMessages.scrollHeight;
     }
 
+    // 边接收边渲染流式回复
+    async renderStream(response) {
+        const contentDiv = this.createMessageElement('ai');
+        const reader = response.body.getReader();
+        const decoder = new TextDecoder();
+        let buffer = '';
+        let text = '';
+        let renderPending = false;
+
+        const render = () => {
+            renderPending = false;
+            contentDiv.innerHTML = DOMPurify.sanitize(marked.parse(text));
+            this.chatMessages.scrollTop = this.chatMessages.scrollHeight;
+        };
+
+        while (true) {
+            const { done, value } = await reader.read();
+            if (done) break;
+
+            buffer += decoder.decode(value, { stream: true });
+            const lines = buffer.split('\n');
+            buffer = lines.pop();
+
+            for (const line of lines) {
+                if (!line.trim()) continue;
+                const data = JSON.parse(line);
+                if (data.error) {
+                    throw new Error(data.error);
+                }
+                if (data.delta) {
+                    text += data.delta;
+                    // 每帧最多渲染一次
+                    if (!renderPending) {
+                        renderPending = true;
+                        requestAnimationFrame(render);
+                    }
+                }
+                if (data.done && data.tokens_used && data.max_tokens) {
+                    updateTokenCount(data.tokens_used, data.max_tokens);
+                }
+            }
+        }
+
+        render();
+        this.finalizeMessage(contentDiv);
+    }
+
     async typeMessage(content, element) {
         if (this.isTyping) {
             await new Promise(resolve => {
@@ -913,7 +981,13 @@ class ChatManager {
         // 逐字显示内容
         await this.typeNode(tempDiv, element);
         
-        // 渲染数学公式
+        this.finalizeMessage(element);
+    
+        this.isTyping = false;
+    }
+
+    // 渲染数学公式并添加代码复制按钮
+    finalizeMessage(element) {
         renderMathInElement(element, {
             delimiters: [
                 {left: '$$', right: '$$', display: true},
@@ -922,7 +996,6 @@ class ChatManager {
             throwOnError: false
         });
         
-        // 添加代码复制按钮
         const codeBlocks = element.querySelectorAll('pre code');
         codeBlocks.forEach(block => {
             const copyButton = document.createElement('button');
@@ -939,8 +1012,6 @@ class ChatManager {
             };
             block.parentElement.appendChild(copyButton);
         });
-    
-        this.isTyping = false;
     }
 
     async typeNode(sourceNode, targetParent) {